@@ -0,0 +1,88 @@
+"""
+Recall@k and latency of the ANN index modes against the exact flat baseline.
+
+Usage (from backend/):
+    python -m benchmarks.ann_recall --sizes 10000 100000 1000000 --k 10
+
+Vectors are synthetic: gaussian clusters, which is closer to real embeddings than
+uniform noise and gives IVF/HNSW a fair shot. 1M x 768 float32 needs ~3 GB RAM,
+use --dim to shrink it on small machines.
+"""
+import argparse
+import json
+import time
+
+import faiss
+import numpy as np
+
+from services import ann_index
+
+
+def synthetic_vectors(n: int, dim: int, n_clusters: int = 256, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_clusters, dim)).astype("float32")
+    labels = rng.integers(0, n_clusters, size=n)
+    return centers[labels] + 0.3 * rng.normal(size=(n, dim)).astype("float32")
+
+
+def build(index_type: str, vectors: np.ndarray) -> faiss.Index:
+    index = ann_index.create_index(vectors.shape[1], index_type)
+    index.add_with_ids(vectors, np.arange(len(vectors), dtype="int64"))
+    return ann_index.maybe_train(index, index_type)
+
+
+def measure(index: faiss.Index, queries: np.ndarray, k: int):
+    latencies = []
+    found = []
+    for query in queries:
+        start = time.perf_counter()
+        _, ids = index.search(query[None, :], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found.append(ids[0])
+    return np.array(found), np.array(latencies)
+
+
+def run(sizes, dim: int, k: int, n_queries: int, index_types):
+    report = []
+    for n in sizes:
+        vectors = synthetic_vectors(n, dim)
+        queries = synthetic_vectors(n_queries, dim, seed=1)
+        truth = None
+        for index_type in ["flat"] + [t for t in index_types if t != "flat"]:
+            start = time.perf_counter()
+            index = build(index_type, vectors)
+            build_s = time.perf_counter() - start
+            found, latencies = measure(index, queries, k)
+            if index_type == "flat":
+                truth = found
+            recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)])
+            row = {
+                "n": n,
+                "index": index_type,
+                "recall_at_k": round(float(recall), 4),
+                "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+                "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+                "build_s": round(build_s, 2),
+            }
+            print(f"n={n:>8} {index_type:>5}  recall@{k}={row['recall_at_k']:.3f}  "
+                  f"p50={row['p50_ms']:.3f}ms  p99={row['p99_ms']:.3f}ms  build={row['build_s']:.1f}s")
+            report.append(row)
+            del index
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--index-types", nargs="+", default=["flat", "hnsw", "ivf"])
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(1) # single-query latency, like one request
+    results = run(args.sizes, args.dim, args.k, args.queries, args.index_types)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
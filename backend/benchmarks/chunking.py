@@ -0,0 +1,64 @@
+"""
+Characters embedded per page: the old fixed character windows vs the
+token-budgeted span chunker used by process_pdf.
+
+Usage (from backend/):
+    python -m benchmarks.chunking path/to/drawings.pdf [more.pdf ...]
+"""
+import argparse
+import json
+import time
+
+from services.chunker import chunk_spans
+from services.ingestion import iter_page_texts
+
+
+def legacy_windows(text: str, chunk_size: int = 800, overlap: int = 100):
+    """The chunker process_pdf used before: chunk_size * 4 chars, stepping (chunk_size - overlap) * 4."""
+    spans = []
+    start = 0
+    while start < len(text):
+        spans.append((start, min(start + chunk_size * 4, len(text))))
+        start += (chunk_size - overlap) * 4
+    return spans
+
+
+def compare(paths, chunk_size: int = 800, overlap: int = 0):
+    pages = 0
+    page_chars = legacy_chars = span_chars = 0
+    legacy_chunks = span_chunks = 0
+    chunk_seconds = 0.0
+    for path in paths:
+        for _, text in iter_page_texts(path):
+            pages += 1
+            page_chars += len(text)
+            legacy = legacy_windows(text)
+            legacy_chunks += len(legacy)
+            legacy_chars += sum(end - start for start, end in legacy)
+            start_time = time.perf_counter()
+            spans = chunk_spans(text, chunk_size, overlap)
+            chunk_seconds += time.perf_counter() - start_time
+            span_chunks += len(spans)
+            span_chars += sum(end - start for start, end in spans)
+
+    pages = max(pages, 1)
+    return {
+        "pages": pages,
+        "page_chars_per_page": round(page_chars / pages, 1),
+        "legacy_chars_embedded_per_page": round(legacy_chars / pages, 1),
+        "span_chars_embedded_per_page": round(span_chars / pages, 1),
+        "chars_saved_per_page": round((legacy_chars - span_chars) / pages, 1),
+        "chars_saved_pct": round(100 * (legacy_chars - span_chars) / max(legacy_chars, 1), 2),
+        "legacy_chunks": legacy_chunks,
+        "span_chunks": span_chunks,
+        "chunker_ms_per_page": round(1000 * chunk_seconds / pages, 3),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdfs", nargs="+")
+    parser.add_argument("--chunk-size", type=int, default=800, help="tokens per chunk")
+    parser.add_argument("--overlap", type=int, default=0, help="tokens shared by neighbouring chunks")
+    args = parser.parse_args()
+    print(json.dumps(compare(args.pdfs, args.chunk_size, args.overlap), indent=2))
@@ -0,0 +1,28 @@
+"""
+Offline providers, so benchmarks run without Gemini keys and are comparable
+between runs: embeddings come from the local HashingEmbedder (the same code path
+as EMBEDDING_PROVIDER=hashing in production), and the LLM streams a fixed answer
+with an optional per-token delay.
+"""
+import asyncio
+import os
+
+ANSWER_TOKENS = ["Not ", "stated ", "in ", "documents. ", "Sources: ", "[synthetic.pdf - page 1 - chunk 0]"]
+
+
+def install(llm_token_delay_ms: float = 0.0):
+    """Selects the local embedder and patches the LLM calls. Call before importing services."""
+    os.environ["EMBEDDING_PROVIDER"] = "hashing"
+    from services import llm_client
+
+    async def stream_generate(prompt: str):
+        for token in ANSWER_TOKENS:
+            if llm_token_delay_ms:
+                await asyncio.sleep(llm_token_delay_ms / 1000)
+            yield token
+
+    async def generate(prompt: str) -> str:
+        return "[]"
+
+    llm_client.stream_generate = stream_generate
+    llm_client.generate = generate
@@ -0,0 +1,260 @@
+"""
+End-to-end throughput and latency with offline embedding/LLM providers (see
+benchmarks/fakes.py), so it runs offline, without Gemini keys or Postgres.
+
+  parse    process_pdf pages/sec over the given PDFs
+  ingest   VectorStore.add_chunks chunks/sec while a synthetic corpus grows
+           through each of --sizes
+  search   hybrid_search latency percentiles at each size
+  query    /query time to first byte / first answer token through TestClient
+
+Usage (from backend/):
+    python -m benchmarks.pipeline --sizes 1000 10000 100000 --out results.json
+    python -m benchmarks.pipeline --sizes 1000000 --skip-query  # ~3 GB of vectors
+
+Everything is written under a scratch directory (--workdir, default a temp dir)
+that also holds the SQLite database used by /query. Progress and the services'
+own logging go to stderr; the JSON report goes to stdout or --out.
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_PDF = os.path.join(os.path.dirname(BACKEND_DIR), "test_door_schedule.pdf")
+
+VOCABULARY = (
+    "door frame leaf hinge closer lockset hardware fire rating corridor partition wall gypsum board stud "
+    "steel hollow metal timber glazing vision panel louver threshold seal acoustic stc smoke lobby stair "
+    "office storage plant room riser shaft ceiling slab concrete screed terrazzo tile carpet vinyl finish "
+    "insulation membrane facade curtain glass double glazed low-e spandrel mullion transom sill head jamb "
+    "schedule specification section clause drawing sheet revision issue note refer detail typical minimum"
+).split()
+
+
+def percentiles(values_ms):
+    if not values_ms:
+        return {}
+    return {
+        "p50": round(float(np.percentile(values_ms, 50)), 3),
+        "p95": round(float(np.percentile(values_ms, 95)), 3),
+        "p99": round(float(np.percentile(values_ms, 99)), 3),
+        "mean": round(float(np.mean(values_ms)), 3),
+    }
+
+
+def synthetic_chunks(start: int, count: int, words_per_chunk: int = 150, seed: int = 0):
+    rng = np.random.default_rng(seed + start)
+    vocabulary = np.array(VOCABULARY)
+    for i in range(start, start + count):
+        words = vocabulary[rng.integers(0, len(vocabulary), size=words_per_chunk)]
+        mark = f"D-{100 + i % 900}"
+        yield {
+            "doc_name": f"synthetic-{i // 1000:04d}.pdf",
+            "page_num": (i % 1000) // 10 + 1,
+            "chunk_id": i % 1000,
+            "text": f"{mark} " + " ".join(words),
+        }
+
+
+def bench_parse(pdfs, chunk_size: int):
+    from services.ingestion import count_pages, process_pdf
+
+    pages = chunks = 0
+    start = time.perf_counter()
+    for path in pdfs:
+        pages += count_pages(path)
+        chunks += sum(1 for _ in process_pdf(path, os.path.basename(path), chunk_size=chunk_size))
+    elapsed = time.perf_counter() - start
+    return {
+        "pdfs": len(pdfs),
+        "pages": pages,
+        "chunks": chunks,
+        "seconds": round(elapsed, 3),
+        "pages_per_sec": round(pages / elapsed, 2) if elapsed else None,
+    }
+
+
+def bench_ingest(store, start: int, count: int, batch_size: int, n_threads: int):
+    batch_seconds = []
+    batch = []
+    loaded = 0
+    for chunk in synthetic_chunks(start, count):
+        batch.append(chunk)
+        if len(batch) == batch_size:
+            loaded += _add_batch(store, batch, loaded + start, n_threads, batch_seconds)
+            batch = []
+    if batch:
+        _add_batch(store, batch, loaded + start, n_threads, batch_seconds)
+    total = sum(batch_seconds)
+    return {
+        "chunks": count,
+        "seconds": round(total, 3),
+        "chunks_per_sec": round(count / total, 1) if total else None,
+        "batch_ms": percentiles([s * 1000 for s in batch_seconds]),
+    }
+
+
+def _add_batch(store, batch, offset: int, n_threads: int, batch_seconds) -> int:
+    # Spread documents over n_threads threads plus the global partition
+    thread_id = (offset // 1000) % (n_threads + 1) or None
+    started = time.perf_counter()
+    store.add_chunks(batch, thread_id)
+    batch_seconds.append(time.perf_counter() - started)
+    return len(batch)
+
+
+def bench_search(n_queries: int, k: int, n_threads: int, seed: int = 1):
+    from services.retrieval_service import hybrid_search
+
+    rng = np.random.default_rng(seed)
+    latencies, stages = [], {}
+    for i in range(n_queries):
+        query = " ".join(rng.choice(VOCABULARY, size=6))
+        thread_id = int(rng.integers(1, n_threads + 1)) if n_threads and i % 2 else None
+        timings = {}
+        started = time.perf_counter()
+        hybrid_search(query, k=k, thread_id=thread_id, timings=timings)
+        latencies.append((time.perf_counter() - started) * 1000)
+        for stage, seconds in timings.items():
+            stages.setdefault(stage, []).append(seconds * 1000)
+    return {
+        "queries": n_queries,
+        "latency_ms": percentiles(latencies),
+        "stages_ms": {stage: percentiles(values) for stage, values in stages.items()},
+    }
+
+
+class BodyTimer:
+    """
+    ASGI wrapper that notes when the app sends each non-empty body message.
+    TestClient buffers the whole response, so the client side cannot see this.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.marks = []
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        marks = self.marks = []
+
+        async def timed_send(message):
+            if message["type"] == "http.response.body" and message.get("body"):
+                marks.append(time.perf_counter())
+            await send(message)
+
+        await self.app(scope, receive, timed_send)
+
+
+def bench_query(client, timer: BodyTimer, headers, n_queries: int, seed: int = 2):
+    """Time to the first byte (the __THREAD_ID__ event) and to the first answer token."""
+    rng = np.random.default_rng(seed)
+    ttfb, ttft, total = [], [], []
+    for i in range(n_queries):
+        # Unique questions, so the answer cache never short-circuits the pipeline
+        question = f"{i} " + " ".join(rng.choice(VOCABULARY, size=8)) + "?"
+        started = time.perf_counter()
+        response = client.post("/query", json={"question": question}, headers=headers)
+        ended = time.perf_counter()
+        response.raise_for_status()
+        marks = timer.marks or [ended]
+        ttfb.append((marks[0] - started) * 1000)
+        ttft.append((marks[1 if len(marks) > 1 else 0] - started) * 1000)
+        total.append((ended - started) * 1000)
+    return {
+        "queries": n_queries,
+        "ttfb_ms": percentiles(ttfb),
+        "ttft_ms": percentiles(ttft),
+        "total_ms": percentiles(total),
+    }
+
+
+def run(args):
+    os.makedirs(args.workdir, exist_ok=True)
+    os.chdir(args.workdir)
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(args.workdir, 'bench.db')}"
+    sys.path.insert(0, BACKEND_DIR)
+
+    from benchmarks import fakes
+    fakes.install(llm_token_delay_ms=args.llm_token_delay_ms)
+    from services.vector_store import vector_store
+
+    report = {
+        "config": {
+            "sizes": args.sizes,
+            "batch_size": args.batch_size,
+            "threads": args.threads,
+            "index_type": os.getenv("VECTOR_INDEX_TYPE", "flat"),
+            "llm_token_delay_ms": args.llm_token_delay_ms,
+        },
+        "parse": None,
+        "sizes": [],
+    }
+
+    pdfs = args.pdf or ([DEFAULT_PDF] if os.path.exists(DEFAULT_PDF) else [])
+    if pdfs:
+        report["parse"] = bench_parse(pdfs, args.chunk_size)
+
+    client = timer = headers = None
+    if not args.skip_query:
+        from fastapi.testclient import TestClient
+        import main
+        timer = BodyTimer(main.app)
+        client = TestClient(timer)
+        client.__enter__()
+        response = client.post("/auth/register", json={"email": "bench@example.com", "password": "bench"})
+        response.raise_for_status()
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    loaded = len(vector_store.metadata)
+    try:
+        for size in sorted(args.sizes):
+            if size > loaded:
+                ingest = bench_ingest(vector_store, loaded, size - loaded, args.batch_size, args.threads)
+                loaded = size
+            else:
+                ingest = None
+            row = {"chunks": loaded, "ingest": ingest, "search": bench_search(args.queries, args.k, args.threads)}
+            if client is not None:
+                row["query"] = bench_query(client, timer, headers, args.queries)
+            report["sizes"].append(row)
+            print(json.dumps(row), file=sys.stderr)
+    finally:
+        if client is not None:
+            client.__exit__(None, None, None)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000], help="corpus sizes (chunks) to measure at")
+    parser.add_argument("--pdf", nargs="*", help=f"PDFs for the parse benchmark (default: {os.path.basename(DEFAULT_PDF)})")
+    parser.add_argument("--chunk-size", type=int, default=800, help="tokens per chunk for process_pdf")
+    parser.add_argument("--batch-size", type=int, default=100, help="chunks per add_chunks call")
+    parser.add_argument("--threads", type=int, default=10, help="chat threads the corpus is spread over")
+    parser.add_argument("--queries", type=int, default=200, help="queries per size")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--llm-token-delay-ms", type=float, default=0.0, help="fake LLM delay per streamed token")
+    parser.add_argument("--skip-query", action="store_true", help="skip the /query benchmark (no FastAPI app)")
+    parser.add_argument("--workdir", default=None, help="scratch directory (default: a new temp dir)")
+    parser.add_argument("--out", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+    args.workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="bench-"))
+    args.pdf = [os.path.abspath(path) for path in args.pdf or []]
+    out = os.path.abspath(args.out) if args.out else None
+
+    with contextlib.redirect_stdout(sys.stderr):
+        report = json.dumps(run(args), indent=2)
+    if out:
+        with open(out, "w") as f:
+            f.write(report)
+    else:
+        print(report)
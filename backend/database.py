@@ -1,8 +1,10 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
 from dotenv import load_dotenv
+from services.metrics import DB_SESSION_SECONDS
 
 load_dotenv()
 
@@ -21,14 +23,71 @@ if "db" in DATABASE_URL and os.environ.get("OS") == "Windows_NT":
      # But wait, user might be running python locally.
      pass
 
+# Pool settings for the async engine the API uses. Each /query holds a connection
+# only for its two short commits, so a modest pool serves many concurrent streams.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 20))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+
+def async_database_url(url: str) -> str:
+    """Same database through an asyncio driver: asyncpg for Postgres, aiosqlite for SQLite."""
+    if url.startswith(("postgresql://", "postgres://", "postgresql+psycopg2://")):
+        return "postgresql+asyncpg://" + url.split("://", 1)[1]
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url.split("://", 1)[1]
+    return url
+
+
+def _pool_options(url: str) -> dict:
+    if url.startswith("sqlite"):
+        # SQLite serialises writers anyway; keep SQLAlchemy's default pool for it
+        return {"pool_pre_ping": DB_POOL_PRE_PING}
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+# Synchronous engine, for scripts (debug_db.py) and anything outside the event loop
 engine = create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+ASYNC_DATABASE_URL = async_database_url(DATABASE_URL)
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **_pool_options(ASYNC_DATABASE_URL))
+# Objects stay readable after commit; handlers return them once the session is gone
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 def get_db():
     db = SessionLocal()
     try:
-        yield db
+        with DB_SESSION_SECONDS.time():
+            yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        with DB_SESSION_SECONDS.time():
+            yield db
+
+def _create_schema(conn):
+    Base.metadata.create_all(conn)
+    # create_all skips tables that already exist, and with them any index added later
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+async def create_tables():
+    async with async_engine.begin() as conn:
+        await conn.run_sync(_create_schema)
+
+async def dispose_engine():
+    await async_engine.dispose()
@@ -1,30 +1,35 @@
-from fastapi import FastAPI, Depends, UploadFile, File, HTTPException, Form
+from fastapi import FastAPI, Depends, UploadFile, File, HTTPException, Form, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
+import asyncio
 import json
 import os
 from dotenv import load_dotenv
 import logging
 
-from database import engine, get_db, SessionLocal
+from database import AsyncSessionLocal, create_tables, dispose_engine, get_async_db
 import models_db
 from routers import auth
-from services.ingestion_service import ingest_files
-from services.chat_service import generate_answer_stream
+from services.ingestion_service import shutdown_parse_pool
+from services.ingest_jobs import ingest_jobs
+from services.chat_service import embed_question, generate_answer_stream, retrieve_context
+from services.answer_cache import answer_cache
+from services.user_cache import Principal
+from services import metrics
+from services.vector_store import vector_store
 from services.extraction_service import extract_door_schedule
-from services.evaluation_service import run_evals
-from models import IngestResponse, QueryRequest
+from services.evaluation_service import EVAL_CONCURRENCY, run_evals
+from services.pagination import InvalidCursor, keyset_page, next_cursor
+from models import IngestJobResponse, MessageItem, MessagePage, QueryRequest, ThreadPage, ThreadSummary
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 DEBUG = os.getenv("DEBUG", "false").lower() in ("1", "true", "yes")
 
-# Create Tables
-models_db.Base.metadata.create_all(bind=engine)
-
 app = FastAPI(title="Project Brain API", version="0.2.0")
 
 # CORS
@@ -56,114 +61,208 @@ app.add_middleware(
 # Routers
 app.include_router(auth.router, prefix="/auth", tags=["auth"])
 
-@app.post("/ingest", response_model=IngestResponse)
-async def ingest_endpoint(files: List[UploadFile] = File(...), thread_id: int = Form(None), db: Session = Depends(get_db), current_user: models_db.User = Depends(auth.get_current_user)):
+@app.on_event("startup")
+async def start_workers():
+    # Create Tables
+    await create_tables()
+    await ingest_jobs.start()
+
+@app.on_event("shutdown")
+async def shutdown_workers():
+    await ingest_jobs.stop()
+    shutdown_parse_pool()
+    await dispose_engine()
+
+async def get_owned_thread(db: AsyncSession, thread_id: int, user_id: int):
+    result = await db.execute(select(models_db.Thread).where(models_db.Thread.id == thread_id, models_db.Thread.user_id == user_id))
+    return result.scalars().first()
+
+@app.post("/ingest", response_model=IngestJobResponse, status_code=202)
+async def ingest_endpoint(files: List[UploadFile] = File(...), thread_id: int = Form(None), current_user: Principal = Depends(auth.get_current_user)):
     print(f"Received ingestion request for {len(files)} files, thread_id={thread_id}")
     try:
-        count, docs = await ingest_files(files, thread_id=thread_id)
-        print(f"Ingestion successful: {count} chunks, {docs}")
-        return IngestResponse(
-            message=f"Successfully processed {count} chunks from {len(docs)} files.",
-            chunks_count=count,
-            documents=docs
-        )
+        # Parsing and embedding happen in the background; poll /ingest/jobs/{job_id}
+        job = await ingest_jobs.submit(files, thread_id=thread_id, user_id=current_user.id)
+        print(f"Queued ingest job {job['id']}")
+        return IngestJobResponse(job_id=job["id"], status=job["status"], documents=job["documents"])
     except Exception as e:
         print(f"Ingestion failed: {e}")
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/ingest/jobs")
+def list_ingest_jobs(current_user: Principal = Depends(auth.get_current_user)):
+    return ingest_jobs.list_jobs(current_user.id)
+
+@app.get("/ingest/jobs/{job_id}")
+def get_ingest_job(job_id: str, current_user: Principal = Depends(auth.get_current_user)):
+    job = ingest_jobs.get(job_id, current_user.id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
 @app.post("/query")
-async def query_endpoint(request: QueryRequest, db: Session = Depends(get_db), current_user: models_db.User = Depends(auth.get_current_user)):
-    # ... (keep existing code)
-    # 1. Handle Thread
-    thread_id = request.thread_id
-    if not thread_id:
-        new_thread = models_db.Thread(user_id=current_user.id, title=request.question[:30] + "...")
-        db.add(new_thread)
-        db.commit()
-        db.refresh(new_thread)
-        thread_id = new_thread.id
-    else:
-        # Verify thread belongs to user
-        thread = db.query(models_db.Thread).filter(models_db.Thread.id == thread_id, models_db.Thread.user_id == current_user.id).first()
-        if not thread:
-            raise HTTPException(status_code=404, detail="Thread not found")
+async def query_endpoint(request: QueryRequest, db: AsyncSession = Depends(get_async_db), current_user: Principal = Depends(auth.get_current_user)):
+    # In flight while this runs, then while the answer streams (stream_generator counts
+    # that itself: a client gone before the body starts never runs the generator)
+    metrics.QUERY_IN_FLIGHT.inc()
+    try:
+        return await answer_query(request, db, current_user)
+    finally:
+        metrics.QUERY_IN_FLIGHT.dec()
+
+async def answer_query(request: QueryRequest, db: AsyncSession, current_user: Principal) -> StreamingResponse:
+    # 0. Start retrieval right away so it overlaps with the DB bookkeeping below.
+    # A new thread has no documents of its own yet, but the query embedding (the
+    # slow part) does not depend on the thread id. Exact repeats are answered from
+    # the answer cache, so nothing is started for them.
+    question = request.question
+    retrieval = query_embedding = None
+    if not request.thread_id or not answer_cache.contains(request.thread_id, question):
+        query_embedding = asyncio.create_task(embed_question(question))
+        if request.thread_id:
+            retrieval = asyncio.create_task(retrieve_context(question, thread_id=request.thread_id, query_embedding=query_embedding))
 
-    # 2. Save User Message
-    user_msg = models_db.Message(thread_id=thread_id, role="user", content=request.question)
-    db.add(user_msg)
-    db.commit()
+    # 1. Handle Thread + 2. Save User Message, in one commit
+    async def save_user_message():
+        thread_id = request.thread_id
+        if not thread_id:
+            new_thread = models_db.Thread(user_id=current_user.id, title=question[:30] + "...")
+            db.add(new_thread)
+            await db.flush()
+            thread_id = new_thread.id
+        else:
+            # Verify thread belongs to user
+            if not await get_owned_thread(db, thread_id, current_user.id):
+                return None
+        db.add(models_db.Message(thread_id=thread_id, role="user", content=question))
+        await db.commit()
+        return thread_id
+
+    try:
+        thread_id = await save_user_message()
+    except Exception:
+        for task in (retrieval, query_embedding):
+            if task:
+                task.cancel()
+        raise
+    if thread_id is None:
+        for task in (retrieval, query_embedding):
+            if task:
+                task.cancel()
+        raise HTTPException(status_code=404, detail="Thread not found")
 
     # 3. Stream Response
     async def stream_generator():
-        full_answer = ""
-        sources_data = []
-        is_sources = False
+        metrics.QUERY_IN_FLIGHT.inc()
+        try:
+            full_answer = ""
+            sources_data = []
+            is_sources = False
         
-        # Send thread_id as first event
-        yield f"__THREAD_ID__:{thread_id}\n\n"
+            # Send thread_id as first event
+            yield f"__THREAD_ID__:{thread_id}\n\n"
         
-        async for chunk in generate_answer_stream(request.question, request.history, thread_id=thread_id):
-            if chunk == "\n\n__SOURCES__\n":
-                yield chunk
-                is_sources = True
-                continue
+            async for chunk in generate_answer_stream(question, request.history, thread_id=thread_id, retrieval=retrieval, query_embedding=query_embedding):
+                if chunk == "\n\n__SOURCES__\n":
+                    yield chunk
+                    is_sources = True
+                    continue
             
-            if is_sources:
-                try:
-                    sources_data = json.loads(chunk)
-                except:
-                    pass
-                yield chunk
-            else:
-                full_answer += chunk
-                yield chunk
+                if is_sources:
+                    try:
+                        sources_data = json.loads(chunk)
+                    except:
+                        pass
+                    yield chunk
+                else:
+                    full_answer += chunk
+                    yield chunk
         
-        # Save Assistant Message
-        # Use new session as the outer one might be closed
-        with SessionLocal() as db_inner:
-            assistant_msg = models_db.Message(
-                thread_id=thread_id, 
-                role="assistant", 
-                content=full_answer,
-                sources=sources_data
-            )
-            db_inner.add(assistant_msg)
-            db_inner.commit()
+            # Save Assistant Message
+            # Use new session as the outer one might be closed
+            async with AsyncSessionLocal() as db_inner:
+                assistant_msg = models_db.Message(
+                    thread_id=thread_id, 
+                    role="assistant", 
+                    content=full_answer,
+                    sources=sources_data
+                )
+                db_inner.add(assistant_msg)
+                await db_inner.commit()
+        finally:
+            metrics.QUERY_IN_FLIGHT.dec()
 
     return StreamingResponse(stream_generator(), media_type="text/event-stream")
 
-@app.get("/threads")
-def get_threads(skip: int = 0, limit: int = 20, db: Session = Depends(get_db), current_user: models_db.User = Depends(auth.get_current_user)):
-    threads = db.query(models_db.Thread).filter(models_db.Thread.user_id == current_user.id).order_by(models_db.Thread.created_at.desc()).offset(skip).limit(limit).all()
-    return threads
+@app.get("/threads", response_model=ThreadPage)
+async def get_threads(cursor: str = None, limit: int = Query(20, ge=1, le=100), db: AsyncSession = Depends(get_async_db), current_user: Principal = Depends(auth.get_current_user)):
+    # Newest first; next_cursor continues with older threads
+    Thread = models_db.Thread
+    query = select(Thread.id, Thread.user_id, Thread.title, Thread.created_at).where(Thread.user_id == current_user.id)
+    try:
+        rows = (await db.execute(keyset_page(query, Thread.created_at, Thread.id, cursor, limit))).all()
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    cursor = next_cursor(rows, limit)
+    return ThreadPage(threads=[ThreadSummary(**row._mapping) for row in rows], next_cursor=cursor)
 
-@app.get("/threads/{thread_id}/messages")
-def get_messages(thread_id: int, db: Session = Depends(get_db), current_user: models_db.User = Depends(auth.get_current_user)):
-    thread = db.query(models_db.Thread).filter(models_db.Thread.id == thread_id, models_db.Thread.user_id == current_user.id).first()
-    if not thread:
+@app.get("/threads/{thread_id}/messages", response_model=MessagePage)
+async def get_messages(thread_id: int, cursor: str = None, limit: int = Query(50, ge=1, le=200), include_sources: bool = True, db: AsyncSession = Depends(get_async_db), current_user: Principal = Depends(auth.get_current_user)):
+    if not await get_owned_thread(db, thread_id, current_user.id):
         raise HTTPException(status_code=404, detail="Thread not found")
     
-    return thread.messages
+    # The latest `limit` messages, oldest first; next_cursor pages further back.
+    # sources holds every cited chunk's text, so list views can skip fetching it.
+    Message = models_db.Message
+    columns = [Message.id, Message.thread_id, Message.role, Message.content, Message.created_at]
+    if include_sources:
+        columns.append(Message.sources)
+    query = select(*columns).where(Message.thread_id == thread_id)
+    try:
+        rows = (await db.execute(keyset_page(query, Message.created_at, Message.id, cursor, limit))).all()
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    cursor = next_cursor(rows, limit)
+    return MessagePage(messages=[MessageItem(**row._mapping) for row in reversed(rows)], next_cursor=cursor)
 
 @app.delete("/threads/{thread_id}")
-def delete_thread(thread_id: int, db: Session = Depends(get_db), current_user: models_db.User = Depends(auth.get_current_user)):
-    thread = db.query(models_db.Thread).filter(models_db.Thread.id == thread_id, models_db.Thread.user_id == current_user.id).first()
+async def delete_thread(thread_id: int, db: AsyncSession = Depends(get_async_db), current_user: Principal = Depends(auth.get_current_user)):
+    thread = await get_owned_thread(db, thread_id, current_user.id)
     if not thread:
         raise HTTPException(status_code=404, detail="Thread not found")
     
     # Delete associated messages first (cascade should handle this if configured, but explicit is safe)
-    db.query(models_db.Message).filter(models_db.Message.thread_id == thread_id).delete()
-    db.delete(thread)
-    db.commit()
+    await db.execute(delete(models_db.Message).where(models_db.Message.thread_id == thread_id))
+    await db.delete(thread)
+    await db.commit()
+    # Stop ingesting into it; the vector store refuses adds to deleted threads as well
+    await ingest_jobs.fail_thread(thread_id)
+    # Its chunks leave search immediately; the index is compacted in the background
+    await asyncio.to_thread(vector_store.delete_thread, thread_id)
+    answer_cache.invalidate(thread_id)
     return {"status": "success", "message": "Thread deleted"}
 
+@app.delete("/threads/{thread_id}/documents/{doc_name}")
+async def delete_document(thread_id: int, doc_name: str, db: AsyncSession = Depends(get_async_db), current_user: Principal = Depends(auth.get_current_user)):
+    if not await get_owned_thread(db, thread_id, current_user.id):
+        raise HTTPException(status_code=404, detail="Thread not found")
+    deleted = await asyncio.to_thread(vector_store.delete_document, doc_name, thread_id)
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Document not found")
+    answer_cache.invalidate(thread_id)
+    return {"status": "success", "chunks_deleted": deleted}
+
 @app.post("/extract/door-schedule")
-async def extract_door_schedule_endpoint(current_user: models_db.User = Depends(auth.get_current_user)):
-    print("Received extraction request")
+async def extract_door_schedule_endpoint(thread_id: int = None, db: AsyncSession = Depends(get_async_db), current_user: Principal = Depends(auth.get_current_user)):
+    print(f"Received extraction request, thread_id={thread_id}")
+    if thread_id:
+        if not await get_owned_thread(db, thread_id, current_user.id):
+            raise HTTPException(status_code=404, detail="Thread not found")
     try:
-        data = await extract_door_schedule()
+        # Without a thread only the shared (global) documents are scanned
+        data = await extract_door_schedule(thread_id=thread_id)
         print(f"Extraction result: {len(data)} items")
         return {"data": data}
     except Exception as e:
@@ -173,10 +272,15 @@ async def extract_door_schedule_endpoint(current_user: models_db.User = Depends(
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/eval/run-tests")
-async def run_tests_endpoint(current_user: models_db.User = Depends(auth.get_current_user)):
-    report = await run_evals()
+async def run_tests_endpoint(concurrency: int = EVAL_CONCURRENCY, current_user: Principal = Depends(auth.get_current_user)):
+    report = await run_evals(concurrency=concurrency)
     return report
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    # Prometheus text exposition format
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.get("/health")
 async def health_check():
     return {"status": "ok", "service": "Project Brain Backend"}
@@ -1,5 +1,6 @@
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
+from datetime import datetime
 
 class ChunkMetadata(BaseModel):
     doc_name: str
@@ -12,6 +13,11 @@ class IngestResponse(BaseModel):
     chunks_count: int
     documents: List[str]
 
+class IngestJobResponse(BaseModel):
+    job_id: str
+    status: str
+    documents: List[str]
+
 class QueryRequest(BaseModel):
     question: str
     history: List[Dict[str, str]] = []
@@ -20,3 +26,25 @@ class QueryRequest(BaseModel):
 class QueryResponse(BaseModel):
     answer: str
     sources: List[Dict[str, Any]]
+
+class ThreadSummary(BaseModel):
+    id: int
+    user_id: int
+    title: str
+    created_at: datetime
+
+class ThreadPage(BaseModel):
+    threads: List[ThreadSummary]
+    next_cursor: Optional[str] = None  # pass back as ?cursor= for older threads
+
+class MessageItem(BaseModel):
+    id: int
+    thread_id: int
+    role: str
+    content: str
+    created_at: datetime
+    sources: Optional[List[Dict[str, Any]]] = None  # null when include_sources=false
+
+class MessagePage(BaseModel):
+    messages: List[MessageItem]  # oldest first
+    next_cursor: Optional[str] = None  # pass back as ?cursor= for earlier messages
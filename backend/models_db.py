@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text, JSON
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text, JSON, Index
 from sqlalchemy.orm import relationship
 from database import Base
 from datetime import datetime
@@ -23,6 +23,10 @@ class Thread(Base):
     owner = relationship("User", back_populates="threads")
     messages = relationship("Message", back_populates="thread")
 
+    # Keyset pagination of a user's threads (GET /threads). On SQLite, ids of deleted
+    # threads must not come back: the vector store refuses adds to them for good.
+    __table_args__ = (Index("ix_threads_user_created_id", "user_id", "created_at", "id"), {"sqlite_autoincrement": True})
+
 class Message(Base):
     __tablename__ = "messages"
 
@@ -34,3 +38,6 @@ class Message(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     
     thread = relationship("Thread", back_populates="messages")
+
+    # Keyset pagination of a thread's history; also serves deletes by thread_id
+    __table_args__ = (Index("ix_messages_thread_created_id", "thread_id", "created_at", "id"),)
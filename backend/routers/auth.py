@@ -1,11 +1,15 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from database import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import AsyncSessionLocal, get_async_db
 from models_db import User
+from services import metrics
+from services.user_cache import Principal, user_cache
 from pydantic import BaseModel
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
+import asyncio
 import os
 import logging
 
@@ -51,31 +55,37 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+async def get_user_by_email(db: AsyncSession, email: str):
+    result = await db.execute(select(User).where(User.email == email))
+    return result.scalars().first()
+
 @router.post("/register", response_model=Token)
-def register(user: UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.email == user.email).first()
+async def register(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    db_user = await get_user_by_email(db, user.email)
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
-    hashed_pwd = get_password_hash(user.password)
+    # bcrypt is deliberately slow; keep it off the event loop
+    hashed_pwd = await asyncio.to_thread(get_password_hash, user.password)
     new_user = User(email=user.email, hashed_password=hashed_pwd)
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    # Tokens for an earlier account with this email must not resolve to it
+    user_cache.invalidate_user(new_user.email)
     
     access_token = create_access_token(data={"sub": new_user.email})
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.post("/login", response_model=Token)
-def login(user: UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.email == user.email).first()
+async def login(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    db_user = await get_user_by_email(db, user.email)
     if not db_user:
         if DEBUG:
             logger.debug("Login attempt for non-existent user: %s", user.email)
         raise HTTPException(status_code=401, detail="Incorrect email or password")
 
     try:
-        verified = verify_password(user.password, db_user.hashed_password)
+        verified = await asyncio.to_thread(verify_password, user.password, db_user.hashed_password)
     except Exception:
         # If verification raises (e.g. backend mismatch), treat as auth failure
         raise HTTPException(status_code=401, detail="Incorrect email or password")
@@ -92,7 +102,13 @@ def login(user: UserCreate, db: Session = Depends(get_db)):
 from fastapi.security import OAuth2PasswordBearer
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> Principal:
+    # Cached principals expire no later than their token, so a hit skips decoding too
+    principal = user_cache.get(token)
+    metrics.AUTH_CACHE.inc(result="miss" if principal is None else "hit")
+    if principal is not None:
+        return principal
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -106,7 +122,12 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     except JWTError:
         raise credentials_exception
     
-    user = db.query(User).filter(User.email == email).first()
+    generation = user_cache.generation(email)
+    # Only a miss opens a session
+    async with AsyncSessionLocal() as db:
+        user = await get_user_by_email(db, email)
     if user is None:
         raise credentials_exception
-    return user
+    principal = Principal(id=user.id, email=user.email)
+    user_cache.put(token, principal, payload.get("exp"), generation)
+    return principal
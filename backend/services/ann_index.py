@@ -0,0 +1,90 @@
+import os
+import faiss
+import numpy as np
+
+# Index type for every partition: "flat" (exact), "hnsw" or "ivf" (IVF-Flat)
+INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "flat").lower()
+HNSW_M = int(os.getenv("HNSW_M", 32))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", 80))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", 64))
+IVF_NLIST = int(os.getenv("IVF_NLIST", 256))
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", 16))
+# FAISS wants ~39 training points per centroid; below that IVF partitions stay flat
+IVF_MIN_TRAIN = int(os.getenv("IVF_MIN_TRAIN", IVF_NLIST * 39))
+
+
+def create_index(dimension: int, index_type: str = None) -> faiss.Index:
+    """
+    Empty partition index. Vectors are added with add_with_ids, so every type is
+    wrapped in an IndexIDMap. IVF starts out flat and is trained by maybe_train().
+    """
+    index_type = index_type or INDEX_TYPE
+    if index_type == "hnsw":
+        inner = faiss.IndexHNSWFlat(dimension, HNSW_M)
+        inner.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    elif index_type in ("flat", "ivf"):
+        inner = faiss.IndexFlatL2(dimension)
+    else:
+        raise ValueError(f"Unknown VECTOR_INDEX_TYPE: {index_type}")
+    return configure(faiss.IndexIDMap(inner))
+
+
+def configure(index: faiss.Index) -> faiss.Index:
+    """Applies the search-time knobs, which are not all persisted by write_index."""
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else faiss.downcast_index(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = HNSW_EF_SEARCH
+    elif isinstance(inner, faiss.IndexIVF):
+        inner.nprobe = IVF_NPROBE
+    return index
+
+
+def maybe_train(index: faiss.Index, index_type: str = None) -> faiss.Index:
+    """
+    Converts a flat IVF-mode partition into a trained IVF-Flat index once it holds
+    IVF_MIN_TRAIN vectors. Returns the index to keep using (possibly the same one).
+    """
+    index_type = index_type or INDEX_TYPE
+    if index_type != "ivf" or index.ntotal < IVF_MIN_TRAIN:
+        return index
+    inner = faiss.downcast_index(index.index)
+    if not isinstance(inner, faiss.IndexFlat):
+        return index
+
+    vectors = inner.reconstruct_n(0, inner.ntotal)
+    ids = faiss.vector_to_array(index.id_map).astype("int64")
+    nlist = min(IVF_NLIST, max(1, len(vectors) // 39))
+    quantizer = faiss.IndexFlatL2(inner.d)
+    ivf = faiss.IndexIVFFlat(quantizer, inner.d, nlist, faiss.METRIC_L2)
+    ivf.train(np.ascontiguousarray(vectors))
+    trained = faiss.IndexIDMap(ivf)
+    trained.add_with_ids(vectors, ids)
+    print(f"Trained IVF partition with nlist={nlist} on {len(vectors)} vectors")
+    return configure(trained)
+
+
+def extract(index: faiss.Index, start: int = 0):
+    """(vectors, ids) stored in a partition from position `start` on, in insertion order."""
+    ids = faiss.vector_to_array(index.id_map)[start:].astype("int64")
+    inner = faiss.downcast_index(index.index)
+    if len(ids) == 0:
+        return np.zeros((0, inner.d), dtype="float32"), ids
+    return inner.reconstruct_n(start, len(ids)), ids
+
+
+def rebuild(dimension: int, vectors: np.ndarray, ids: np.ndarray) -> faiss.Index:
+    """Fresh partition holding only `vectors` (IVF is retrained on them if large enough)."""
+    index = create_index(dimension)
+    if len(ids):
+        index.add_with_ids(np.ascontiguousarray(vectors), ids)
+    return maybe_train(index)
+
+
+def is_current(index: faiss.Index) -> bool:
+    """True when rebuild() would produce the same kind of index from this one's vectors."""
+    inner = faiss.downcast_index(index.index)
+    if INDEX_TYPE == "hnsw":
+        return isinstance(inner, faiss.IndexHNSW)
+    if INDEX_TYPE == "ivf":
+        return isinstance(inner, faiss.IndexIVF) or index.ntotal < IVF_MIN_TRAIN
+    return isinstance(inner, faiss.IndexFlat)
@@ -0,0 +1,129 @@
+import os
+import re
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", 1000))
+# Cosine similarity above which a differently worded question reuses an answer.
+# 1.0 (the default) keeps only exact (normalised) repeats.
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", 1.0))
+
+# Words, keeping codes joined by - . / whole (D-101, A2.1, 1/2)
+CODE_RE = re.compile(r"\w+(?:[-./]\w+)*")
+
+
+def normalize_question(question: str) -> str:
+    """Case, punctuation and whitespace do not change what is being asked."""
+    return " ".join(re.findall(r"\w+", question.lower()))
+
+
+def question_identifiers(question: str) -> frozenset:
+    """
+    Codes and numbers in a question. "Fire rating of D-101?" and "... of D-102?"
+    embed almost identically but ask about different things.
+    """
+    return frozenset(code for code in CODE_RE.findall(question.lower()) if any(c.isdigit() for c in code))
+
+
+class AnswerCache:
+    """
+    Finished answers (text + sources JSON) keyed by the corpus version of the
+    thread they were retrieved from and the normalised question. A thread's
+    search also sees global documents, so its version pairs the thread's own
+    counter with the global one; unscoped searches see every thread and use a
+    counter bumped by any change. Any ingest or delete bumps the counters, which
+    orphans every answer computed against the old corpus.
+    """
+
+    def __init__(self, max_items: int = ANSWER_CACHE_SIZE, similarity: float = ANSWER_CACHE_SIMILARITY):
+        self.max_items = max_items
+        self.similarity = similarity
+        self.entries: "OrderedDict[Tuple[Any, str], Dict[str, Any]]" = OrderedDict()
+        self.versions: Dict[Optional[int], int] = defaultdict(int)
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def version(self, thread_id: Optional[int]) -> Tuple[int, ...]:
+        with self.lock:
+            if thread_id is None:
+                return (self.generation,)
+            return (self.versions[thread_id], self.versions[None])
+
+    def _scope(self, thread_id: Optional[int], version: Optional[Tuple[int, ...]] = None):
+        return (thread_id, version if version is not None else self.version(thread_id))
+
+    def contains(self, thread_id: Optional[int], question: str) -> bool:
+        key = (self._scope(thread_id), normalize_question(question))
+        with self.lock:
+            return key in self.entries
+
+    def get(self, thread_id: Optional[int], question: str) -> Optional[Dict[str, Any]]:
+        key = (self._scope(thread_id), normalize_question(question))
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+            return entry
+
+    def get_similar(self, thread_id: Optional[int], question: str, embedding: Optional[List[float]]) -> Optional[Dict[str, Any]]:
+        """
+        Closest cached answer for this corpus version if it is a near-duplicate
+        question naming the same identifiers.
+        """
+        scope = self._scope(thread_id)
+        identifiers = question_identifiers(question)
+        with self.lock:
+            candidates = [
+                (key, entry) for key, entry in self.entries.items()
+                if key[0] == scope and entry["embedding"] is not None and entry["identifiers"] == identifiers
+            ]
+            if candidates and embedding is not None and self.similarity < 1.0:
+                query = np.asarray(embedding, dtype="float32")
+                query /= np.linalg.norm(query) or 1.0
+                scores = np.stack([entry["embedding"] for _, entry in candidates]) @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.similarity:
+                    key, entry = candidates[best]
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return entry
+            self.misses += 1
+            return None
+
+    def put(self, thread_id: Optional[int], version: Tuple[int, ...], question: str, answer: str, sources_json: str, embedding: Optional[List[float]] = None):
+        """Stores an answer under the version it was retrieved at; a stale one is never reachable."""
+        if embedding is not None:
+            embedding = np.asarray(embedding, dtype="float32")
+            embedding = embedding / (np.linalg.norm(embedding) or 1.0)
+        if version != self.version(thread_id):
+            return # the corpus changed while this answer was generated
+        key = (self._scope(thread_id, version), normalize_question(question))
+        with self.lock:
+            self.entries[key] = {"answer": answer, "sources": sources_json, "embedding": embedding,
+                                 "identifiers": question_identifiers(question)}
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_items:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, thread_id: Optional[int]):
+        """Call after the documents visible to `thread_id` change."""
+        with self.lock:
+            self.versions[thread_id] += 1
+            self.generation += 1
+            # Drop what just went stale: that thread's answers and every unscoped one
+            # (a global change reaches every thread)
+            stale = [key for key in self.entries if key[0][0] is None or thread_id is None or key[0][0] == thread_id]
+            for key in stale:
+                del self.entries[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries)}
+
+
+answer_cache = AnswerCache()
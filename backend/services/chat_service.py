@@ -1,11 +1,12 @@
-import os
-import google.generativeai as genai
-from typing import List, Dict, Any
+import asyncio
+import json
+import time
+from typing import List, Dict, Any, Optional, Awaitable
 from services.retrieval_service import hybrid_search
-
-# Configure Gemini
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-model = genai.GenerativeModel(os.getenv("GEMINI_MODEL_NAME", "gemini-1.5-flash"))
+from services.answer_cache import answer_cache
+from services.context_builder import build_context
+from services.vector_store import vector_store
+from services import llm_client, metrics
 
 SYSTEM_PROMPT = """You are an assistant that answers questions about construction project documents. Always cite your sources in the form: [FILENAME - page X - chunk Y]. For each answer return:
 1) A concise answer (1-4 sentences).
@@ -25,51 +26,86 @@ Deliverable format:
 - If you are not sure, be explicit: "Could not find explicit spec in provided docs."
 """
 
-async def generate_answer_stream(question: str, history: List[Dict[str, str]] = [], thread_id: int = None):
-    # 1. Retrieve Context
-    retrieved_chunks = hybrid_search(question, thread_id=thread_id)
+async def embed_question(question: str) -> Optional[List[float]]:
+    try:
+        return await asyncio.to_thread(vector_store.embed_query, question)
+    except Exception as e:
+        print(f"Query embedding failed: {e}")
+        return None
+
+async def retrieve_context(question: str, thread_id: int = None, query_embedding: Optional[Awaitable[Optional[List[float]]]] = None, timings: Optional[Dict[str, float]] = None) -> List[Dict[str, Any]]:
+    embedding = await query_embedding if query_embedding is not None else None
+    # FAISS + BM25 (and the embedding call, if none was passed) are blocking; keep them off the event loop
+    return await asyncio.to_thread(hybrid_search, question, thread_id=thread_id, query_embedding=embedding, timings=timings)
+
+async def generate_answer_stream(question: str, history: List[Dict[str, str]] = [], thread_id: int = None, retrieval: Optional[Awaitable[List[Dict[str, Any]]]] = None, query_embedding: Optional[Awaitable[Optional[List[float]]]] = None, timings: Optional[Dict[str, float]] = None, use_cache: bool = True):
+    """
+    Streams the answer, then "\n\n__SOURCES__\n" and the sources JSON.
+    `timings`, if given, is filled with seconds spent per stage (embedding,
+    retrieval, ttft, generation); stages that did not run are left out.
+    """
+    timings = timings if timings is not None else {}
+    started = time.perf_counter()
+
+    # 0. Answer repeated (or near-duplicate) questions from the cache. The version is
+    # read first, so an answer racing an ingest is never stored as current.
+    version = answer_cache.version(thread_id)
+    cached = answer_cache.get(thread_id, question) if use_cache else None
+    embedding = None
+    if cached is None:
+        if query_embedding is None:
+            query_embedding = asyncio.ensure_future(embed_question(question))
+        stage = time.perf_counter()
+        embedding = await query_embedding
+        timings["embedding"] = time.perf_counter() - stage
+        cached = answer_cache.get_similar(thread_id, question, embedding) if use_cache else None
+    if use_cache:
+        metrics.ANSWER_CACHE.inc(result="miss" if cached is None else "hit")
+    if cached is not None:
+        if isinstance(retrieval, asyncio.Future):
+            retrieval.cancel()
+        timings["ttft"] = time.perf_counter() - started
+        yield cached["answer"]
+        yield "\n\n__SOURCES__\n"
+        yield cached["sources"]
+        return
+
+    # 1. Retrieve Context (callers may have started it already, see /query)
+    stage = time.perf_counter()
+    if retrieval is None:
+        retrieval = retrieve_context(question, thread_id=thread_id, query_embedding=query_embedding, timings=timings)
+    retrieved_chunks = await retrieval
+    timings["retrieval"] = time.perf_counter() - stage
     
-    context_str = ""
-    for chunk in retrieved_chunks:
-        context_str += f">>> [{chunk['doc_name']} - page {chunk['page_num']} - chunk {chunk['chunk_id']}] {chunk['text']}\n\n"
-        
+    # Overlapping windows are merged and the prompt stays within CONTEXT_TOKEN_BUDGET;
+    # the sources sent back are the chunks the model actually saw
+    context_str, retrieved_chunks = build_context(retrieved_chunks)
+
     # 2. Construct Prompt
     prompt = SYSTEM_PROMPT.format(context_str=context_str, user_question=question)
     
-    # 3. Call LLM with Retry & Streaming
-    import time
-    max_retries = 3
-    base_delay = 2
-    
-    response_stream = None
-    
-    for attempt in range(max_retries):
-        try:
-            response_stream = model.generate_content(prompt, stream=True)
-            break
-        except Exception as e:
-            if "429" in str(e) or "quota" in str(e).lower() or "resource exhausted" in str(e).lower():
-                if attempt < max_retries - 1:
-                    sleep_time = base_delay * (2 ** attempt)
-                    print(f"Quota exceeded (stream), retrying in {sleep_time}s...")
-                    time.sleep(sleep_time)
-                    continue
-            raise e
-
-    # Yield chunks
+    # 3. Call LLM (async streaming; quota retries back off without blocking the loop)
     full_answer = ""
+    failed = False
+    stage = time.perf_counter()
     try:
-        for chunk in response_stream:
-            if chunk.text:
-                full_answer += chunk.text
-                yield chunk.text
+        async for text in llm_client.stream_generate(prompt):
+            if "ttft" not in timings:
+                timings["ttft"] = time.perf_counter() - started
+            full_answer += text
+            yield text
+        timings["generation"] = time.perf_counter() - stage
     except Exception as e:
+        failed = True
         yield f"\n[Error during streaming: {e}]"
 
     # Yield sources at the end as a special marker or just append?
     # For SSE, we can send events. But for simple stream, we might just append text.
     # Or we can yield a JSON object if using SSE.
     # Let's yield a delimiter and then the sources JSON
-    import json
+    sources_json = json.dumps(retrieved_chunks)
     yield "\n\n__SOURCES__\n"
-    yield json.dumps(retrieved_chunks)
+    yield sources_json
+
+    if full_answer and not failed and use_cache:
+        answer_cache.put(thread_id, version, question, full_answer, sources_json, embedding)
@@ -0,0 +1,232 @@
+import array
+import mmap
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+NO_THREAD = -1 # thread_id column value for global (thread_id=None) chunks
+
+# Fixed-width columns and their array typecodes
+COLUMNS = {
+    "doc": "i",          # index into doc_names
+    "page_num": "i",
+    "chunk_id": "i",
+    "thread_id": "q",
+    "text_offset": "q",  # byte offset into the text blob
+    "text_length": "i",  # byte length in the text blob
+    "deleted": "b",      # 1 once the row's thread or document was deleted
+}
+
+
+class ChunkStore:
+    """
+    Columnar replacement for the old list-of-dicts metadata. Fixed-width fields live
+    in compact arrays; chunk text lives in an append-only UTF-8 blob that is
+    memory-mapped on first read, so only the chunks actually returned get decoded.
+    Indexing returns the same dict shape the list used to hold.
+    """
+
+    def __init__(self, blob_path: str):
+        self.blob_path = blob_path
+        self.columns = {name: array.array(code) for name, code in COLUMNS.items()}
+        self.doc_names: List[str] = []
+        self.doc_ids: Dict[str, int] = {}
+        self._writer = None
+        self._reader = None
+        self._mmap: Optional[mmap.mmap] = None
+        self._map_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.columns["doc"])
+
+    def __getitem__(self, idx: int) -> Dict[str, Any]:
+        return {
+            "doc_name": self.doc_names[self.columns["doc"][idx]],
+            "page_num": self.columns["page_num"][idx],
+            "chunk_id": self.columns["chunk_id"][idx],
+            "text": self.text(idx),
+            "thread_id": self.thread_id(idx),
+        }
+
+    def thread_id(self, idx: int) -> Optional[int]:
+        value = self.columns["thread_id"][idx]
+        return None if value == NO_THREAD else value
+
+    def is_deleted(self, idx: int) -> bool:
+        return self.columns["deleted"][idx] == 1
+
+    def find_rows(self, thread_id: Optional[int], doc_name: Optional[str] = None) -> List[int]:
+        """Live rows of a thread, or of one of its documents."""
+        doc = None
+        if doc_name is not None:
+            doc = self.doc_ids.get(doc_name)
+            if doc is None:
+                return []
+        def column(name):
+            return np.frombuffer(self.columns[name], dtype=self.columns[name].typecode)
+        mask = column("thread_id") == (NO_THREAD if thread_id is None else thread_id)
+        mask &= column("deleted") == 0
+        if doc is not None:
+            mask &= column("doc") == doc
+        return np.flatnonzero(mask).tolist()
+
+    def mark_deleted(self, row_ids: List[int]):
+        # Rows keep their ids (FAISS and the keyword index refer to them); only the flag changes
+        deleted = self.columns["deleted"]
+        for idx in row_ids:
+            deleted[idx] = 1
+
+    def text(self, idx: int) -> str:
+        offset = self.columns["text_offset"][idx]
+        end = offset + self.columns["text_length"][idx]
+        if end == offset:
+            return ""
+        return bytes(self._map(end)[offset:end]).decode("utf-8")
+
+    def _map(self, needed: int) -> mmap.mmap:
+        # The blob only grows, so remap when a read reaches past the current mapping.
+        # Readers run without the store's lock: the old mapping is left for them to
+        # drop rather than closed under their feet.
+        mapping = self._mmap
+        if mapping is None or len(mapping) < needed:
+            with self._map_lock:
+                if self._mmap is None or len(self._mmap) < needed:
+                    if self._writer:
+                        self._writer.flush()
+                    if self._reader is None:
+                        self._reader = open(self.blob_path, "rb")
+                    self._mmap = mmap.mmap(self._reader.fileno(), 0, access=mmap.ACCESS_READ)
+                mapping = self._mmap
+        return mapping
+
+    def write_texts(self, texts: List[str]) -> Tuple[List[int], List[int]]:
+        """Appends texts to the blob (fsynced) and returns their (offsets, lengths)."""
+        if self._writer is None:
+            os.makedirs(os.path.dirname(self.blob_path) or ".", exist_ok=True)
+            self._writer = open(self.blob_path, "ab")
+        offset = self._writer.seek(0, os.SEEK_END)
+        offsets, lengths = [], []
+        encoded = []
+        for text in texts:
+            data = text.encode("utf-8")
+            offsets.append(offset)
+            lengths.append(len(data))
+            encoded.append(data)
+            offset += len(data)
+        self._writer.write(b"".join(encoded))
+        self._writer.flush()
+        os.fsync(self._writer.fileno())
+        return offsets, lengths
+
+    def make_rows(self, chunks: List[Dict[str, Any]]) -> Dict[str, list]:
+        """
+        Writes the chunks' text and returns the column values to log and extend().
+        Span chunks (page_text/start/end) write their page once and point into it,
+        so overlapping chunks never store the same bytes twice.
+        """
+        pieces: List[str] = []
+        piece_of_page: Dict[int, int] = {}
+        placements = []  # (piece index, byte start, byte end) per chunk
+        for chunk in chunks:
+            if "page_text" not in chunk:
+                pieces.append(chunk["text"])
+                placements.append((len(pieces) - 1, 0, None))
+                continue
+            page_text = chunk["page_text"]
+            if id(page_text) not in piece_of_page:
+                piece_of_page[id(page_text)] = len(pieces)
+                pieces.append(page_text)
+            start, end = chunk["start"], chunk["end"]
+            if not page_text.isascii():
+                # Character offsets -> UTF-8 byte offsets
+                byte_start = len(page_text[:start].encode("utf-8"))
+                end = byte_start + len(page_text[start:end].encode("utf-8"))
+                start = byte_start
+            placements.append((piece_of_page[id(page_text)], start, end))
+
+        piece_offsets, piece_lengths = self.write_texts(pieces)
+        offsets, lengths = [], []
+        for piece, start, end in placements:
+            end = piece_lengths[piece] if end is None else end
+            offsets.append(piece_offsets[piece] + start)
+            lengths.append(end - start)
+        return {
+            "doc_name": [chunk["doc_name"] for chunk in chunks],
+            "page_num": [chunk["page_num"] for chunk in chunks],
+            "chunk_id": [chunk["chunk_id"] for chunk in chunks],
+            "thread_id": [NO_THREAD if chunk.get("thread_id") is None else chunk["thread_id"] for chunk in chunks],
+            "text_offset": offsets,
+            "text_length": lengths,
+        }
+
+    def page_rows(self, idx: int) -> range:
+        """
+        Rows around `idx` from the same page of the same document and thread. A page's
+        chunks are appended together, so this walks outwards instead of scanning.
+        """
+        def key(i):
+            return self.columns["doc"][i], self.columns["page_num"][i], self.columns["thread_id"][i]
+        page = key(idx)
+        start, end = idx, idx + 1
+        while start > 0 and key(start - 1) == page:
+            start -= 1
+        while end < len(self) and key(end) == page:
+            end += 1
+        return range(start, end)
+
+    def copy_rows(self, row_ids: List[int], thread_id: Optional[int], doc_name: str) -> Dict[str, list]:
+        """Rows for another thread pointing at the same text in the blob; nothing is written."""
+        return {
+            "doc_name": [doc_name] * len(row_ids),
+            "page_num": [self.columns["page_num"][i] for i in row_ids],
+            "chunk_id": [self.columns["chunk_id"][i] for i in row_ids],
+            "thread_id": [NO_THREAD if thread_id is None else thread_id] * len(row_ids),
+            "text_offset": [self.columns["text_offset"][i] for i in row_ids],
+            "text_length": [self.columns["text_length"][i] for i in row_ids],
+        }
+
+    def extend(self, rows: Dict[str, list]):
+        for name in rows["doc_name"]:
+            if name not in self.doc_ids:
+                self.doc_ids[name] = len(self.doc_names)
+                self.doc_names.append(name)
+        self.columns["doc"].extend(self.doc_ids[name] for name in rows["doc_name"])
+        for column in ("page_num", "chunk_id", "thread_id", "text_offset", "text_length"):
+            self.columns[column].extend(rows[column])
+        self.columns["deleted"].extend(bytes(len(rows["doc_name"])))
+
+    def state(self, start: int = 0, end: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Columns of rows [start, end) with their own doc name table; the blob itself
+        is append-only and never copied. Deleted flags are kept separately.
+        """
+        end = len(self) if end is None else end
+        docs = self.columns["doc"][start:end]
+        used = sorted(set(docs))
+        local = {doc: i for i, doc in enumerate(used)}
+        columns = {name: self.columns[name][start:end].tobytes() for name in COLUMNS if name not in ("doc", "deleted")}
+        columns["doc"] = array.array("i", [local[doc] for doc in docs]).tobytes()
+        return {"columns": columns, "doc_names": [self.doc_names[doc] for doc in used]}
+
+    def extend_state(self, state: Dict[str, Any]):
+        """Appends rows saved by state()."""
+        count = len(state["columns"]["doc"]) // self.columns["doc"].itemsize
+        for name, code in COLUMNS.items():
+            if name == "doc":
+                continue
+            column = array.array(code)
+            column.frombytes(state["columns"].get(name, b""))
+            # Snapshots from before deletes existed have no deleted column
+            column.extend(array.array(code, bytes(column.itemsize * (count - len(column)))))
+            self.columns[name].extend(column)
+        docs = array.array("i")
+        docs.frombytes(state["columns"]["doc"])
+        for name in state["doc_names"]:
+            if name not in self.doc_ids:
+                self.doc_ids[name] = len(self.doc_names)
+                self.doc_names.append(name)
+        remap = [self.doc_ids[name] for name in state["doc_names"]]
+        self.columns["doc"].extend(remap[doc] for doc in docs)
+
@@ -0,0 +1,52 @@
+import re
+from bisect import bisect_left
+from typing import Any, Dict, List, Tuple
+
+# Rough tokenizer: words and individual punctuation marks. Close enough to
+# sub-word token counts for budgeting without shipping a real tokenizer.
+TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+# Preferred chunk boundaries, best first
+BREAKS = ("\n\n", "\n", ". ", "; ", " ")
+
+
+def count_tokens(text: str) -> int:
+    return sum(1 for _ in TOKEN_RE.finditer(text))
+
+
+def chunk_spans(text: str, max_tokens: int = 800, overlap_tokens: int = 0, min_fill: float = 0.5) -> List[Tuple[int, int]]:
+    """
+    Splits `text` into (start, end) offsets of at most `max_tokens` tokens each.
+    A chunk ends at the last paragraph, line or sentence break (in that order of
+    preference) past `min_fill` of the budget, so boundaries follow the layout
+    instead of cutting mid-word. No text is copied.
+    """
+    tokens = [(m.start(), m.end()) for m in TOKEN_RE.finditer(text)]
+    starts = [start for start, _ in tokens]
+    spans = []
+    i = 0
+    while i < len(tokens):
+        j = min(i + max_tokens, len(tokens))
+        start = tokens[i][0]
+        if j == len(tokens):
+            spans.append((start, tokens[-1][1]))
+            break
+
+        hard_end = tokens[j][0]
+        floor = tokens[i + max(1, int(max_tokens * min_fill)) - 1][1]
+        end = hard_end
+        for separator in BREAKS:
+            pos = text.rfind(separator, floor, hard_end)
+            if pos != -1:
+                end = pos + len(separator)
+                break
+        next_i = bisect_left(starts, end)
+        spans.append((start, tokens[next_i - 1][1]))
+        i = max(next_i - overlap_tokens, i + 1)
+    return spans
+
+
+def chunk_text(chunk: Dict[str, Any]) -> str:
+    """Text of a chunk that is either materialised or an offset span into its page."""
+    if "text" in chunk:
+        return chunk["text"]
+    return chunk["page_text"][chunk["start"]:chunk["end"]]
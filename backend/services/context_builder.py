@@ -0,0 +1,97 @@
+import os
+from collections import defaultdict
+from typing import Any, Dict, List, Tuple
+
+from .chunker import TOKEN_RE, chunk_spans, count_tokens
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 3000))
+# Token-set overlap above which a passage adds nothing to one already included
+DUPLICATE_OVERLAP = float(os.getenv("CONTEXT_DUPLICATE_OVERLAP", 0.9))
+MIN_TEXT_OVERLAP = 16 # shortest shared edge (chars) treated as a window overlap
+
+
+def _merge_text(left: str, right: str) -> str:
+    """Joins two neighbouring windows, keeping their shared edge once."""
+    if right in left:
+        return left
+    probe = right[:MIN_TEXT_OVERLAP]
+    if len(probe) == MIN_TEXT_OVERLAP:
+        pos = left.find(probe, max(0, len(left) - len(right)))
+        while pos != -1:
+            if right.startswith(left[pos:]):
+                return left + right[len(left) - pos:]
+            pos = left.find(probe, pos + 1)
+    return left + "\n" + right
+
+
+def _passages(chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Merges runs of consecutive chunks from the same page into one passage, ranked by its best chunk."""
+    by_page = defaultdict(list)
+    for rank, chunk in enumerate(chunks):
+        by_page[(chunk["doc_name"], chunk["page_num"])].append((chunk["chunk_id"], rank, chunk))
+
+    passages = []
+    for (doc_name, page_num), members in by_page.items():
+        members.sort(key=lambda member: member[0])
+        run = None
+        for chunk_id, rank, chunk in members:
+            if run is not None and chunk_id <= run["last_chunk"] + 1:
+                if chunk_id > run["last_chunk"]:
+                    run["text"] = _merge_text(run["text"], chunk["text"])
+                    run["last_chunk"] = chunk_id
+                run["rank"] = min(run["rank"], rank)
+                run["chunks"].append(chunk)
+                continue
+            run = {
+                "doc_name": doc_name,
+                "page_num": page_num,
+                "first_chunk": chunk_id,
+                "last_chunk": chunk_id,
+                "text": chunk["text"],
+                "rank": rank,
+                "chunks": [chunk],
+            }
+            passages.append(run)
+    passages.sort(key=lambda passage: passage["rank"])
+    return passages
+
+
+def _header(passage: Dict[str, Any]) -> str:
+    chunk = str(passage["first_chunk"])
+    if passage["last_chunk"] != passage["first_chunk"]:
+        chunk += f"-{passage['last_chunk']}"
+    return f">>> [{passage['doc_name']} - page {passage['page_num']} - chunk {chunk}] "
+
+
+def build_context(chunks: List[Dict[str, Any]], max_tokens: int = CONTEXT_TOKEN_BUDGET, duplicate_overlap: float = DUPLICATE_OVERLAP) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    Prompt context from retrieved chunks, best first (the order they are passed in).
+    Neighbouring chunks of a page are merged so overlapping windows are not repeated,
+    passages that mostly repeat an included one are dropped, and passages are added
+    while they fit in `max_tokens`. Returns the context and the chunks it includes.
+    """
+    context = []
+    included = []
+    seen_tokens = []
+    remaining = max_tokens
+    for passage in _passages(chunks):
+        tokens = set(TOKEN_RE.findall(passage["text"].lower()))
+        if any(len(tokens & seen) >= duplicate_overlap * len(tokens) for seen in seen_tokens):
+            continue
+        header = _header(passage)
+        text = passage["text"]
+        cost = count_tokens(header) + count_tokens(text)
+        if cost > remaining:
+            if context:
+                continue
+            # The best passage alone is over budget: keep its head rather than nothing
+            spans = chunk_spans(text, max(remaining - count_tokens(header), 1))
+            text = text[spans[0][0]:spans[0][1]] if spans else ""
+            cost = remaining
+        context.append(header + text + "\n\n")
+        included.extend(passage["chunks"])
+        seen_tokens.append(tokens)
+        remaining -= cost
+        if remaining <= 0:
+            break
+    return "".join(context), included
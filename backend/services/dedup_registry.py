@@ -0,0 +1,80 @@
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+NO_THREAD = -1 # thread key for global (thread_id=None) documents
+
+
+class DedupRegistry:
+    """
+    Content-hash registry shared by the API process and the PDF parse workers.
+      documents: sha256(file) + thread -> VectorStore rows holding its chunks
+      pages:     hash of a page's content streams -> extracted page text
+    A document seen before is never parsed or embedded again, and an identical
+    page inside a different document skips layout analysis.
+    """
+
+    def __init__(self, path: str = "data/dedup.sqlite"):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self.conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            # Parse workers write pages from other processes: WAL plus a busy timeout
+            self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents (doc_hash TEXT NOT NULL, thread_id INTEGER NOT NULL, "
+                "doc_name TEXT NOT NULL, row_ids BLOB NOT NULL, PRIMARY KEY (doc_hash, thread_id))"
+            )
+            self.conn.execute("CREATE TABLE IF NOT EXISTS pages (page_hash TEXT PRIMARY KEY, text TEXT NOT NULL)")
+            self.conn.commit()
+        return self.conn
+
+    def find_document(self, doc_hash: str) -> Dict[Optional[int], List[int]]:
+        """Threads that already hold this document, with the rows of its chunks."""
+        with self.lock:
+            rows = self._connection().execute(
+                "SELECT thread_id, row_ids FROM documents WHERE doc_hash = ?", (doc_hash,)
+            ).fetchall()
+        return {
+            (None if thread_id == NO_THREAD else thread_id): np.frombuffer(blob, dtype="int64").tolist()
+            for thread_id, blob in rows
+        }
+
+    def add_document(self, doc_hash: str, thread_id: Optional[int], doc_name: str, row_ids: List[int]):
+        with self.lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO documents (doc_hash, thread_id, doc_name, row_ids) VALUES (?, ?, ?, ?)",
+                (doc_hash, NO_THREAD if thread_id is None else thread_id, doc_name, np.asarray(row_ids, dtype="int64").tobytes()),
+            )
+            conn.commit()
+
+    def remove_documents(self, thread_id: Optional[int], doc_name: Optional[str] = None):
+        """Forgets a deleted thread's documents (or one of them), so re-uploads are ingested again."""
+        query = "DELETE FROM documents WHERE thread_id = ?"
+        params = [NO_THREAD if thread_id is None else thread_id]
+        if doc_name is not None:
+            query += " AND doc_name = ?"
+            params.append(doc_name)
+        with self.lock:
+            conn = self._connection()
+            conn.execute(query, params)
+            conn.commit()
+
+    def get_page(self, page_hash: str) -> Optional[str]:
+        with self.lock:
+            row = self._connection().execute("SELECT text FROM pages WHERE page_hash = ?", (page_hash,)).fetchone()
+        return row[0] if row else None
+
+    def put_page(self, page_hash: str, text: str):
+        with self.lock:
+            conn = self._connection()
+            conn.execute("INSERT OR IGNORE INTO pages (page_hash, text) VALUES (?, ?)", (page_hash, text))
+            conn.commit()
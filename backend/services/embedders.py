@@ -0,0 +1,153 @@
+import os
+import random
+import re
+import time
+import zlib
+from typing import List, Optional
+
+import numpy as np
+
+from . import metrics
+
+# gemini (remote, 768-d) | hashing (local CPU, INDEX_EMBEDDING_DIM-d)
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "gemini")
+GEMINI_EMBEDDING_MODEL = "models/embedding-001"
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", 5))
+EMBED_BASE_DELAY = 2
+HASHING_DIM = int(os.getenv("INDEX_EMBEDDING_DIM", 768))
+
+WORD_RE = re.compile(r"\w+")
+
+
+class EmbeddingError(RuntimeError):
+    pass
+
+
+def is_quota_error(e: Exception) -> bool:
+    return "429" in str(e) or "quota" in str(e).lower() or "resource exhausted" in str(e).lower()
+
+
+class Embedder:
+    """
+    Turns texts into float32 vectors of `dimension`. `name` identifies the vector
+    space: the store records it and vectors with different names are never mixed.
+    `cacheable` embedders are slow enough (network, quota) that results are kept in
+    the EmbeddingCache.
+    """
+
+    name = ""
+    dimension = 0
+    cacheable = False
+
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        raise NotImplementedError
+
+    def embed_query(self, text: str) -> np.ndarray:
+        return self.embed_documents([text])[0]
+
+
+class GeminiEmbedder(Embedder):
+    dimension = 768
+    cacheable = True
+
+    def __init__(self, model: str = GEMINI_EMBEDDING_MODEL):
+        import google.generativeai as genai
+        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+        self.genai = genai
+        self.model = model
+        # Same key as the embedding cache has always used, so existing entries stay valid
+        self.name = model
+
+    def _call(self, task: str, max_retries: int, **kwargs):
+        for attempt in range(max_retries):
+            try:
+                return self.genai.embed_content(model=self.model, **kwargs)["embedding"]
+            except Exception as e:
+                if not is_quota_error(e):
+                    raise
+                if attempt < max_retries - 1:
+                    sleep_time = EMBED_BASE_DELAY * (2 ** attempt) * (1 + random.random())
+                    print(f"Embedding quota exceeded ({task}), retrying in {sleep_time:.1f}s...")
+                    metrics.EMBEDDING_RETRIES.inc(task=task)
+                    time.sleep(sleep_time)
+                    continue
+                # Zero vectors would silently poison the index; fail the caller instead
+                raise EmbeddingError(f"Embedding quota exceeded after {max_retries} attempts") from e
+
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        embeddings = self._call("document", EMBED_MAX_RETRIES, content=texts, task_type="retrieval_document", title="Construction Document")
+        return np.asarray(embeddings, dtype="float32")
+
+    def embed_query(self, text: str) -> np.ndarray:
+        return np.asarray(self._call("query", 3, content=text, task_type="retrieval_query"), dtype="float32")
+
+
+class HashingEmbedder(Embedder):
+    """
+    Local, deterministic bag-of-features embedding: word unigrams, word bigrams and
+    character trigrams of each word (so "D-101" and "d101" still share features)
+    are hashed with CRC32 into `dimension` signed buckets, weighted by log term
+    frequency and L2-normalised. No model download and no network; a batch is one
+    NumPy scatter-add.
+    """
+
+    def __init__(self, dimension: int = HASHING_DIM):
+        self.dimension = dimension
+        self.name = f"hashing-v1:{dimension}"
+        self.word_hashes = {}  # word -> hashes of the word and its trigrams; vocabularies are small
+
+    def _word_hashes(self, word: str) -> List[int]:
+        hashes = self.word_hashes.get(word)
+        if hashes is None:
+            padded = f"<{word}>"
+            features = [word] + ["#" + padded[i:i + 3] for i in range(len(padded) - 2)]
+            hashes = [zlib.crc32(feature.encode("utf-8")) for feature in features]
+            if len(self.word_hashes) > 1_000_000:
+                self.word_hashes.clear()
+            self.word_hashes[word] = hashes
+        return hashes
+
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        rows, hashes = [], []
+        for row, text in enumerate(texts):
+            words = WORD_RE.findall(text.lower())
+            start = len(hashes)
+            for word in words:
+                hashes.extend(self._word_hashes(word))
+            hashes.extend(zlib.crc32(f"{a} {b}".encode("utf-8")) for a, b in zip(words, words[1:]))
+            rows.extend([row] * (len(hashes) - start))
+
+        vectors = np.zeros((len(texts), self.dimension), dtype="float32")
+        if hashes:
+            hashes = np.asarray(hashes, dtype="uint32")
+            buckets = (hashes % self.dimension).astype("int64")
+            signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype("float32")
+            np.add.at(vectors, (np.asarray(rows, dtype="int64"), buckets), signs)
+        # Log-scaled term frequency, keeping each bucket's sign
+        vectors = np.sign(vectors) * np.log1p(np.abs(vectors))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1.0, norms)
+
+
+def get_embedder(provider: str = None) -> Embedder:
+    provider = (provider or EMBEDDING_PROVIDER).lower()
+    if provider == "gemini":
+        return GeminiEmbedder()
+    if provider in ("hashing", "local"):
+        return HashingEmbedder()
+    raise ValueError(f"Unknown EMBEDDING_PROVIDER {provider!r} (expected gemini or hashing)")
+
+
+def embedder_for(name: str) -> Optional[Embedder]:
+    """
+    The embedder behind vectors recorded under `name`, so stored vectors can still
+    be queried while they are rebuilt for another one. None if it cannot be built here.
+    """
+    try:
+        if name.startswith("hashing-v1:"):
+            return HashingEmbedder(int(name.split(":", 1)[1]))
+        if name.startswith("models/"):
+            return GeminiEmbedder(name)
+    except Exception as e:
+        print(f"Cannot load embedder {name}: {e}")
+    return None
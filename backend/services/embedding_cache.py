@@ -0,0 +1,85 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache: (model, task_type, sha256(text)) -> vector.
+    A bounded in-memory LRU sits in front of an on-disk SQLite table, so identical
+    texts are only ever sent to the embedding API once.
+    """
+
+    def __init__(self, path: str = "data/embeddings.sqlite", max_memory_items: int = 10000):
+        self.path = path
+        self.max_memory_items = max_memory_items
+        self.lru: "OrderedDict[str, List[float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self.conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self.conn = sqlite3.connect(self.path, check_same_thread=False)
+            self.conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+        return self.conn
+
+    @staticmethod
+    def key(model: str, task_type: str, text: str) -> str:
+        return f"{model}:{task_type}:{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+
+    def _remember(self, key: str, vector: List[float]):
+        self.lru[key] = vector
+        self.lru.move_to_end(key)
+        while len(self.lru) > self.max_memory_items:
+            self.lru.popitem(last=False)
+
+    def get_many(self, model: str, task_type: str, texts: List[str]) -> List[Optional[List[float]]]:
+        keys = [self.key(model, task_type, text) for text in texts]
+        found: Dict[str, List[float]] = {}
+        with self.lock:
+            missing = []
+            for key in keys:
+                if key in self.lru:
+                    self.lru.move_to_end(key)
+                    found[key] = self.lru[key]
+                else:
+                    missing.append(key)
+
+            # SQLite caps bound parameters, so look the rest up in slices
+            for start in range(0, len(missing), 500):
+                batch = missing[start:start + 500]
+                rows = self._connection().execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    vector = np.frombuffer(blob, dtype="float32").tolist()
+                    found[key] = vector
+                    self._remember(key, vector)
+
+            results = [found.get(key) for key in keys]
+            hits = sum(1 for r in results if r is not None)
+            self.hits += hits
+            self.misses += len(results) - hits
+        return results
+
+    def put_many(self, model: str, task_type: str, texts: List[str], vectors: List[List[float]]):
+        rows = []
+        with self.lock:
+            for text, vector in zip(texts, vectors):
+                key = self.key(model, task_type, text)
+                self._remember(key, list(vector))
+                rows.append((key, np.asarray(vector, dtype="float32").tobytes()))
+            conn = self._connection()
+            conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows)
+            conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "memory_items": len(self.lru)}
@@ -1,50 +1,169 @@
-import os
+import asyncio
+import hashlib
 import json
-import google.generativeai as genai
-from typing import List, Dict, Any
-from .retrieval_service import hybrid_search
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+from .chunker import count_tokens
+from .context_builder import build_context
+from .vector_store import vector_store
+from . import llm_client
 
-# Configure Gemini
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-model = genai.GenerativeModel(os.getenv("GEMINI_MODEL_NAME", "gemini-1.5-flash"))
+# Tokens of document text per extraction prompt (one map batch)
+EXTRACTION_TOKEN_BUDGET = int(os.getenv("EXTRACTION_TOKEN_BUDGET", 8000))
+EXTRACTION_CONCURRENCY = int(os.getenv("EXTRACTION_CONCURRENCY", 4))
+EXTRACTION_CACHE_PATH = "data/extraction_cache.sqlite"
+# A chunk mentioning any of these puts its whole page into the candidates
+DOOR_TERMS = ("door", "doors", "doorset", "doorsets")
+DOOR_FIELDS = ("location", "width_mm", "height_mm", "fire_rating", "material")
 
-EXTRACTION_PROMPT = """You are extracting a door schedule. Input: a set of retrieved text chunks. Output: JSON array of door objects with exact keys: mark, location, width_mm, height_mm, fire_rating, material, source_references (array of {{file,page,chunk,excerpt}}). 
+EXTRACTION_PROMPT = """You are extracting a door schedule. Input: a set of retrieved text chunks. Output: JSON array of door objects with exact keys: mark, location, width_mm, height_mm, fire_rating, material, source_references (array of {{file,page,chunk,excerpt}}).
 Rules:
 - Output MUST be valid JSON only (no extra commentary).
 - If a field is missing, set its value to null.
 - For numeric fields convert to integers (mm).
 - For conflicting values, include both candidate values separated by ' / ' and add a note inside source_references.
+- If the chunks describe no doors, return [].
 Return only JSON.
 
 Context:
 {context_str}
 """
 
-async def extract_door_schedule() -> List[Dict[str, Any]]:
-    # 1. Retrieve Context
-    # We search for "door schedule" and "door list" to get relevant chunks
-    # In a real system, we might want to scan all docs or use a classifier
-    chunks = hybrid_search("door schedule door list door types", k=15)
-    
-    context_str = ""
-    for chunk in chunks:
-        context_str += f">>> [{chunk['doc_name']} - page {chunk['page_num']} - chunk {chunk['chunk_id']}] {chunk['text']}\n\n"
-        
-    # 2. Call LLM
+_cache_conn: Optional[sqlite3.Connection] = None
+# The connection is shared by the worker threads the lookups run in
+_cache_lock = threading.Lock()
+
+
+def _cache() -> sqlite3.Connection:
+    global _cache_conn
+    if _cache_conn is None:
+        os.makedirs(os.path.dirname(EXTRACTION_CACHE_PATH), exist_ok=True)
+        _cache_conn = sqlite3.connect(EXTRACTION_CACHE_PATH, check_same_thread=False)
+        _cache_conn.execute("CREATE TABLE IF NOT EXISTS batches (key TEXT PRIMARY KEY, rows TEXT NOT NULL)")
+    return _cache_conn
+
+
+def _cached_rows(key: str) -> Optional[List[Dict[str, Any]]]:
+    with _cache_lock:
+        row = _cache().execute("SELECT rows FROM batches WHERE key = ?", (key,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def _store_rows(key: str, rows: List[Dict[str, Any]]):
+    with _cache_lock:
+        conn = _cache()
+        conn.execute("INSERT OR REPLACE INTO batches (key, rows) VALUES (?, ?)", (key, json.dumps(rows)))
+        conn.commit()
+
+
+def find_candidates(thread_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Chunks of every page (in the thread and the global docs) that mentions doors, in document order."""
+    thread_ids = [thread_id, None] if thread_id else [None]
+    row_ids = set()
+    for doc_id in vector_store.keyword_matching(DOOR_TERMS, thread_ids=thread_ids):
+        if doc_id not in row_ids:
+            row_ids.update(vector_store.metadata.page_rows(doc_id))
+    # A re-uploaded document can sit right next to the deleted copy of its pages
+    chunks = [vector_store.metadata[i] for i in row_ids if not vector_store.metadata.is_deleted(i)]
+    return sorted(chunks, key=lambda chunk: (chunk["doc_name"], chunk["page_num"], chunk["chunk_id"]))
+
+
+def make_batches(chunks: List[Dict[str, Any]], max_tokens: int = EXTRACTION_TOKEN_BUDGET) -> List[str]:
+    """
+    Prompt contexts of up to `max_tokens`. Batches never span documents, so a new
+    upload leaves the batches (and cache keys) of every other document unchanged.
+    """
+    contexts = []
+    batch, batch_tokens, batch_doc = [], 0, None
+    for chunk in chunks + [None]:
+        tokens = count_tokens(chunk["text"]) if chunk else 0
+        if batch and (chunk is None or chunk["doc_name"] != batch_doc or batch_tokens + tokens > max_tokens):
+            # The batch is already sized, so the builder only merges overlapping windows
+            # (headers push it slightly past max_tokens). Schedule pages share most of
+            # their vocabulary, so only exact repeats are dropped.
+            context_str, _ = build_context(batch, max_tokens=2 * max_tokens, duplicate_overlap=1.0)
+            contexts.append(context_str)
+            batch, batch_tokens = [], 0
+        if chunk:
+            batch.append(chunk)
+            batch_tokens += tokens
+            batch_doc = chunk["doc_name"]
+    return contexts
+
+
+def parse_rows(text: str) -> List[Dict[str, Any]]:
+    # Clean up markdown code blocks if present
+    if "```json" in text:
+        text = text.split("```json")[1].split("```")[0]
+    elif "```" in text:
+        text = text.split("```")[1].split("```")[0]
+    data = json.loads(text.strip())
+    return data if isinstance(data, list) else [data]
+
+
+async def extract_batch(context_str: str, semaphore: asyncio.Semaphore) -> List[Dict[str, Any]]:
+    """Map step: door rows found in one batch, cached by the batch's prompt hash."""
     prompt = EXTRACTION_PROMPT.format(context_str=context_str)
-    response = model.generate_content(prompt)
-    
-    # 3. Parse JSON
+    key = hashlib.sha256(f"{llm_client.model.model_name}:{prompt}".encode("utf-8")).hexdigest()
+    # SQLite off the event loop: the batches of one extraction run concurrently
+    cached = await asyncio.to_thread(_cached_rows, key)
+    if cached is not None:
+        return cached
+
+    async with semaphore:
+        text = await llm_client.generate(prompt)
     try:
-        text = response.text
-        # Clean up markdown code blocks if present
-        if "```json" in text:
-            text = text.split("```json")[1].split("```")[0]
-        elif "```" in text:
-            text = text.split("```")[1].split("```")[0]
-            
-        data = json.loads(text.strip())
-        return data
+        rows = [row for row in parse_rows(text) if isinstance(row, dict)]
     except Exception as e:
         print(f"Error parsing JSON: {e}")
         return []
+    await asyncio.to_thread(_store_rows, key, rows)
+    return rows
+
+
+def merge_rows(batches: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Reduce step: one row per door mark. Differing values are kept, joined with ' / '."""
+    merged: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+    unmarked = []
+    for rows in batches:
+        for row in rows:
+            mark = str(row.get("mark") or "").strip()
+            if not mark:
+                unmarked.append(row)
+                continue
+            key = "".join(mark.upper().split())
+            if key not in merged:
+                merged[key] = {"mark": mark, **{field: [] for field in DOOR_FIELDS}, "source_references": []}
+            door = merged[key]
+            for field in DOOR_FIELDS:
+                value = row.get(field)
+                if value is not None and value not in door[field]:
+                    door[field].append(value)
+            for reference in row.get("source_references") or []:
+                if reference not in door["source_references"]:
+                    door["source_references"].append(reference)
+
+    results = []
+    for door in merged.values():
+        for field in DOOR_FIELDS:
+            values = door[field]
+            door[field] = None if not values else values[0] if len(values) == 1 else " / ".join(str(v) for v in values)
+        results.append(door)
+    return results + unmarked
+
+
+async def extract_door_schedule(thread_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    # 1. Candidates: every page that mentions doors, not just the top search hits
+    chunks = await asyncio.to_thread(find_candidates, thread_id)
+    contexts = make_batches(chunks)
+    print(f"Extracting doors from {len(chunks)} chunks in {len(contexts)} batches")
+
+    # 2. Map: batches run concurrently, at most EXTRACTION_CONCURRENCY LLM calls at a time
+    semaphore = asyncio.Semaphore(EXTRACTION_CONCURRENCY)
+    batches = await asyncio.gather(*[extract_batch(context_str, semaphore) for context_str in contexts])
+
+    # 3. Reduce
+    return merge_rows(batches)
@@ -0,0 +1,283 @@
+import json
+import os
+import pickle
+import shutil
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+from . import ann_index
+from . import keyword_index
+from .keyword_index import KeywordIndex
+from .segment_log import atomic_write
+
+GLOBAL_PARTITION = "global" # File name for the thread_id=None partition
+
+
+def partition_file(thread_id: Optional[int]) -> str:
+    return f"{GLOBAL_PARTITION if thread_id is None else thread_id}.index"
+
+
+def read_partitions(directory: str) -> Dict[Optional[int], faiss.Index]:
+    partitions = {}
+    for filename in os.listdir(directory):
+        stem, ext = os.path.splitext(filename)
+        if ext == ".index":
+            thread_id = None if stem == GLOBAL_PARTITION else int(stem)
+            partitions[thread_id] = ann_index.configure(faiss.read_index(os.path.join(directory, filename)))
+    return partitions
+
+
+def _add_tombstones(tombstones: Dict[Optional[int], np.ndarray], keyword: KeywordIndex, thread_id: Optional[int],
+                    row_ids: np.ndarray) -> Dict[Optional[int], np.ndarray]:
+    """Copy of `tombstones` plus those of `row_ids` still in the partition (replayed deletes may be compacted already)."""
+    partition = keyword.partitions.get(thread_id)
+    if partition is None:
+        return tombstones
+    row_ids = np.intersect1d(row_ids, np.frombuffer(partition.docs, dtype=np.int32))
+    if not len(row_ids):
+        return tombstones
+    tombstones = dict(tombstones)
+    if thread_id in tombstones:
+        row_ids = np.union1d(tombstones[thread_id], row_ids)
+    tombstones[thread_id] = row_ids.astype(np.int32)
+    return tombstones
+
+
+class ReadWriteLock:
+    """
+    Any number of readers or one writer. A waiting writer holds back new readers,
+    so a steady stream of searches cannot starve ingest.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+class Run:
+    """
+    Immutable slice of the index: the FAISS partitions and keyword postings of rows
+    [start, end), plus tombstones (ids in them deleted since). Nothing in a Run
+    changes after it is built, so searches read it without locks; deletes, merges
+    and compaction make a new Run and swap it in.
+
+    `name` is its directory under runs/ once written. `dropped` counts the docs
+    of partitions dropped since (deleted threads) that the directory still holds.
+    """
+
+    def __init__(self, start: int, end: int, partitions: Dict[Optional[int], faiss.Index], keyword: KeywordIndex,
+                 embedder: str, tombstones: Optional[Dict[Optional[int], np.ndarray]] = None,
+                 name: Optional[str] = None, dropped: int = 0):
+        self.start = start
+        self.end = end
+        self.partitions = partitions
+        self.keyword = keyword
+        self.embedder = embedder
+        self.tombstones = tombstones or {}
+        self.name = name
+        self.dropped = dropped
+
+    @property
+    def rows(self) -> int:
+        return self.end - self.start
+
+    @property
+    def dead(self) -> int:
+        return sum(len(ids) for ids in self.tombstones.values())
+
+    def replace(self, **changes) -> "Run":
+        fields = dict(self.__dict__)
+        fields.update(changes)
+        return Run(**fields)
+
+    def with_tombstones(self, thread_id: Optional[int], row_ids: np.ndarray) -> "Run":
+        tombstones = _add_tombstones(self.tombstones, self.keyword, thread_id, row_ids)
+        return self if tombstones is self.tombstones else self.replace(tombstones=tombstones)
+
+    def without(self, thread_id: Optional[int]) -> "Run":
+        if thread_id not in self.keyword.partitions and thread_id not in self.partitions:
+            return self
+        return self.replace(
+            partitions={key: index for key, index in self.partitions.items() if key != thread_id},
+            keyword=self.keyword.without(thread_id),
+            tombstones={key: ids for key, ids in self.tombstones.items() if key != thread_id},
+            dropped=self.dropped + (self._docs(thread_id) if self.name is not None else 0),
+        )
+
+    def _docs(self, thread_id: Optional[int]) -> int:
+        partition = self.keyword.partitions.get(thread_id)
+        return len(partition.docs) if partition is not None else 0
+
+    def write(self, directory: str, name: str, chunk_state: Dict[str, Any]) -> "Run":
+        """Writes the run into directory/name (via a temp dir, so it appears whole) and returns it named."""
+        path = os.path.join(directory, name)
+        tmp_path = f"{path}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(os.path.join(tmp_path, "partitions"))
+        for thread_id, index in self.partitions.items():
+            atomic_write(os.path.join(tmp_path, "partitions", partition_file(thread_id)), faiss.serialize_index(index).tobytes())
+        atomic_write(os.path.join(tmp_path, "keyword.pkl"), pickle.dumps(self.keyword, protocol=pickle.HIGHEST_PROTOCOL))
+        atomic_write(os.path.join(tmp_path, "chunks.pkl"), pickle.dumps(chunk_state, protocol=pickle.HIGHEST_PROTOCOL))
+        atomic_write(os.path.join(tmp_path, "run.json"), json.dumps({"start": self.start, "end": self.end, "embedder": self.embedder}).encode())
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+        return self.replace(name=name, dropped=0)
+
+    @classmethod
+    def read(cls, directory: str, name: str) -> Tuple["Run", Dict[str, Any]]:
+        """The run and its chunk columns (for ChunkStore.extend_state)."""
+        path = os.path.join(directory, name)
+        with open(os.path.join(path, "run.json")) as f:
+            info = json.load(f)
+        with open(os.path.join(path, "keyword.pkl"), "rb") as f:
+            keyword = pickle.load(f)
+        with open(os.path.join(path, "chunks.pkl"), "rb") as f:
+            chunk_state = pickle.load(f)
+        partitions = read_partitions(os.path.join(path, "partitions"))
+        return cls(info["start"], info["end"], partitions, keyword, info["embedder"], name=name), chunk_state
+
+
+class Tail:
+    """
+    Rows from `start` on that are not in a Run yet: flat FAISS partitions and a
+    keyword index that grow in place. Writers hold `rw` for writing, searches for
+    reading; freeze() turns it into a Run once nothing writes to it any more.
+    `embedder` names the vector space of what is added; None if it holds vectors
+    from more than one (replayed from an older log), which are rebuilt before use.
+    """
+
+    def __init__(self, start: int, embedder: Optional[str]):
+        self.start = start
+        self.embedder = embedder
+        self.partitions: Dict[Optional[int], faiss.Index] = {}
+        self.keyword = KeywordIndex(base=start)
+        self.tombstones: Dict[Optional[int], np.ndarray] = {}
+        self.rw = ReadWriteLock()
+
+    def add(self, thread_id: Optional[int], vectors: Optional[np.ndarray], ids: np.ndarray, texts: List[str]):
+        if vectors is not None:
+            if thread_id not in self.partitions:
+                # Flat until sealed: adds stay cheap and the run is built in the background
+                self.partitions[thread_id] = ann_index.create_index(vectors.shape[1], "flat")
+            self.partitions[thread_id].add_with_ids(vectors, ids)
+        for doc_id, text in zip(ids.tolist(), texts):
+            self.keyword.add(doc_id, text, thread_id)
+
+    def add_tombstones(self, thread_id: Optional[int], row_ids: np.ndarray):
+        self.tombstones = _add_tombstones(self.tombstones, self.keyword, thread_id, row_ids)
+
+    def drop(self, thread_id: Optional[int]):
+        self.partitions.pop(thread_id, None)
+        self.keyword.drop(thread_id)
+        self.tombstones = {key: ids for key, ids in self.tombstones.items() if key != thread_id}
+
+    def freeze(self, end: int) -> Run:
+        return Run(self.start, end, self.partitions, self.keyword, self.embedder, self.tombstones)
+
+
+def merge_runs(runs: Sequence[Run]) -> Run:
+    """
+    One run holding what `runs` (consecutive) hold minus their tombstones, with
+    every partition in the configured index type. Reads the inputs only.
+    """
+    partitions = {}
+    for key in dict.fromkeys(key for run in runs for key in run.partitions):
+        parts = [(run.partitions[key], run.tombstones.get(key)) for run in runs if key in run.partitions]
+        if len(parts) == 1 and parts[0][1] is None and ann_index.is_current(parts[0][0]):
+            partitions[key] = parts[0][0]  # immutable, so it can be shared
+            continue
+        vectors, ids = [], []
+        for index, dead in parts:
+            part_vectors, part_ids = ann_index.extract(index)
+            if dead is not None:
+                keep = ~np.isin(part_ids, dead)
+                part_vectors, part_ids = part_vectors[keep], part_ids[keep]
+            vectors.append(part_vectors)
+            ids.append(part_ids)
+        ids = np.concatenate(ids)
+        if len(ids):
+            partitions[key] = ann_index.rebuild(parts[0][0].d, np.concatenate(vectors), ids)
+    return Run(runs[0].start, runs[-1].end, partitions, _live_keyword(runs), runs[0].embedder)
+
+
+def reembed_run(run: Run, embedder: str, embed: Callable[[np.ndarray], np.ndarray]) -> Run:
+    """
+    Copy of `run` minus its tombstones with every partition rebuilt from
+    embed(row ids), i.e. in the vector space of `embedder`. Reads `run` only.
+    """
+    partitions = {}
+    for key, partition in run.keyword.partitions.items():
+        ids = np.frombuffer(partition.docs, dtype=np.int32).astype("int64")
+        if key in run.tombstones:
+            ids = ids[~np.isin(ids, run.tombstones[key])]
+        if len(ids):
+            vectors = embed(ids)
+            partitions[key] = ann_index.rebuild(vectors.shape[1], vectors, ids)
+    return Run(run.start, run.end, partitions, _live_keyword([run]), embedder)
+
+
+def _live_keyword(runs: Sequence[Run]) -> KeywordIndex:
+    if len(runs) == 1 and not runs[0].tombstones:
+        return runs[0].keyword
+    return keyword_index.merge([(run.keyword, run.tombstones) for run in runs], runs[0].start, runs[-1].end)
+
+
+def reconcile(built: Run, sources: Sequence[Run], current: Sequence[Run]) -> Run:
+    """
+    `built` was made from `sources`; `current` is what replaced those in the
+    meantime. Carries over what changed since: newer tombstones and dropped threads.
+    """
+    present = set()
+    for run in current:
+        present.update(run.keyword.partitions)
+    for key in list(built.keyword.partitions):
+        if key not in present:
+            built = built.without(key)
+
+    tombstones = dict(built.tombstones)
+    for key in present:
+        before = [run.tombstones[key] for run in sources if key in run.tombstones]
+        after = [run.tombstones[key] for run in current if key in run.tombstones]
+        if not after:
+            continue
+        fresh = np.setdiff1d(np.concatenate(after), np.concatenate(before) if before else [])
+        if len(fresh) and key in built.keyword.partitions:
+            if key in tombstones:
+                fresh = np.union1d(tombstones[key], fresh)
+            tombstones[key] = fresh.astype(np.int32)
+    return built.replace(tombstones=tombstones)
@@ -0,0 +1,211 @@
+import asyncio
+import json
+import os
+import shutil
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from fastapi import UploadFile
+
+from .ingestion_service import ingest_files, save_upload
+from .segment_log import atomic_write
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", 2))
+
+
+class IngestJobQueue:
+    """
+    Background ingestion. Uploads are saved under data/uploads/<job_id>/ and each
+    job is a JSON file under data/jobs/, so queued and interrupted jobs are picked
+    up again after a restart (resuming after the chunks already embedded).
+    """
+
+    def __init__(self, data_dir: str = "data"):
+        self.jobs_dir = os.path.join(data_dir, "jobs")
+        self.uploads_dir = os.path.join(data_dir, "uploads")
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self.queue: Optional[asyncio.Queue] = None
+        self.workers: List[asyncio.Task] = []
+        self.saves: Dict[str, Dict[str, Any]] = {}
+        self.running: Dict[str, asyncio.Task] = {}
+
+    def _write(self, job_id: str, data: bytes):
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        atomic_write(os.path.join(self.jobs_dir, f"{job_id}.json"), data)
+
+    async def _save(self, job: Dict[str, Any]):
+        """
+        Persists the job with the fsynced write off the event loop. Saves of one job
+        run one at a time; callers that queued up behind a write share the next one,
+        and each returns once a write that includes its progress is on disk.
+        """
+        saves = self.saves.setdefault(job["id"], {"lock": asyncio.Lock(), "requested": 0, "written": 0})
+        saves["requested"] += 1
+        wanted = saves["requested"]
+        async with saves["lock"]:
+            if saves["written"] >= wanted:
+                return
+            covered = saves["requested"]
+            job["updated_at"] = time.time()
+            data = json.dumps(job).encode()
+            await asyncio.to_thread(self._write, job["id"], data)
+            saves["written"] = covered
+
+    def _load(self):
+        if not os.path.isdir(self.jobs_dir):
+            return
+        for filename in sorted(os.listdir(self.jobs_dir)):
+            if filename.endswith(".json"):
+                with open(os.path.join(self.jobs_dir, filename)) as f:
+                    job = json.load(f)
+                self.jobs[job["id"]] = job
+
+    async def start(self):
+        self.queue = asyncio.Queue()
+        self._load()
+        pending = sorted((job for job in self.jobs.values() if job["status"] in ("queued", "running")), key=lambda job: job["created_at"])
+        for job in pending:
+            print(f"Resuming ingest job {job['id']} ({job['status']})")
+            job["status"] = "queued"
+            self.queue.put_nowait(job["id"])
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(INGEST_WORKERS)]
+
+    async def stop(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    async def submit(self, files: List[UploadFile], thread_id: Optional[int], user_id: int) -> Dict[str, Any]:
+        job_id = uuid.uuid4().hex
+        upload_dir = os.path.join(self.uploads_dir, job_id)
+        file_states = []
+        try:
+            for file in files:
+                file_path, sha256 = await save_upload(file, directory=upload_dir)
+                file_states.append({
+                    "filename": file.filename,
+                    "path": file_path,
+                    "sha256": sha256,
+                    "status": "queued",
+                    "pages_total": None,
+                    "pages_parsed": 0,
+                    "chunks_embedded": 0,
+                })
+        except Exception:
+            shutil.rmtree(upload_dir, ignore_errors=True)
+            raise
+
+        job = {
+            "id": job_id,
+            "user_id": user_id,
+            "thread_id": thread_id,
+            "status": "queued",
+            "error": None,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "chunks_count": 0,
+            "documents": [state["filename"] for state in file_states],
+            "files": file_states,
+        }
+        self.jobs[job_id] = job
+        await self._save(job)
+        self.queue.put_nowait(job_id)
+        return job
+
+    async def fail_thread(self, thread_id: int):
+        """Fails the queued and running jobs of a deleted thread; running ones are cancelled."""
+        for job in list(self.jobs.values()):
+            if job["thread_id"] != thread_id or job["status"] not in ("queued", "running"):
+                continue
+            job["error"] = f"Thread {thread_id} was deleted"
+            task = self.running.get(job["id"])
+            if task is not None:
+                task.cancel()  # _run records the failure
+                continue
+            job["status"] = "failed"
+            job["finished_at"] = time.time()
+            await self._save(job)
+            self.saves.pop(job["id"], None)
+            shutil.rmtree(os.path.join(self.uploads_dir, job["id"]), ignore_errors=True)
+            print(f"Ingest job {job['id']} failed: {job['error']}")
+
+    def get(self, job_id: str, user_id: int) -> Optional[Dict[str, Any]]:
+        job = self.jobs.get(job_id)
+        if job is None or job["user_id"] != user_id:
+            return None
+        return self.status(job)
+
+    def list_jobs(self, user_id: int) -> List[Dict[str, Any]]:
+        jobs = [job for job in self.jobs.values() if job["user_id"] == user_id]
+        return [self.status(job) for job in sorted(jobs, key=lambda job: job["created_at"], reverse=True)]
+
+    def status(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """Public view of a job, with a per-file ETA extrapolated from parse progress."""
+        files = []
+        for state in job["files"]:
+            eta = None
+            started = state.get("started_at")
+            if state["status"] == "running" and started and state["pages_total"] and state["pages_parsed"]:
+                elapsed = time.time() - started
+                eta = round(elapsed * (state["pages_total"] - state["pages_parsed"]) / state["pages_parsed"], 1)
+            files.append({
+                "filename": state["filename"],
+                "status": state["status"],
+                "pages_total": state["pages_total"],
+                "pages_parsed": state["pages_parsed"],
+                "chunks_embedded": state["chunks_embedded"],
+                "deduplicated": state.get("deduplicated", False),
+                "eta_seconds": eta,
+            })
+        return {key: job[key] for key in ("id", "thread_id", "status", "error", "created_at", "started_at", "finished_at", "chunks_count", "documents")} | {"files": files}
+
+    async def _worker(self):
+        while True:
+            job_id = await self.queue.get()
+            try:
+                if self.jobs[job_id]["status"] == "queued":
+                    await self._run(self.jobs[job_id])
+            finally:
+                self.queue.task_done()
+
+    async def _run(self, job: Dict[str, Any]):
+        job["status"] = "running"
+        job["started_at"] = job["started_at"] or time.time()
+        for state in job["files"]:
+            state.setdefault("started_at", time.time())
+        await self._save(job)
+        if job["status"] != "running":
+            return  # failed by fail_thread() meanwhile
+
+        # Saved after every stored batch, so a restart resumes exactly where it stopped
+        task = self.running[job["id"]] = asyncio.create_task(
+            ingest_files(job["files"], thread_id=job["thread_id"], on_progress=lambda: self._save(job))
+        )
+        try:
+            count, _ = await task
+            job["chunks_count"] = count
+            job["status"] = "completed"
+            print(f"Ingest job {job['id']} completed: {count} chunks")
+        except asyncio.CancelledError:
+            if not task.cancelled() or job["error"] is None:
+                raise  # shutting down: the job resumes on restart
+            job["status"] = "failed"
+            print(f"Ingest job {job['id']} failed: {job['error']}")
+        except Exception as e:
+            job["status"] = "failed"
+            job["error"] = str(e)
+            print(f"Ingest job {job['id']} failed: {e}")
+            import traceback
+            traceback.print_exc()
+        finally:
+            self.running.pop(job["id"], None)
+        job["finished_at"] = time.time()
+        await self._save(job)
+        self.saves.pop(job["id"], None)
+        shutil.rmtree(os.path.join(self.uploads_dir, job["id"]), ignore_errors=True)
+
+
+ingest_jobs = IngestJobQueue()
@@ -1,35 +1,118 @@
-from pdfminer.high_level import extract_pages
-from pdfminer.layout import LTTextContainer
-from typing import List, Dict, Any
+import hashlib
+from pdfminer.converter import PDFPageAggregator
+from pdfminer.layout import LAParams, LTTextContainer
+from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdftypes import PDFObjRef, PDFStream
+from typing import Dict, Any, Iterator, List, Optional, Iterable
 
-def process_pdf(file_path: str, filename: str, chunk_size: int = 800, overlap: int = 100) -> List[Dict[str, Any]]:
-    chunks = []
+from .chunker import chunk_spans
+from .dedup_registry import DedupRegistry
+
+def count_pages(file_path: str) -> int:
+    # Walks the page tree only; no content streams are parsed
+    with open(file_path, "rb") as f:
+        return sum(1 for _ in PDFPage.get_pages(f))
+
+def _object_digest(obj, cache: Dict[int, bytes], active: set) -> bytes:
+    """
+    Digest of a PDF object with every reference resolved, so it changes with
+    anything that can change the extracted text (encodings, ToUnicode maps, font
+    programs, form XObjects). `cache` holds digests by object id across the pages
+    of a document; `active` guards against reference cycles.
+    """
+    if isinstance(obj, PDFObjRef):
+        if obj.objid in cache:
+            return cache[obj.objid]
+        if obj.objid in active:
+            return b"cycle"
+        active.add(obj.objid)
+        digest = _object_digest(obj.resolve(), cache, active)
+        active.discard(obj.objid)
+        cache[obj.objid] = digest
+        return digest
+    digest = hashlib.sha256()
+    if isinstance(obj, PDFStream):
+        digest.update(b"stream")
+        digest.update(_object_digest(obj.attrs, cache, active))
+        # Raw bytes plus /Filter identify the data without decoding images; encrypted
+        # bytes depend on the document key, so those are hashed decrypted
+        encrypted_or_decoded = obj.decipher is not None or obj.rawdata is None
+        digest.update(obj.get_data() if encrypted_or_decoded else obj.rawdata)
+    elif isinstance(obj, dict):
+        digest.update(b"dict")
+        for key in sorted(obj, key=str):
+            digest.update(repr(key).encode())
+            digest.update(_object_digest(obj[key], cache, active))
+    elif isinstance(obj, (list, tuple)):
+        digest.update(b"array")
+        for item in obj:
+            digest.update(_object_digest(item, cache, active))
+    else:
+        digest.update(repr(obj).encode())  # names, numbers, strings
+    return digest.digest()
+
+def page_hash(page: PDFPage, cache: Optional[Dict[int, bytes]] = None) -> str:
+    """
+    Hash of a page's content streams and its resolved resource tree, computed
+    before layout analysis. Pass the same `cache` for pages of one document.
+    """
+    cache = cache if cache is not None else {}
+    digest = hashlib.sha256()
+    for stream in page.contents:
+        digest.update(_object_digest(stream, cache, set()))
+    digest.update(_object_digest(page.resources or {}, cache, set()))
+    return digest.hexdigest()
+
+def iter_page_texts(file_path: str, page_numbers: Optional[Iterable[int]] = None, registry: Optional[DedupRegistry] = None) -> Iterator[tuple]:
+    """
+    Yields (page_num, page_text) with 1-based page numbers. With a registry, pages
+    whose content and resources were seen before reuse the stored text instead of
+    running layout analysis again.
+    """
+    page_numbers = set(page_numbers) if page_numbers is not None else None
+    resource_manager = PDFResourceManager(caching=True)
+    device = PDFPageAggregator(resource_manager, laparams=LAParams())
+    interpreter = PDFPageInterpreter(resource_manager, device)
+    digests: Dict[int, bytes] = {}
+    with open(file_path, "rb") as f:
+        for index, page in enumerate(PDFPage.get_pages(f)):
+            if page_numbers is not None and index not in page_numbers:
+                continue
+            key = page_hash(page, digests) if registry else None
+            page_text = registry.get_page(key) if registry else None
+            if page_text is None:
+                interpreter.process_page(page)
+                page_text = "".join(
+                    element.get_text() for element in device.get_result() if isinstance(element, LTTextContainer)
+                )
+                if registry:
+                    registry.put_page(key, page_text)
+            yield index + 1, page_text
+
+def process_pdf(file_path: str, filename: str, chunk_size: int = 800, overlap: int = 0, page_numbers: Optional[Iterable[int]] = None, registry: Optional[DedupRegistry] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Yields chunks page by page, so callers can embed them as they arrive and never
+    hold the whole document's chunks at once. `page_numbers` (0-based) restricts
+    parsing to those pages; chunk ids then start at 0 for the first of them.
+    Chunks are (start, end) spans into their page's text, `chunk_size` and
+    `overlap` are in tokens; use chunker.chunk_text() to read one.
+    """
     chunk_id_counter = 0
     
-    for page_layout in extract_pages(file_path):
-        page_num = page_layout.pageid
-        page_text = ""
-        
-        for element in page_layout:
-            if isinstance(element, LTTextContainer):
-                page_text += element.get_text()
-                
-        # Simple chunking by characters (approx tokens) for now
-        # In a real app, use a proper tokenizer
-        text_len = len(page_text)
-        start = 0
-        while start < text_len:
-            end = min(start + chunk_size * 4, text_len) # approx 4 chars per token
-            chunk_text = page_text[start:end]
-            
-            chunks.append({
+    for page_num, page_text in iter_page_texts(file_path, page_numbers, registry):
+        for start, end in chunk_spans(page_text, chunk_size, overlap):
+            yield {
                 "doc_name": filename,
                 "page_num": page_num,
                 "chunk_id": chunk_id_counter,
-                "text": chunk_text
-            })
-            
+                "page_text": page_text,
+                "start": start,
+                "end": end
+            }
             chunk_id_counter += 1
-            start += (chunk_size - overlap) * 4
-            
-    return chunks
+
+def parse_page_range(file_path: str, filename: str, first_page: int, last_page: int, registry_path: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Process-pool entry point: chunks for pages [first_page, last_page)."""
+    registry = DedupRegistry(registry_path) if registry_path else None
+    return list(process_pdf(file_path, filename, page_numbers=range(first_page, last_page), registry=registry))
@@ -2,37 +2,184 @@ import os
 from typing import List
 from pdfminer.high_level import extract_text
 import os
-from typing import List, Tuple
+import asyncio
+import hashlib
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple, Dict, Any, AsyncIterator, Awaitable, Callable
 from pdfminer.high_level import extract_text
-from .ingestion import process_pdf
+from .ingestion import count_pages, parse_page_range
+from .answer_cache import answer_cache
+from . import metrics
 from fastapi import UploadFile
 
 # Simple in-memory storage for now, will replace with vector DB later
 CHUNKS_DB = []
 
-async def ingest_files(files: List[UploadFile], thread_id: int = None) -> Tuple[int, List[str]]:
+UPLOAD_CHUNK_SIZE = 1024 * 1024 # bytes read from the upload per await
+# Chunks handed to the vector store at a time while a PDF is still being parsed
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 100))
+# PDF layout analysis is CPU-bound pure Python, so it runs in worker processes
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", os.cpu_count() or 1))
+PAGES_PER_TASK = int(os.getenv("PARSE_PAGES_PER_TASK", 8))
+
+_parse_pool = None
+
+async def save_upload(file: UploadFile, directory: str = None) -> Tuple[str, str]:
+    """
+    Streams an upload to a unique file in fixed-size pieces. Returns its path and
+    the sha256 of its content, used to recognise documents ingested before.
+    """
+    digest = hashlib.sha256()
+    suffix = os.path.splitext(file.filename or "")[1]
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    fd, file_path = tempfile.mkstemp(prefix="upload_", suffix=suffix, dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while True:
+                piece = await file.read(UPLOAD_CHUNK_SIZE)
+                if not piece:
+                    break
+                digest.update(piece)
+                f.write(piece)
+    except Exception:
+        os.remove(file_path)
+        raise
+    return file_path, digest.hexdigest()
+
+def get_parse_pool() -> ProcessPoolExecutor:
+    global _parse_pool
+    if _parse_pool is None:
+        _parse_pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS)
+    return _parse_pool
+
+def shutdown_parse_pool():
+    global _parse_pool
+    if _parse_pool is not None:
+        _parse_pool.shutdown(cancel_futures=True)
+        _parse_pool = None
+
+async def iter_pdf_chunks(file_path: str, filename: str, state: Dict[str, Any] = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Parses page ranges of one PDF in the process pool and yields their chunks in
+    page order. Chunk ids are renumbered on the way out, so they match a
+    single-pass process_pdf regardless of how the pages were split. At most
+    PARSE_WORKERS * 2 ranges are in flight, which keeps memory bounded when
+    embedding is slower than parsing. `state["pages_total"/"pages_parsed"]` are
+    kept current for progress reporting.
+    """
+    from .vector_store import vector_store
+    state = state if state is not None else {}
+    loop = asyncio.get_running_loop()
+    pool = get_parse_pool()
+    n_pages = await loop.run_in_executor(pool, count_pages, file_path)
+    state["pages_total"] = n_pages
+    state["pages_parsed"] = 0
+    ranges = deque((start, min(start + PAGES_PER_TASK, n_pages)) for start in range(0, n_pages, PAGES_PER_TASK))
+    in_flight = deque()
+    chunk_id = 0
+    while ranges or in_flight:
+        while ranges and len(in_flight) < PARSE_WORKERS * 2:
+            first, last = ranges.popleft()
+            in_flight.append((last - first, loop.run_in_executor(pool, parse_page_range, file_path, filename, first, last, vector_store.dedup_registry.path)))
+        n_range_pages, future = in_flight.popleft()
+        chunks = await future
+        state["pages_parsed"] += n_range_pages
+        metrics.INGEST_PAGES.inc(n_range_pages)
+        for chunk in chunks:
+            chunk["chunk_id"] = chunk_id
+            chunk_id += 1
+            yield chunk
+
+async def ingest_file(file_path: str, filename: str, thread_id: int = None, state: Dict[str, Any] = None, on_progress: Callable[[], Awaitable[None]] = None) -> int:
+    """
+    Parses and embeds one PDF. `state["chunks_embedded"]` counts chunks already
+    stored; a resumed job skips that many (chunk ids are deterministic).
+    With `state["sha256"]`, a document already ingested into this thread is
+    skipped and one ingested into another thread is added by reference.
+    Returns the total number of chunks in the file.
+    """
+    from .vector_store import vector_store
+    registry = vector_store.dedup_registry
+    state = state if state is not None else {}
+    doc_hash = state.get("sha256")
+    already_embedded = state.get("chunks_embedded", 0)
+    state["chunks_embedded"] = already_embedded
+    state.setdefault("row_ids", [])
+
+    if doc_hash:
+        known = await asyncio.to_thread(registry.find_document, doc_hash)
+        # An ingest that finished after its thread was deleted can leave a stale entry
+        known = {t: rows for t, rows in known.items() if not any(vector_store.metadata.is_deleted(i) for i in rows)}
+        if thread_id in known:
+            print(f"{filename} already ingested into thread {thread_id}, skipping")
+            state["chunks_embedded"] = len(known[thread_id])
+            state["deduplicated"] = True
+            return len(known[thread_id])
+        if known:
+            source_rows = next(iter(known.values()))
+            state["row_ids"] = await asyncio.to_thread(vector_store.add_references, source_rows, thread_id, filename)
+            answer_cache.invalidate(thread_id)
+            await asyncio.to_thread(registry.add_document, doc_hash, thread_id, filename, state["row_ids"])
+            state["chunks_embedded"] = len(source_rows)
+            state["deduplicated"] = True
+            print(f"{filename} reused {len(source_rows)} chunks from an earlier upload")
+            return len(source_rows)
+
     total_chunks = 0
-    processed_files = []
-    
-    for file in files:
-        # Save temp file
-        file_path = f"temp_{file.filename}"
-        with open(file_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
-            
-        try:
-            # Process
-            chunks = process_pdf(file_path, file.filename)
-            
-            # Add to vector store with thread_id
-            from .vector_store import vector_store
-            vector_store.add_chunks(chunks, thread_id=thread_id)
-            
-            total_chunks += len(chunks)
-            processed_files.append(file.filename)
-        finally:
-            if os.path.exists(file_path):
-                os.remove(file_path)
-                
+
+    async def flush(batch):
+        state["row_ids"].extend(await asyncio.to_thread(vector_store.add_chunks, batch, thread_id))
+        # Answers computed before this batch was searchable are stale now
+        answer_cache.invalidate(thread_id)
+        state["chunks_embedded"] += len(batch)
+        metrics.INGEST_CHUNKS.inc(len(batch))
+        if on_progress:
+            await on_progress()
+
+    # Embed as ranges come back, in batches of INGEST_BATCH_SIZE, off the event loop
+    batch = []
+    async for chunk in iter_pdf_chunks(file_path, filename, state):
+        total_chunks += 1
+        if chunk["chunk_id"] < already_embedded:
+            continue
+        batch.append(chunk)
+        if len(batch) >= INGEST_BATCH_SIZE:
+            await flush(batch)
+            batch = []
+    if batch:
+        await flush(batch)
+    if doc_hash:
+        await asyncio.to_thread(registry.add_document, doc_hash, thread_id, filename, state["row_ids"])
+    return total_chunks
+
+async def ingest_files(files: List[Dict[str, Any]], thread_id: int = None, on_progress: Callable[[], Awaitable[None]] = None) -> Tuple[int, List[str]]:
+    """
+    Runs the parse/embed pipeline over already-saved uploads. Each entry of `files`
+    has "path" and "filename" and doubles as that file's progress state; entries
+    with status "completed" are skipped.
+    """
+    started = time.perf_counter()
+
+    async def run(state):
+        if state.get("status") == "completed":
+            return state["chunks_count"]
+        state["status"] = "running"
+        with metrics.INGEST_FILE_SECONDS.time():
+            state["chunks_count"] = await ingest_file(state["path"], state["filename"], thread_id=thread_id, state=state, on_progress=on_progress)
+        state["status"] = "completed"
+        if on_progress:
+            await on_progress()
+        return state["chunks_count"]
+
+    # Files are parsed and embedded concurrently; the pool bounds CPU use
+    counts = await asyncio.gather(*[run(state) for state in files])
+
+    total_chunks = sum(counts)
+    processed_files = [state["filename"] for state in files]
+    elapsed = time.perf_counter() - started
+    print(f"Ingested {total_chunks} chunks from {len(processed_files)} files in {elapsed:.2f}s ({total_chunks / max(elapsed, 1e-9):.1f} chunks/sec)")
     return total_chunks, processed_files
@@ -0,0 +1,283 @@
+import math
+import re
+from array import array
+from collections import Counter
+from typing import Container, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+TOKEN_RE = re.compile(r"\w+")
+
+# An index with, per partition, the doc ids to leave out of its results
+Excluded = Optional[Mapping[Optional[int], Container[int]]]
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+def _pairs(postings: array) -> np.ndarray:
+    """(n, 2) view of interleaved (doc_id, tf) postings; only valid until the array grows."""
+    return np.frombuffer(postings, dtype=np.int32).reshape(-1, 2)
+
+
+def _as_array(excluded: Container[int]) -> Optional[np.ndarray]:
+    if excluded is None or not len(excluded):
+        return None
+    if isinstance(excluded, np.ndarray):
+        return excluded
+    return np.fromiter(excluded, dtype=np.int32, count=len(excluded))
+
+
+class _Partition:
+    """Postings for the chunks of a single thread (or the global docs, key None)."""
+
+    def __init__(self):
+        # token -> array('i') of interleaved doc_id, tf pairs. Rows are only ever
+        # appended, so doc ids in a posting list are ascending.
+        self.postings: Dict[str, array] = {}
+        self.docs = array("i")
+        self.total_length = 0
+
+
+class KeywordIndex:
+    """
+    Inverted index with BM25 scoring. Doc ids are positions in VectorStore.metadata,
+    so results can be resolved back to chunks without storing the text twice.
+    Postings are flat int32 arrays (8 bytes a posting) scored with NumPy; search()
+    skips most of the long posting lists of common terms with MaxScore pruning.
+
+    An index covers doc ids from `base` on. The module-level search() and
+    matching() treat several indexes over consecutive id ranges as one.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, base: int = 0):
+        self.k1 = k1
+        self.b = b
+        self.base = base
+        self.partitions: Dict[Optional[int], _Partition] = {}
+        self.doc_lengths = array("i")  # token count by doc id - base, -1 for ids never added
+
+    def __len__(self) -> int:
+        return sum(len(p.docs) for p in self.partitions.values())
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__dict__.setdefault("base", 0)
+        if "doc_lengths" in state:
+            return
+        # Pickled before postings were arrays: [(doc_id, tf)] lists and a length dict per partition
+        self.doc_lengths = array("i")
+        for partition in self.partitions.values():
+            lengths = partition.__dict__.pop("doc_lengths")
+            for doc_id, length in lengths.items():
+                self._set_length(doc_id, length)
+            partition.docs = array("i", sorted(lengths))
+            partition.postings = {
+                token: array("i", [value for posting in sorted(postings) for value in posting])
+                for token, postings in partition.postings.items()
+            }
+
+    def _set_length(self, doc_id: int, length: int):
+        offset = doc_id - self.base
+        if offset >= len(self.doc_lengths):
+            self.doc_lengths.extend(array("i", [-1]) * (offset + 1 - len(self.doc_lengths)))
+        self.doc_lengths[offset] = length
+
+    def add(self, doc_id: int, text: str, thread_id: Optional[int] = None):
+        partition = self.partitions.get(thread_id)
+        if partition is None:
+            partition = self.partitions[thread_id] = _Partition()
+
+        tokens = tokenize(text)
+        for token, tf in Counter(tokens).items():
+            postings = partition.postings.get(token)
+            if postings is None:
+                postings = partition.postings[token] = array("i")
+            postings.append(doc_id)
+            postings.append(tf)
+        partition.docs.append(doc_id)
+        partition.total_length += len(tokens)
+        self._set_length(doc_id, len(tokens))
+
+    def drop(self, thread_id: Optional[int]):
+        self.partitions.pop(thread_id, None)
+
+    def without(self, thread_id: Optional[int]) -> "KeywordIndex":
+        """Copy minus one partition; shares everything else, so only for indexes no longer written to."""
+        copy = KeywordIndex.__new__(KeywordIndex)
+        copy.__dict__.update(self.__dict__)
+        copy.partitions = {key: partition for key, partition in self.partitions.items() if key != thread_id}
+        return copy
+
+    def matching(self, terms: Iterable[str], thread_ids: Optional[Iterable[Optional[int]]] = None,
+                 exclude: Excluded = None) -> List[int]:
+        return matching([(self, exclude)], terms, thread_ids)
+
+    def search(self, query: str, k: int = 10, thread_ids: Optional[Iterable[Optional[int]]] = None,
+               exclude: Excluded = None) -> List[Tuple[int, float]]:
+        return search([(self, exclude)], query, k, thread_ids)
+
+
+def _partitions(indexes: Sequence[Tuple[KeywordIndex, Excluded]], thread_ids):
+    """(index, partition, excluded doc ids) for every partition searched."""
+    found = []
+    for index, exclude in indexes:
+        keys = index.partitions.keys() if thread_ids is None else [t for t in thread_ids if t in index.partitions]
+        for key in keys:
+            found.append((index, index.partitions[key], _as_array(exclude.get(key)) if exclude else None))
+    return found
+
+
+def matching(indexes: Sequence[Tuple[KeywordIndex, Excluded]], terms: Iterable[str],
+             thread_ids: Optional[Iterable[Optional[int]]] = None) -> List[int]:
+    """Every doc id containing any of `terms`, unranked. `thread_ids=None` searches every partition."""
+    if thread_ids is not None:
+        thread_ids = list(thread_ids)
+    partitions = _partitions(indexes, thread_ids)
+    found = []
+    for term in {token for term in terms for token in tokenize(term)}:
+        for _, partition, excluded in partitions:
+            postings = partition.postings.get(term)
+            if postings is None:
+                continue
+            docs = _pairs(postings)[:, 0]
+            found.append(docs if excluded is None else docs[~np.isin(docs, excluded)])
+    if not found:
+        return []
+    return np.unique(np.concatenate(found)).tolist()
+
+
+def search(indexes: Sequence[Tuple[KeywordIndex, Excluded]], query: str, k: int = 10,
+           thread_ids: Optional[Iterable[Optional[int]]] = None) -> List[Tuple[int, float]]:
+    """
+    Returns the top-k (doc_id, bm25_score) pairs over `indexes`, best first.
+    `thread_ids=None` searches every partition. Each index comes with a map of
+    partition -> doc ids to leave out (deleted but not yet removed); those still
+    count towards the BM25 statistics until they are.
+
+    Terms are scored rarest first. Once the k-th best score so far beats what all
+    the remaining terms together could add (MaxScore), no new doc can make the
+    top k, so the remaining, longer posting lists are only probed (binary search)
+    for the docs already in the running.
+    """
+    if thread_ids is not None:
+        thread_ids = list(thread_ids)
+    partitions = _partitions(indexes, thread_ids)
+    if not partitions or k <= 0:
+        return []
+    k1, b = partitions[0][0].k1, partitions[0][0].b
+
+    n_docs = sum(len(p.docs) for _, p, _ in partitions)
+    if n_docs == 0:
+        return []
+    avg_length = sum(p.total_length for _, p, _ in partitions) / n_docs
+
+    def bm25(idf, tfs, lengths):
+        return idf * tfs * (k1 + 1) / (tfs + k1 * (1 - b + b * lengths / avg_length))
+
+    lengths_of = {}
+    terms = []  # (upper bound, idf, [(doc ids, tfs, doc lengths, base, excluded) per partition])
+    for term in set(tokenize(query)):
+        lists = []
+        for index, partition, excluded in partitions:
+            postings = partition.postings.get(term)
+            if postings is None:
+                continue
+            if id(index) not in lengths_of:
+                lengths_of[id(index)] = np.frombuffer(index.doc_lengths, dtype=np.int32)
+            pairs = _pairs(postings)
+            lists.append((pairs[:, 0], pairs[:, 1], lengths_of[id(index)], index.base, excluded))
+        df = sum(len(item[0]) for item in lists)
+        if df == 0:
+            continue
+        idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+        # Best this term can score: its highest tf in the shortest possible doc
+        max_tf = max(int(item[1].max()) for item in lists)
+        bound = idf * max_tf * (k1 + 1) / (max_tf + k1 * (1 - b))
+        terms.append((bound, idf, lists))
+    if not terms:
+        return []
+    terms.sort(key=lambda term: term[0], reverse=True)
+    # remaining[i]: the most terms i.. can still add to a doc's score
+    remaining = np.cumsum([bound for bound, _, _ in reversed(terms)])[::-1].tolist() + [0.0]
+
+    docs = np.empty(0, dtype=np.int32)
+    scores = np.empty(0, dtype=np.float64)
+    threshold = 0.0
+    for i, (_, idf, lists) in enumerate(terms):
+        if len(docs) >= k and remaining[i] < threshold:
+            for term_docs, tfs, lengths, base, _ in lists:
+                # docs is sorted: only probe those inside the list's id range (other runs never match)
+                lo = np.searchsorted(docs, term_docs[0])
+                hi = np.searchsorted(docs, term_docs[-1], side="right")
+                if lo >= hi:
+                    continue
+                window = docs[lo:hi]
+                pos = np.searchsorted(term_docs, window)
+                hit = term_docs[pos] == window
+                if hit.any():
+                    scores[lo:hi][hit] += bm25(idf, tfs[pos[hit]], lengths[window[hit] - base])
+        else:
+            new_docs, new_scores = [], []
+            for term_docs, tfs, lengths, base, excluded in lists:
+                if excluded is not None:
+                    live = ~np.isin(term_docs, excluded)
+                    term_docs, tfs = term_docs[live], tfs[live]
+                new_docs.append(term_docs)
+                new_scores.append(bm25(idf, tfs, lengths[term_docs - base]))
+            docs, inverse = np.unique(np.concatenate([docs] + new_docs), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate([scores] + new_scores), minlength=len(docs))
+
+        if len(docs) >= k:
+            threshold = float(np.partition(scores, len(scores) - k)[len(scores) - k])
+            # Docs that cannot reach the current k-th best even with every remaining term
+            keep = scores + remaining[i + 1] >= threshold
+            docs, scores = docs[keep], scores[keep]
+
+    top = np.argsort(-scores, kind="stable")[:k]
+    return [(int(doc_id), float(score)) for doc_id, score in zip(docs[top], scores[top])]
+
+
+def merge(indexes: Sequence[Tuple[KeywordIndex, Excluded]], base: int, end: int) -> KeywordIndex:
+    """
+    One index over doc ids [base, end) holding the docs of `indexes` (consecutive
+    id ranges, in order) minus the excluded ones. Postings are concatenated, never
+    re-tokenized.
+    """
+    first = indexes[0][0]
+    merged = KeywordIndex(first.k1, first.b, base=base)
+    lengths = np.full(end - base, -1, dtype=np.int32)
+    for index, _ in indexes:
+        own = np.frombuffer(index.doc_lengths, dtype=np.int32)
+        lengths[index.base - base:index.base - base + len(own)] = own
+
+    keys = list(dict.fromkeys(key for index, _ in indexes for key in index.partitions))
+    for key in keys:
+        parts = [(index.partitions[key], _as_array(exclude.get(key)) if exclude else None)
+                 for index, exclude in indexes if key in index.partitions]
+        docs = []
+        for partition, excluded in parts:
+            own = np.frombuffer(partition.docs, dtype=np.int32)
+            docs.append(own if excluded is None else own[~np.isin(own, excluded)])
+            if excluded is not None:
+                lengths[excluded - base] = -1
+        docs = np.concatenate(docs)
+        if not len(docs):
+            continue
+        partition = merged.partitions[key] = _Partition()
+        partition.docs = array("i", docs.tobytes())
+        partition.total_length = int(lengths[docs - base].sum())
+        for token in dict.fromkeys(token for part, _ in parts for token in part.postings):
+            pairs = []
+            for part, excluded in parts:
+                postings = part.postings.get(token)
+                if postings is None:
+                    continue
+                own = _pairs(postings)
+                pairs.append(own if excluded is None else own[~np.isin(own[:, 0], excluded)])
+            pairs = np.concatenate(pairs)
+            if len(pairs):
+                partition.postings[token] = array("i", pairs.tobytes())
+    merged.doc_lengths = array("i", lengths.tobytes())
+    return merged
@@ -0,0 +1,56 @@
+import asyncio
+import os
+import random
+import time
+from typing import AsyncIterator
+
+import google.generativeai as genai
+
+from . import metrics
+from .chunker import count_tokens
+
+# Configure Gemini
+genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+model = genai.GenerativeModel(os.getenv("GEMINI_MODEL_NAME", "gemini-1.5-flash"))
+
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 3))
+LLM_BASE_DELAY = 2
+
+
+def is_quota_error(e: Exception) -> bool:
+    return "429" in str(e) or "quota" in str(e).lower() or "resource exhausted" in str(e).lower()
+
+
+async def _with_retry(call, label: str):
+    """Awaits call() with exponential backoff on quota errors, without blocking the loop."""
+    for attempt in range(LLM_MAX_RETRIES):
+        try:
+            return await call()
+        except Exception as e:
+            if is_quota_error(e) and attempt < LLM_MAX_RETRIES - 1:
+                sleep_time = LLM_BASE_DELAY * (2 ** attempt) * (1 + random.random())
+                print(f"Quota exceeded ({label}), retrying in {sleep_time:.1f}s...")
+                metrics.LLM_RETRIES.inc(call=label)
+                await asyncio.sleep(sleep_time)
+                continue
+            raise
+
+
+async def stream_generate(prompt: str) -> AsyncIterator[str]:
+    """Yields text pieces from Gemini's native async streaming API."""
+    started = time.perf_counter()
+    first = True
+    response = await _with_retry(lambda: model.generate_content_async(prompt, stream=True), "stream")
+    async for chunk in response:
+        if chunk.text:
+            if first:
+                metrics.LLM_TTFT_SECONDS.observe(time.perf_counter() - started)
+                first = False
+            metrics.LLM_TOKENS.inc(count_tokens(chunk.text))
+            yield chunk.text
+    metrics.LLM_STREAM_SECONDS.observe(time.perf_counter() - started)
+
+
+async def generate(prompt: str) -> str:
+    response = await _with_retry(lambda: model.generate_content_async(prompt), "generate")
+    return response.text
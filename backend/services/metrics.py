@@ -0,0 +1,189 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Sequence, Tuple
+
+# Seconds; wide enough for FAISS lookups (sub-ms) up to LLM calls and retries (tens of s)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Tuple[str, str] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        return "\n".join(lines + self.samples())
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.values: Dict[Tuple[str, ...], float] = {}
+        if not self.labelnames:
+            self.values[()] = 0.0
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        with self.lock:
+            items = sorted(self.values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.values: Dict[Tuple[str, ...], List[float]] = {}  # per-bucket counts, then +Inf count, then sum
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = [0.0] * (len(self.buckets) + 2)
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self) -> List[str]:
+        with self.lock:
+            items = sorted((key, list(counts)) for key, counts in self.values.items())
+        lines = []
+        for key, counts in items:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (float("inf"),), counts[:-1]):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {_format_value(cumulative)}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(counts[-1])}")
+            lines.append(f"{self.name}_count{labels} {_format_value(cumulative)}")
+        return lines
+
+
+class Registry:
+    """Process-wide metrics, rendered in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self.metrics: Dict[str, _Metric] = {}
+        self.lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self.lock:
+            if metric.name in self.metrics:
+                raise ValueError(f"Metric {metric.name} already registered")
+            self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+registry = Registry()
+
+# Embedding
+EMBEDDING_SECONDS = registry.histogram("embedding_request_seconds", "Latency of one embedding API call.", ["task"])
+EMBEDDING_BATCH_SIZE = registry.histogram(
+    "embedding_batch_size", "Texts per document embedding call.", buckets=(1, 5, 10, 25, 50, 75, 100, 250)
+)
+EMBEDDING_RETRIES = registry.counter("embedding_retries_total", "Embedding calls retried after a 429/quota error.", ["task"])
+EMBEDDING_CACHE = registry.counter("embedding_cache_lookups_total", "Embedding cache lookups by result.", ["result"])
+
+# Retrieval
+FAISS_SEARCH_SECONDS = registry.histogram("faiss_search_seconds", "FAISS search over the visible partitions.")
+KEYWORD_SEARCH_SECONDS = registry.histogram("keyword_search_seconds", "BM25 keyword search.")
+
+# LLM
+LLM_TTFT_SECONDS = registry.histogram("llm_time_to_first_token_seconds", "From starting a streamed generation to its first text.")
+LLM_STREAM_SECONDS = registry.histogram("llm_stream_seconds", "Full duration of a streamed generation.")
+LLM_TOKENS = registry.counter("llm_tokens_streamed_total", "Approximate tokens streamed from the LLM.")
+LLM_RETRIES = registry.counter("llm_retries_total", "LLM calls retried after a 429/quota error.", ["call"])
+ANSWER_CACHE = registry.counter("answer_cache_lookups_total", "Answer cache lookups by result.", ["result"])
+
+# Ingestion (use rate() for pages/chunks per second)
+INGEST_PAGES = registry.counter("ingest_pages_total", "PDF pages parsed.")
+INGEST_CHUNKS = registry.counter("ingest_chunks_total", "Chunks embedded and stored.")
+INGEST_FILE_SECONDS = registry.histogram("ingest_file_seconds", "Time to parse and embed one uploaded file.", buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600))
+
+# API
+AUTH_CACHE = registry.counter("auth_cache_lookups_total", "Authenticated-user cache lookups by result.", ["result"])
+DB_SESSION_SECONDS = registry.histogram("db_session_seconds", "Lifetime of a request's database session.")
+QUERY_IN_FLIGHT = registry.gauge("query_in_flight", "/query requests currently being answered.")
@@ -0,0 +1,44 @@
+import base64
+from datetime import datetime
+from typing import Optional, Tuple
+
+from sqlalchemy import tuple_
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    """Opaque page token for the (created_at, id) keyset."""
+    raw = f"{created_at.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        created_at, row_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except Exception as e:
+        raise InvalidCursor(f"Invalid cursor {cursor!r}") from e
+
+
+def keyset_page(query, created_at_column, id_column, cursor: Optional[str], limit: int):
+    """
+    Newest-first page of `query` strictly older than `cursor`. Fetches one extra
+    row to know whether another page exists; pass that to `next_cursor`.
+    Seeks with a row-value comparison, so a (..., created_at, id) index serves
+    every page at the same cost instead of scanning past an OFFSET.
+    """
+    if cursor:
+        query = query.where(tuple_(created_at_column, id_column) < decode_cursor(cursor))
+    return query.order_by(created_at_column.desc(), id_column.desc()).limit(limit + 1)
+
+
+def next_cursor(rows, limit: int) -> Optional[str]:
+    """Drops the look-ahead row from `rows` and returns the token for the next page."""
+    if len(rows) <= limit:
+        return None
+    del rows[limit:]
+    return encode_cursor(rows[-1].created_at, rows[-1].id)
@@ -1,47 +1,49 @@
-from typing import List, Dict, Any
+import time
+from typing import List, Dict, Any, Optional
 from services.vector_store import vector_store
-import re
+from services import metrics
 
-def keyword_search(query: str, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+KEYWORD_WEIGHT = 0.1 # Weight keyword matches lower than vector similarity usually
+
+def keyword_search(query: str, k: int = 10, thread_id: int = None) -> List[Dict[str, Any]]:
     """
-    Simple keyword search that looks for exact matches of query terms in chunks.
+    BM25 search over the inverted index that VectorStore keeps up to date.
+    Matches whole tokens only, so "door" no longer matches inside "outdoor".
     """
-    query_terms = set(re.findall(r'\w+', query.lower()))
+    # Strict isolation: a thread only sees its own partition
+    thread_ids = [thread_id] if thread_id else None
     results = []
-    
-    for chunk in chunks:
-        chunk_text = chunk["text"].lower()
-        score = 0
-        for term in query_terms:
-            if term in chunk_text:
-                score += 1
-        
-        if score > 0:
-            item = chunk.copy()
-            item["score"] = score * 0.1 # Weight keyword matches lower than vector similarity usually
-            results.append(item)
-            
-    return sorted(results, key=lambda x: x["score"], reverse=True)
+    with metrics.KEYWORD_SEARCH_SECONDS.time():
+        hits = vector_store.keyword_search(query, k=k, thread_ids=thread_ids)
+    for doc_id, score in hits:
+        item = vector_store.metadata[doc_id]
+        item["score"] = score * KEYWORD_WEIGHT
+        results.append(item)
+    return results
+
+def hybrid_search(query: str, k: int = 5, thread_id: int = None, query_embedding: Optional[List[float]] = None, timings: Optional[Dict[str, float]] = None) -> List[Dict[str, Any]]:
+    """`timings`, if given, receives the seconds spent in each stage."""
+    timings = timings if timings is not None else {}
 
-def hybrid_search(query: str, k: int = 5, thread_id: int = None) -> List[Dict[str, Any]]:
     # 1. Vector Search
     vector_results = []
     try:
+        if query_embedding is None:
+            stage = time.perf_counter()
+            query_embedding = vector_store.embed_query(query)
+            timings["embedding"] = time.perf_counter() - stage
         # Pass thread_id to filter vector search
-        vector_results = vector_store.search(query, k=k*2, filter_thread_id=thread_id) 
+        stage = time.perf_counter()
+        vector_results = vector_store.search(query, k=k*2, filter_thread_id=thread_id, query_embedding=query_embedding)
+        timings["vector_search"] = time.perf_counter() - stage
     except Exception as e:
         print(f"Vector search failed (likely quota): {e}. Falling back to keyword search.")
         vector_results = []
     
-    # 2. Keyword Search (on all metadata in memory - simple version)
-    # Filter metadata by thread_id first if provided
-    all_chunks = vector_store.metadata
-    if thread_id:
-        # Strict isolation: only chunks with matching thread_id
-        # Or allow global (None)? User said "only on that specific thread".
-        all_chunks = [c for c in all_chunks if c.get("thread_id") == thread_id]
-        
-    keyword_results = keyword_search(query, all_chunks)
+    # 2. Keyword Search (inverted index, partitioned by thread_id)
+    stage = time.perf_counter()
+    keyword_results = keyword_search(query, k=k*2, thread_id=thread_id)
+    timings["keyword_search"] = time.perf_counter() - stage
     
     # 3. Merge and Rerank
     # Normalize scores? For now, just prefer vector results but boost if keyword match exists
@@ -53,7 +55,7 @@ def hybrid_search(query: str, k: int = 5, thread_id: int = None) -> List[Dict[st
         combined_results[key] = res
         combined_results[key]["final_score"] = res["score"]
         
-    for res in keyword_results[:k*2]:
+    for res in keyword_results:
         key = f"{res['doc_name']}_{res['chunk_id']}"
         if key in combined_results:
             combined_results[key]["final_score"] += res["score"]
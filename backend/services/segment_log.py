@@ -0,0 +1,58 @@
+import os
+import pickle
+from typing import Any, Dict, Iterator, List, Tuple
+
+
+def atomic_write(path: str, data: bytes):
+    """Write-to-temp, fsync, rename: readers see either the old file or the new one."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class SegmentLog:
+    """
+    Append-only log of VectorStore mutations, one small file per write. Segments
+    carry a monotonically increasing sequence number so startup can replay whatever
+    the last snapshot does not cover yet.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        segments = self.segments()
+        self.last_seq = segments[-1][0] if segments else 0
+
+    def _path(self, seq: int) -> str:
+        return os.path.join(self.directory, f"seg-{seq:010d}.pkl")
+
+    def segments(self) -> List[Tuple[int, str]]:
+        if not os.path.isdir(self.directory):
+            return []
+        found = []
+        for filename in os.listdir(self.directory):
+            if filename.startswith("seg-") and filename.endswith(".pkl"):
+                found.append((int(filename[4:-4]), os.path.join(self.directory, filename)))
+        return sorted(found)
+
+    def append(self, record: Dict[str, Any]) -> int:
+        os.makedirs(self.directory, exist_ok=True)
+        seq = self.last_seq + 1
+        atomic_write(self._path(seq), pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL))
+        self.last_seq = seq
+        return seq
+
+    def replay(self, after_seq: int = 0) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        for seq, path in self.segments():
+            if seq <= after_seq:
+                continue
+            with open(path, "rb") as f:
+                yield seq, pickle.load(f)
+
+    def truncate(self, upto_seq: int):
+        """Drops segments already folded into a snapshot."""
+        for seq, path in self.segments():
+            if seq <= upto_seq:
+                os.remove(path)
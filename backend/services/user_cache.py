@@ -0,0 +1,89 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from typing import Dict, Optional, Set, Tuple
+
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", 10000))
+# Seconds a validated token is trusted without looking its user up again
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", 60))
+
+
+@dataclass(frozen=True)
+class Principal:
+    """The authenticated user as request handlers see it; detached from any DB session."""
+    id: int
+    email: str
+
+
+def token_key(token: str) -> str:
+    # Raw bearer tokens are never kept in memory
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class UserCache:
+    """
+    LRU of token hash -> Principal. An entry lives for AUTH_CACHE_TTL but never
+    past the token's own exp, so a hit needs neither the JWT decode nor the DB.
+    Tokens are indexed by user email (the JWT subject) for invalidation.
+    """
+
+    def __init__(self, max_items: int = AUTH_CACHE_SIZE, ttl: float = AUTH_CACHE_TTL):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.entries: "OrderedDict[str, Tuple[Principal, float]]" = OrderedDict()
+        self.keys_by_email: Dict[str, Set[str]] = defaultdict(set)
+        self.generations: Dict[str, int] = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[Principal]:
+        key = token_key(token)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            principal, expires_at = entry
+            if time.time() >= expires_at:
+                self._drop(key)
+                return None
+            self.entries.move_to_end(key)
+            return principal
+
+    def generation(self, email: str) -> int:
+        """Read before looking the user up; put() discards the result if it changed meanwhile."""
+        with self.lock:
+            return self.generations[email]
+
+    def put(self, token: str, principal: Principal, token_exp: Optional[float], generation: int):
+        expires_at = time.time() + self.ttl
+        if token_exp is not None:
+            expires_at = min(expires_at, token_exp)
+        key = token_key(token)
+        with self.lock:
+            if generation != self.generations[principal.email]:
+                return  # the user changed while it was being looked up
+            self.entries[key] = (principal, expires_at)
+            self.entries.move_to_end(key)
+            self.keys_by_email[principal.email].add(key)
+            while len(self.entries) > self.max_items:
+                self._drop(next(iter(self.entries)))
+
+    def _drop(self, key: str):
+        principal, _ = self.entries.pop(key)
+        keys = self.keys_by_email.get(principal.email)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.keys_by_email[principal.email]
+
+    def invalidate_user(self, email: str):
+        """Call after a user is created, changed or deleted."""
+        with self.lock:
+            self.generations[email] += 1
+            for key in self.keys_by_email.pop(email, ()):
+                self.entries.pop(key, None)
+
+
+user_cache = UserCache()
@@ -1,106 +1,686 @@
 import os
-import google.generativeai as genai
 import faiss
 import numpy as np
 import pickle
-from typing import List, Dict, Any
+import json
+import shutil
+import threading
+import heapq
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Iterable, Optional, Sequence, Set, Tuple
 
-# Configure Gemini
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+from . import keyword_index
+from .keyword_index import KeywordIndex
+from . import ann_index
+from .embedding_cache import EmbeddingCache
+from .segment_log import SegmentLog, atomic_write
+from .chunk_store import ChunkStore
+from .chunker import chunk_text
+from .dedup_registry import DedupRegistry
+from .embedders import GEMINI_EMBEDDING_MODEL, Embedder, embedder_for, get_embedder
+from .index_run import Run, Tail, merge_runs, read_partitions, reconcile, reembed_run
+from .answer_cache import answer_cache
+from . import metrics
+
+# Gemini accepts at most 100 texts per batch embed request
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 100))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", 4))
+# The tail is sealed into a run once this many writes are waiting in the log
+SEGMENT_MERGE_THRESHOLD = int(os.getenv("SEGMENT_MERGE_THRESHOLD", 16))
+# Runs in the same size tier are merged this many at a time, up to RUN_MAX_ROWS rows
+RUN_MERGE_FACTOR = int(os.getenv("RUN_MERGE_FACTOR", 4))
+RUN_MAX_ROWS = int(os.getenv("RUN_MAX_ROWS", 1_000_000))
+RUN_BASE_ROWS = 1000 # Runs up to this many rows are all in the lowest tier
+# A run is rebuilt without its deleted chunks once they make up this share of it
+COMPACTION_DEAD_RATIO = float(os.getenv("COMPACTION_DEAD_RATIO", 0.2))
+LEGACY_EMBEDDER = GEMINI_EMBEDDING_MODEL # Data written before the embedder was recorded
+# Seconds before a failed re-embed (quota, network) picks up again
+REEMBED_RETRY_SECONDS = float(os.getenv("REEMBED_RETRY_SECONDS", 30))
+
+class ThreadDeletedError(ValueError):
+    pass
 
 class VectorStore:
-    def __init__(self, index_path: str = "data/vectors.index", metadata_path: str = "data/metadata.pkl"):
-        self.index_path = index_path
-        self.metadata_path = metadata_path
-        self.dimension = 768 # Gemini embedding dimension
-        self.index = None
-        self.metadata = []
-        
+    """
+    On-disk layout under data_dir:
+      runs/run-<n>/           immutable slice of rows: FAISS partitions, keyword postings, chunk columns
+      segments/seg-<seq>.pkl  append-only writes the runs do not cover yet
+      deleted-<n>.bin         deleted flags of the rows in runs, one bit each
+      chunks.blob             append-only chunk text, shared by every run
+      manifest.json           current runs and flags, and the last segment they cover
+    Writes append a segment and go into an in-memory tail. Once
+    SEGMENT_MERGE_THRESHOLD segments have piled up, a background thread seals the
+    tail into a run and writes just that run. Runs of a similar size are merged
+    RUN_MERGE_FACTOR at a time, so each row is rewritten a logarithmic number of
+    times instead of on every merge. A run never changes once built: searches read
+    runs without locks, and only the tail is behind a read-write lock.
+
+    Every run records the embedder that produced its vectors. If that is not the
+    configured one, a background thread re-embeds the runs one at a time from the
+    stored chunk text (runs/ plus "reembedded" in the manifest, so a restart
+    resumes) while searches and new writes keep using the old embedder; merges
+    wait. Once every run is converted, writes switch over, then the whole view.
+
+    Deleting a thread drops its partitions outright, and later adds to it are
+    refused (an ingest still running for it would bring them back). Deleting a
+    document flags its rows and tombstones their ids, which searches skip; a run is
+    rebuilt in the background once COMPACTION_DEAD_RATIO of it is dead. Row ids
+    never change.
+    """
+
+    def __init__(self, data_dir: str = "data", embedder: Optional[Embedder] = None):
+        self.data_dir = data_dir
+        self.runs_dir = os.path.join(data_dir, "runs")
+        self.snapshots_dir = os.path.join(data_dir, "snapshots") # Layout before runs
+        self.manifest_path = os.path.join(data_dir, "manifest.json")
+        self.segment_log = SegmentLog(os.path.join(data_dir, "segments"))
+        # EMBEDDING_PROVIDER: Gemini (remote) or the local hashing embedder
+        self.embedder = embedder or get_embedder()
+        # What the served runs and the tail were embedded with; the configured embedder
+        # unless a re-embed is under way (None if the old one is unavailable here)
+        self.query_embedder: Optional[Embedder] = self.embedder
+        self.write_embedder: Optional[Embedder] = self.embedder
+        self.reembedding = False
+        self.reembedded: Dict[str, Tuple[Run, Run]] = {} # run name -> (run as converted, re-embedded copy)
+        self.reembed_thread = None
+        self.metadata = ChunkStore(os.path.join(data_dir, "chunks.blob"))
+        # (runs, tail), replaced as a whole so a search always sees a matching pair.
+        # Each holds one index per thread_id (None = global docs); ids are row numbers in metadata.
+        self.view: Tuple[Tuple[Run, ...], Tail] = ((), Tail(0, self.embedder.name))
+        self.embedding_cache = EmbeddingCache(
+            os.path.join(data_dir, "embeddings.sqlite"), max_memory_items=int(os.getenv("EMBEDDING_CACHE_SIZE", 10000))
+        )
+        self.dedup_registry = DedupRegistry(os.path.join(data_dir, "dedup.sqlite"))
+        self.snapshot_seq = 0 # Last segment covered by the manifest
+        self.sealed_seq = 0 # Last segment covered by the runs in memory
+        self.next_name = 1
+        self.deleted_file = None
+        self.deleted_end = 0 # Rows the deleted flags file covers
+        self.deletes_dirty = False
+        self.deleted_threads: Set[int] = set()
+        # Serialises writers and view swaps; searches never take it
+        self.lock = threading.RLock()
+        self.maintenance_lock = threading.Lock()
+        self.maintenance_thread = None
+
         self.load_index()
 
+    @property
+    def ntotal(self) -> int:
+        runs, tail = self.view
+        return sum(index.ntotal for holder in runs + (tail,) for index in holder.partitions.values())
+
+    def _apply_add(self, thread_id: Optional[int], vectors: Optional[np.ndarray], rows: Dict[str, list], texts: List[str] = None):
+        start_id = len(self.metadata)
+        self.metadata.extend(rows)
+        end_id = len(self.metadata)
+        if texts is None:
+            # Replay has no texts in hand; read them back from the blob
+            texts = [self.metadata.text(doc_id) for doc_id in range(start_id, end_id)]
+        tail = self.view[1]
+        with tail.rw.write():
+            tail.add(thread_id, vectors, np.arange(start_id, end_id, dtype="int64"), texts)
+
+    def _apply_delete(self, thread_id: Optional[int], doc_name: Optional[str], row_ids: List[int]):
+        self.metadata.mark_deleted(row_ids)
+        self.deletes_dirty = True
+        runs, tail = self.view
+        if doc_name is None:
+            # The whole thread: nothing else lives in its partitions
+            if thread_id is not None:
+                self.deleted_threads.add(thread_id)
+            runs = tuple(run.without(thread_id) for run in runs)
+            with tail.rw.write():
+                tail.drop(thread_id)
+        elif row_ids:
+            ids = np.unique(np.array(row_ids, dtype=np.int32))
+            runs = tuple(
+                run.with_tombstones(thread_id, ids[(ids >= run.start) & (ids < run.end)])
+                if ((ids >= run.start) & (ids < run.end)).any() else run
+                for run in runs
+            )
+            if (ids >= tail.start).any():
+                tail.add_tombstones(thread_id, ids[ids >= tail.start])
+        self.view = (runs, tail)
+
     def load_index(self):
-        if os.path.exists(self.index_path) and os.path.exists(self.metadata_path):
-            self.index = faiss.read_index(self.index_path)
-            with open(self.metadata_path, "rb") as f:
-                self.metadata = pickle.load(f)
+        self.metadata = ChunkStore(self.metadata.blob_path)
+        self.snapshot_seq = 0
+        self.deleted_file = None
+        self.deleted_end = 0
+        self.deletes_dirty = False
+        self.deleted_threads = set()
+        runs: List[Run] = []
+        manifest = None
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+
+        if manifest and "runs" in manifest:
+            for name in manifest["runs"]:
+                run, chunk_state = Run.read(self.runs_dir, name)
+                self.metadata.extend_state(chunk_state)
+                runs.append(run)
+            self.snapshot_seq = manifest["seq"]
+            self.next_name = manifest["next_name"]
+            self.deleted_file = manifest.get("deleted")
+            self.deleted_threads = set(manifest.get("deleted_threads", []))
+            if self.deleted_file:
+                with open(os.path.join(self.data_dir, self.deleted_file), "rb") as f:
+                    flags = np.unpackbits(np.frombuffer(f.read(), dtype=np.uint8))
+                self.metadata.mark_deleted(np.flatnonzero(flags[:len(self.metadata)]).tolist())
+            self.deleted_end = len(self.metadata)
+            needs_save = False
+        elif manifest:
+            # Single snapshot directory from before runs
+            runs.append(self._load_snapshot(os.path.join(self.snapshots_dir, manifest["snapshot"]), manifest.get("embedder", LEGACY_EMBEDDER)))
+            self.snapshot_seq = manifest["seq"]
+            needs_save = True
         else:
-            self.index = faiss.IndexFlatL2(self.dimension)
-            self.metadata = []
+            legacy = self._load_legacy()
+            runs.extend([legacy] if legacy else [])
+            needs_save = legacy is not None
 
-    def save_index(self):
-        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
-        faiss.write_index(self.index, self.index_path)
-        with open(self.metadata_path, "wb") as f:
-            pickle.dump(self.metadata, f)
-
-    def get_embeddings(self, texts: List[str]) -> List[List[float]]:
-        # Batching might be needed for large lists
-        # Batching might be needed for large lists
-        import time
-        max_retries = 3
-        base_delay = 2
-        
-        for attempt in range(max_retries):
+        # Runs keep deleted rows until they are compacted
+        deleted = np.frombuffer(self.metadata.columns["deleted"], dtype=np.int8).astype(bool)
+        runs = [self._without_deleted(run, deleted) for run in runs]
+        # Runs already re-embedded for the configured embedder by an interrupted re-embed
+        self.reembedded = {}
+        for source_name, name in (manifest or {}).get("reembedded", {}).items():
+            source = next((run for run in runs if run.name == source_name), None)
+            if source is None or not os.path.isdir(os.path.join(self.runs_dir, name)):
+                continue
+            copy, _ = Run.read(self.runs_dir, name)
+            if copy.embedder == self.embedder.name:
+                self.reembedded[source_name] = (source, self._without_deleted(copy, deleted))
+
+        serving = runs[0].embedder if runs else None
+        self.sealed_seq = self.snapshot_seq
+        tail = Tail(len(self.metadata), serving or self.embedder.name)
+        self.view = (tuple(runs), tail)
+
+        replayed = 0
+        for seq, record in self.segment_log.replay(after_seq=self.snapshot_seq):
+            if record.get("op") == "delete":
+                self._apply_delete(record["thread_id"], record["doc_name"], record["row_ids"])
+                replayed += 1
+                continue
+            if "chunks" in record:
+                # Segment written before the columnar store: move its text into the blob
+                record["rows"] = self.metadata.make_rows(record["chunks"])
+                needs_save = True
+            embedder = record.get("embedder", LEGACY_EMBEDDER)
+            if serving is None:
+                serving = tail.embedder = embedder
+            elif embedder != serving:
+                # Vectors from another embedder are not comparable (or even the same size);
+                # the tail is rebuilt by the re-embed
+                tail.embedder = None
+            self._apply_add(record["thread_id"], record["vectors"] if embedder == serving else None, record["rows"])
+            replayed += 1
+        if replayed:
+            print(f"Replayed {replayed} index segments on top of {len(runs)} runs")
+
+        serving = serving or self.embedder.name
+        # Searches and writes stay with the embedder of the stored vectors until they are rebuilt
+        self.query_embedder = self.write_embedder = self.embedder if serving == self.embedder.name else embedder_for(serving)
+        self.reembedding = any(holder.embedder != self.embedder.name for holder in self.view[0] + (self.view[1],))
+        if needs_save:
+            # Moves older data directories onto the current layout once
+            self.save_index()
+        if self.reembedding:
+            self._start_reembed()
+        self._maybe_maintain()
+
+    def _without_deleted(self, run: Run, deleted: np.ndarray) -> Run:
+        """`run` with the rows flagged deleted tombstoned (whole partitions dropped)."""
+        for thread_id, partition in list(run.keyword.partitions.items()):
+            docs = np.frombuffer(partition.docs, dtype=np.int32)
+            dead = docs[deleted[docs]]
+            if len(dead) == len(docs):
+                run = run.without(thread_id)
+            elif len(dead):
+                run = run.with_tombstones(thread_id, dead)
+        return run
+
+    def _load_snapshot(self, path: str, embedder: str) -> Run:
+        if os.path.exists(os.path.join(path, "chunks.pkl")):
+            with open(os.path.join(path, "chunks.pkl"), "rb") as f:
+                self.metadata.extend_state(pickle.load(f))
+        else:
+            with open(os.path.join(path, "metadata.pkl"), "rb") as f:
+                self.metadata.extend(self.metadata.make_rows(pickle.load(f)))
+        with open(os.path.join(path, "keyword.pkl"), "rb") as f:
+            keyword = pickle.load(f)
+        partitions = read_partitions(os.path.join(path, "partitions"))
+        return Run(0, len(self.metadata), partitions, keyword, embedder)
+
+    def _load_legacy(self) -> Optional[Run]:
+        """Reads the flat files written before segments existed."""
+        metadata_path = os.path.join(self.data_dir, "metadata.pkl")
+        partitions_dir = os.path.join(self.data_dir, "partitions")
+        index_path = os.path.join(self.data_dir, "vectors.index")
+        if not os.path.exists(metadata_path):
+            return None
+        with open(metadata_path, "rb") as f:
+            metadata = pickle.load(f)
+
+        partitions = {}
+        if os.path.isdir(partitions_dir):
+            partitions = read_partitions(partitions_dir)
+        elif os.path.exists(index_path):
+            # Split the old single index into per-thread partitions
+            legacy = faiss.read_index(index_path)
+            vectors = legacy.reconstruct_n(0, legacy.ntotal)
+            by_thread: Dict[Optional[int], List[int]] = {}
+            for idx, chunk in enumerate(metadata[:legacy.ntotal]):
+                by_thread.setdefault(chunk.get("thread_id"), []).append(idx)
+            for thread_id, ids in by_thread.items():
+                partitions[thread_id] = ann_index.rebuild(legacy.d, vectors[ids], np.array(ids, dtype="int64"))
+            print(f"Migrated {legacy.ntotal} vectors into {len(by_thread)} thread partitions")
+        self.metadata.extend(self.metadata.make_rows(metadata))
+
+        keyword = KeywordIndex()
+        for doc_id, chunk in enumerate(metadata):
+            keyword.add(doc_id, chunk["text"], chunk.get("thread_id"))
+        return Run(0, len(self.metadata), partitions, keyword, LEGACY_EMBEDDER)
+
+    def _start_reembed(self):
+        if self.reembed_thread and self.reembed_thread.is_alive():
+            return
+        self.reembed_thread = threading.Thread(target=self._reembed, name="reembed", daemon=True)
+        self.reembed_thread.start()
+
+    def _reembed(self):
+        """Background thread: rebuilds every run with self.embedder, retrying until it gets through."""
+        pending = sum(run.rows for run in self._pending_reembed())
+        print(f"Stored vectors were not produced by {self.embedder.name}; re-embedding {pending} rows in the background")
+        started = time.perf_counter()
+        while True:
             try:
-                result = genai.embed_content(
-                    model="models/embedding-001",
-                    content=texts,
-                    task_type="retrieval_document",
-                    title="Construction Document"
-                )
-                return result['embedding']
+                self._reembed_runs()
+                break
             except Exception as e:
-                if "429" in str(e) or "quota" in str(e).lower() or "resource exhausted" in str(e).lower():
-                    if attempt < max_retries - 1:
-                        sleep_time = base_delay * (2 ** attempt)
-                        print(f"Embedding quota exceeded, retrying in {sleep_time}s...")
-                        time.sleep(sleep_time)
+                print(f"Re-embedding failed: {e}. Retrying in {REEMBED_RETRY_SECONDS:.0f}s")
+                time.sleep(REEMBED_RETRY_SECONDS)
+        print(f"Re-embedded {len(self.metadata)} chunks with {self.embedder.name} in {time.perf_counter() - started:.2f}s")
+
+    def _pending_reembed(self) -> List[Run]:
+        with self.lock:
+            return [run for run in self.view[0]
+                    if run.embedder != self.embedder.name and run.name and run.name not in self.reembedded]
+
+    def _reembed_runs(self):
+        # Runs sealed meanwhile are still in the old space; later passes pick them up
+        pending = self._pending_reembed()
+        while pending:
+            for run in pending:
+                self._reembed_run(run)
+                with self.maintenance_lock:
+                    self._write_manifest()
+            pending = self._pending_reembed()
+
+        with self.maintenance_lock:
+            # New writes go into the new space from here on. What is left of the old
+            # one is the tail so far: written out as a run and converted last.
+            with self.lock:
+                self.write_embedder = self.embedder
+                self._freeze_tail(self.embedder.name)
+            self._seal(force=True)
+            for run in self._pending_reembed():
+                self._reembed_run(run)
+            with self.lock:
+                runs, tail = self.view
+                converted = []
+                for run in runs:
+                    if run.embedder != self.embedder.name:
+                        source, copy = self.reembedded[run.name]
+                        # Deletes may have reached the run since it was converted
+                        run = reconcile(copy, [source], [run])
+                    converted.append(run)
+                self.view = (tuple(converted), tail)
+                self.query_embedder = self.embedder
+                self.reembedded = {}
+                self.reembedding = False
+            self._write_manifest()
+        # Cached answers were retrieved (and their questions embedded) in the old space
+        answer_cache.invalidate(None)
+        self._maybe_maintain()
+
+    def _reembed_run(self, run: Run):
+        """Writes a copy of `run` embedded with self.embedder; swapped in once every run has one."""
+        started = time.perf_counter()
+        copy = reembed_run(run, self.embedder.name, self._embed_rows)
+        copy = copy.write(self.runs_dir, self._new_name("run"), self.metadata.state(run.start, run.end))
+        with self.lock:
+            self.reembedded[run.name] = (run, copy)
+        print(f"Re-embedded index run {run.name} ({run.rows} rows) in {time.perf_counter() - started:.2f}s")
+
+    def _embed_rows(self, ids: np.ndarray) -> np.ndarray:
+        step = EMBED_BATCH_SIZE * EMBED_CONCURRENCY
+        vectors = []
+        for start in range(0, len(ids), step):
+            texts = [self.metadata.text(i) for i in ids[start:start + step].tolist()]
+            vectors.append(np.array(self.get_embeddings(texts, self.embedder), dtype="float32"))
+        return np.concatenate(vectors)
+
+    def _freeze_tail(self, embedder: Optional[str] = None) -> Tuple[Run, ...]:
+        """
+        Turns the tail into a run (not written yet) and starts a new one, for vectors
+        of `embedder` (default: same as before). Callers hold self.lock.
+        """
+        runs, tail = self.view
+        end = len(self.metadata)
+        if end > tail.start:
+            runs = runs + (tail.freeze(end),)
+        self.view = (runs, Tail(end, embedder or tail.embedder))
+        self.sealed_seq = self.segment_log.last_seq
+        return runs
+
+    def save_index(self):
+        """Seals every write so far into runs and writes them out; returns once they are on disk."""
+        with self.maintenance_lock:
+            self._seal(force=True)
+
+    def _seal(self, force: bool = False):
+        """Freezes the tail once enough segments are pending, then writes every run not on disk yet."""
+        with self.lock:
+            pending = self.segment_log.last_seq - self.sealed_seq
+            if pending and (force or pending >= SEGMENT_MERGE_THRESHOLD):
+                self._freeze_tail()
+            unwritten = [run for run in self.view[0] if run.name is None]
+        for run in unwritten:
+            self._rebuild([run])
+        if unwritten or self.sealed_seq != self.snapshot_seq or (force and self.deletes_dirty):
+            self._write_manifest()
+
+    def _rebuild(self, sources: Sequence[Run]) -> Run:
+        """Builds and writes the run replacing `sources` without holding the lock, then swaps it in."""
+        built = merge_runs(sources)
+        built = built.write(self.runs_dir, self._new_name("run"), self.metadata.state(built.start, built.end))
+        with self.lock:
+            runs, tail = self.view
+            first = next(i for i, run in enumerate(runs) if run.start == built.start)
+            last = next(i for i, run in enumerate(runs) if run.end == built.end)
+            # Deletes may have reached the sources while this was being built
+            built = reconcile(built, sources, runs[first:last + 1])
+            self.view = (runs[:first] + (built,) + runs[last + 1:], tail)
+        return built
+
+    def _new_name(self, prefix: str) -> str:
+        with self.lock:
+            number = self.next_name
+            self.next_name += 1
+        return f"{prefix}-{number:08d}"
+
+    def _write_manifest(self):
+        """Commit point: points the manifest at the current runs, then drops what they replaced."""
+        with self.lock:
+            runs = self.view[0]
+            if any(run.name is None for run in runs):
+                return  # picked up by the save that writes those runs
+            reembedded = {name: copy.name for name, (_, copy) in self.reembedded.items()}
+            deleted_threads = sorted(self.deleted_threads)
+            seq = self.sealed_seq
+            end = runs[-1].end if runs else 0
+            flags = None
+            # Rows sealed since the last flags may have been deleted while in the tail;
+            # their delete records go with the segments truncated up to seq. No view of
+            # the column may outlive the lock: it could not grow while one exists.
+            if self.deletes_dirty or np.frombuffer(self.metadata.columns["deleted"], dtype=np.uint8)[self.deleted_end:end].any():
+                flags = np.packbits(np.frombuffer(self.metadata.columns["deleted"], dtype=np.uint8)[:end])
+                self.deletes_dirty = False
+        deleted_file = self.deleted_file
+        if flags is not None:
+            deleted_file = f"{self._new_name('deleted')}.bin"
+            atomic_write(os.path.join(self.data_dir, deleted_file), flags.tobytes())
+        names = [run.name for run in runs]
+        atomic_write(self.manifest_path, json.dumps({
+            "runs": names, "seq": seq, "deleted": deleted_file, "deleted_threads": deleted_threads,
+            "next_name": self.next_name, "reembedded": reembedded,
+        }).encode())
+        self.snapshot_seq = seq
+        self.deleted_file = deleted_file
+        if flags is not None:
+            self.deleted_end = end
+        self.segment_log.truncate(seq)
+
+        os.makedirs(self.runs_dir, exist_ok=True)
+        for name in os.listdir(self.runs_dir):
+            if name not in names and name not in reembedded.values():
+                shutil.rmtree(os.path.join(self.runs_dir, name), ignore_errors=True)
+        for name in os.listdir(self.data_dir):
+            if name.startswith("deleted-") and name != deleted_file:
+                os.remove(os.path.join(self.data_dir, name))
+        shutil.rmtree(self.snapshots_dir, ignore_errors=True)
+
+    def _tier(self, run: Run) -> int:
+        return int(math.log(max(run.rows, RUN_BASE_ROWS) / RUN_BASE_ROWS, RUN_MERGE_FACTOR))
+
+    def _next_merge(self, runs: Sequence[Run]) -> Optional[Sequence[Run]]:
+        """The newest RUN_MERGE_FACTOR consecutive runs in one size tier, if any."""
+        if self.reembedding:
+            return None  # runs being re-embedded must keep their row ranges
+        for i in range(len(runs) - RUN_MERGE_FACTOR, -1, -1):
+            group = runs[i:i + RUN_MERGE_FACTOR]
+            if (len({self._tier(run) for run in group}) == 1 and sum(run.rows for run in group) <= RUN_MAX_ROWS
+                    and all(run.name for run in group)):
+                return group
+        return None
+
+    def _next_compaction(self, runs: Sequence[Run]) -> Optional[Run]:
+        if self.reembedding:
+            return None
+        for run in runs:
+            dead = run.dead + run.dropped
+            if run.name and dead and dead / max(len(run.keyword) + run.dropped, 1) >= COMPACTION_DEAD_RATIO:
+                return run
+        return None
+
+    def _maybe_maintain(self):
+        if self.maintenance_thread and self.maintenance_thread.is_alive():
+            return
+        runs = self.view[0]
+        if (self.segment_log.last_seq - self.sealed_seq < SEGMENT_MERGE_THRESHOLD
+                and self._next_merge(runs) is None and self._next_compaction(runs) is None):
+            return
+        self.maintenance_thread = threading.Thread(target=self._maintain, name="index-maintenance", daemon=True)
+        self.maintenance_thread.start()
+
+    def _maintain(self):
+        """Seals the tail, then merges and compacts runs until there is nothing left to do."""
+        try:
+            with self.maintenance_lock:
+                self._seal()
+                while True:
+                    runs = self.view[0]
+                    group = self._next_merge(runs)
+                    if group is not None:
+                        started = time.perf_counter()
+                        built = self._rebuild(group)
+                        self._write_manifest()
+                        print(f"Merged {len(group)} index runs into {built.name} ({built.rows} rows) in {time.perf_counter() - started:.2f}s")
                         continue
-                    else:
-                        print("Embedding quota exceeded after retries. Using zero vector fallback.")
-                        return [[0.0] * 768 for _ in texts] # Fallback to zero vectors
-                raise e
-
-    def add_chunks(self, chunks: List[Dict[str, Any]], thread_id: int = None):
-        texts = [chunk["text"] for chunk in chunks]
-        embeddings = self.get_embeddings(texts)
-        
-        vectors = np.array(embeddings).astype('float32')
-        self.index.add(vectors)
-        
-        # Add thread_id to metadata
+                    run = self._next_compaction(runs)
+                    if run is None:
+                        break
+                    started = time.perf_counter()
+                    built = self._rebuild([run])
+                    self._write_manifest()
+                    print(f"Compacted index run {run.name}: dropped {run.dead + run.dropped} deleted chunks in {time.perf_counter() - started:.2f}s")
+        except Exception as e:
+            print(f"Index maintenance failed: {e}")
+
+    def delete_thread(self, thread_id: int) -> int:
+        """Removes every chunk of a thread from search right away. Returns how many."""
+        return self._delete(thread_id, None)
+
+    def delete_document(self, doc_name: str, thread_id: Optional[int] = None) -> int:
+        """Removes one document's chunks from a thread (or the global docs). Returns how many."""
+        return self._delete(thread_id, doc_name)
+
+    def _delete(self, thread_id: Optional[int], doc_name: Optional[str]) -> int:
+        with self.lock:
+            row_ids = self.metadata.find_rows(thread_id, doc_name)
+            runs, tail = self.view
+            indexed = any(thread_id in holder.keyword.partitions for holder in runs + (tail,))
+            if row_ids or (doc_name is None and (indexed or thread_id not in self.deleted_threads)):
+                # Rows are logged so replay does not depend on what was live at the time
+                self.segment_log.append({"op": "delete", "thread_id": thread_id, "doc_name": doc_name, "row_ids": row_ids})
+                self._apply_delete(thread_id, doc_name, row_ids)
+        self.dedup_registry.remove_documents(thread_id, doc_name)
+        if row_ids:
+            print(f"Deleted {len(row_ids)} chunks ({doc_name or 'all documents'}, thread {thread_id})")
+        self._maybe_maintain()
+        return len(row_ids)
+
+    def get_embeddings(self, texts: List[str], embedder: Optional[Embedder] = None) -> List[List[float]]:
+        """Document vectors from `embedder`, by default the configured one."""
+        embedder = embedder or self.embedder
+        if not embedder.cacheable:
+            # Local embedders are cheaper than a cache lookup; embed in provider-sized batches
+            embeddings = []
+            for start in range(0, len(texts), EMBED_BATCH_SIZE):
+                batch_texts = texts[start:start + EMBED_BATCH_SIZE]
+                metrics.EMBEDDING_BATCH_SIZE.observe(len(batch_texts))
+                with metrics.EMBEDDING_SECONDS.time(task="document"):
+                    embeddings.extend(self._embed_documents(batch_texts, embedder))
+            return embeddings
+
+        # Only texts never embedded before (by content hash) go to the API
+        embeddings = self.embedding_cache.get_many(embedder.name, "retrieval_document", texts)
+        missing = [i for i, e in enumerate(embeddings) if e is None]
+        metrics.EMBEDDING_CACHE.inc(len(texts) - len(missing), result="hit")
+        metrics.EMBEDDING_CACHE.inc(len(missing), result="miss")
+        if not missing:
+            return embeddings
+
+        # Provider-sized batches, a few in flight at once. Each batch is cached as soon
+        # as it lands, so a failed ingest only re-pays for the batches that failed.
+        batches = [missing[i:i + EMBED_BATCH_SIZE] for i in range(0, len(missing), EMBED_BATCH_SIZE)]
+
+        def embed_batch(batch: List[int]):
+            batch_texts = [texts[i] for i in batch]
+            metrics.EMBEDDING_BATCH_SIZE.observe(len(batch_texts))
+            with metrics.EMBEDDING_SECONDS.time(task="document"):
+                fresh = self._embed_documents(batch_texts, embedder)
+            self.embedding_cache.put_many(embedder.name, "retrieval_document", batch_texts, fresh)
+            return batch, fresh
+
+        with ThreadPoolExecutor(max_workers=min(EMBED_CONCURRENCY, len(batches))) as pool:
+            for batch, fresh in pool.map(embed_batch, batches):
+                for i, embedding in zip(batch, fresh):
+                    embeddings[i] = embedding
+        return embeddings
+
+    def _embed_documents(self, texts: List[str], embedder: Embedder) -> List[List[float]]:
+        return list(embedder.embed_documents(texts))
+
+    def embed_query(self, query: str) -> Optional[List[float]]:
+        """Query vector in the space of the vectors being served; None if that embedder is unavailable."""
+        embedder = self.query_embedder
+        if embedder is None:
+            return None
+        if not embedder.cacheable:
+            with metrics.EMBEDDING_SECONDS.time(task="query"):
+                return embedder.embed_query(query).tolist()
+
+        cached = self.embedding_cache.get_many(embedder.name, "retrieval_query", [query])[0]
+        metrics.EMBEDDING_CACHE.inc(result="miss" if cached is None else "hit")
+        if cached is not None:
+            return cached
+        with metrics.EMBEDDING_SECONDS.time(task="query"):
+            embedding = embedder.embed_query(query).tolist()
+        self.embedding_cache.put_many(embedder.name, "retrieval_query", [query], [embedding])
+        return embedding
+
+    def _embed_for_writes(self, texts: List[str]) -> Tuple[Optional[Embedder], Optional[np.ndarray]]:
+        """Vectors in the tail's space, or none if its embedder is unavailable (the re-embed adds them)."""
+        embedder = self.write_embedder
+        if embedder is None:
+            return None, None
+        return embedder, np.array(self.get_embeddings(texts, embedder)).astype('float32')
+
+    def _check_thread(self, thread_id: Optional[int]):
+        if thread_id in self.deleted_threads:
+            raise ThreadDeletedError(f"Thread {thread_id} was deleted")
+
+    def add_chunks(self, chunks: List[Dict[str, Any]], thread_id: int = None) -> List[int]:
+        """Embeds and stores chunks; returns their row ids in metadata. Raises ThreadDeletedError for a deleted thread."""
+        if not chunks:
+            return []
+        self._check_thread(thread_id)
+        texts = [chunk_text(chunk) for chunk in chunks]
         for chunk in chunks:
             chunk["thread_id"] = thread_id
-            
-        self.metadata.extend(chunks)
-        self.save_index()
 
-    def search(self, query: str, k: int = 5, filter_thread_id: int = None) -> List[Dict[str, Any]]:
-        if self.index.ntotal == 0:
+        while True:
+            start = time.perf_counter()
+            hits_before = self.embedding_cache.hits
+            embedder, vectors = self._embed_for_writes(texts)
+            elapsed = time.perf_counter() - start
+            cached = self.embedding_cache.hits - hits_before
+            print(f"Embedded {len(texts)} chunks in {elapsed:.2f}s ({len(texts) / max(elapsed, 1e-9):.1f} chunks/sec, {cached} cached)")
+
+            # Durable once the segment is on disk: I/O is proportional to this batch only
+            with self.lock:
+                if embedder is not self.write_embedder:
+                    continue  # a re-embed switched embedders meanwhile
+                # Checked again with the lock held: the thread may have been deleted while embedding
+                self._check_thread(thread_id)
+                rows = self.metadata.make_rows(chunks)
+                self._log_add(thread_id, embedder, vectors, rows)
+                start_id = len(self.metadata)
+                self._apply_add(thread_id, vectors, rows, texts)
+            break
+        self._maybe_maintain()
+        return list(range(start_id, start_id + len(chunks)))
+
+    def add_references(self, row_ids: List[int], thread_id: Optional[int], doc_name: str) -> List[int]:
+        """
+        Makes already-stored chunks visible to another thread. The text is shared in
+        the blob and the vectors come out of the embedding cache, so nothing is
+        parsed or sent to the embedding API. Raises ThreadDeletedError for a deleted thread.
+        """
+        if not row_ids:
             return []
+        self._check_thread(thread_id)
+        with self.lock:
+            texts = [self.metadata.text(i) for i in row_ids]
+            rows = self.metadata.copy_rows(row_ids, thread_id, doc_name)
+        while True:
+            embedder, vectors = self._embed_for_writes(texts)
+            with self.lock:
+                if embedder is not self.write_embedder:
+                    continue
+                self._check_thread(thread_id)
+                self._log_add(thread_id, embedder, vectors, rows)
+                start_id = len(self.metadata)
+                self._apply_add(thread_id, vectors, rows, texts)
+            break
+        self._maybe_maintain()
+        return list(range(start_id, start_id + len(row_ids)))
 
-        import time
-        max_retries = 3
-        base_delay = 2
-        
-        query_embedding = None
-        for attempt in range(max_retries):
-            try:
-                result = genai.embed_content(
-                    model="models/embedding-001",
-                    content=query,
-                    task_type="retrieval_query"
-                )
-                query_embedding = result['embedding']
-                break
-            except Exception as e:
-                if "429" in str(e) or "quota" in str(e).lower() or "resource exhausted" in str(e).lower():
-                    if attempt < max_retries - 1:
-                        sleep_time = base_delay * (2 ** attempt)
-                        print(f"Query embedding quota exceeded, retrying in {sleep_time}s...")
-                        time.sleep(sleep_time)
-                        continue
-                raise e
+    def _log_add(self, thread_id: Optional[int], embedder: Optional[Embedder], vectors: Optional[np.ndarray], rows: Dict[str, list]):
+        name = embedder.name if embedder else self.view[1].embedder
+        self.segment_log.append({"thread_id": thread_id, "vectors": vectors, "rows": rows, "embedder": name})
+
+    def search(self, query: str, k: int = 5, filter_thread_id: int = None, query_embedding: Optional[List[float]] = None) -> List[Dict[str, Any]]:
+        embedder = self.query_embedder
+        if embedder is None:
+            return [] # stored vectors are from an embedder unavailable here; keyword search still works
+        runs, tail = self.view
+        # Only vectors from the query's embedder are comparable to it (others are being re-embedded)
+        holders = [holder for holder in runs + (tail,) if holder.embedder == embedder.name]
+        # Global docs (thread_id=None) are visible to every thread
+        keys = [filter_thread_id, None] if filter_thread_id else None
+        if not any(holder.partitions and (keys is None or any(key in holder.partitions for key in keys)) for holder in holders):
+            return []
+
+        if query_embedding is None:
+            query_embedding = self.embed_query(query)
         
         if query_embedding is None:
              # Fallback if query embedding fails (e.g. quota)
@@ -108,32 +688,49 @@ class VectorStore:
 
         query_vector = np.array([query_embedding]).astype('float32')
         
-        # Fetch more candidates for filtering
-        search_k = k * 10 if filter_thread_id else k
-        distances, indices = self.index.search(query_vector, search_k)
+        # Each partition only holds chunks the caller may see; over-fetch only by the
+        # deleted chunks it still holds, which compaction keeps a small share
+        candidates = []
+        def search_partitions(holder):
+            for key in (keys if keys is not None else list(holder.partitions)):
+                index = holder.partitions.get(key)
+                if index is None or index.ntotal == 0 or index.d != query_vector.shape[1]:
+                    continue
+                dead = holder.tombstones.get(key)
+                distances, indices = index.search(query_vector, min(k + (0 if dead is None else len(dead)), index.ntotal))
+                found = indices[0] != -1
+                if dead is not None:
+                    found &= ~np.isin(indices[0], dead)
+                candidates.extend(zip(distances[0][found].tolist(), indices[0][found].tolist()))
+
+        # Runs never change, so only the tail is searched under its (shared) lock
+        with metrics.FAISS_SEARCH_SECONDS.time():
+            for run in runs:
+                if run in holders:
+                    search_partitions(run)
+            if tail in holders:
+                with tail.rw.read():
+                    search_partitions(tail)
         
         results = []
-        for i, idx in enumerate(indices[0]):
-            if idx != -1 and idx < len(self.metadata):
-                item = self.metadata[idx].copy()
-                
-                # Filter by thread_id if specified
-                # If item has no thread_id (None), it's global? 
-                # User said "only on that specific thread". So strict match.
-                # But we might want to allow global docs (thread_id=None) to be seen by all?
-                # Let's implement: Match thread_id OR item.thread_id is None (Global)
-                item_thread_id = item.get("thread_id")
-                
-                if filter_thread_id:
-                    if item_thread_id is not None and item_thread_id != filter_thread_id:
-                        continue # Skip chunks from other threads
-                
-                item["score"] = float(distances[0][i])
-                results.append(item)
-                if len(results) >= k:
-                    break
+        for distance, idx in heapq.nsmallest(k, candidates):
+            item = self.metadata[idx]
+            item["score"] = distance
+            results.append(item)
                 
         return results
 
+    def keyword_search(self, query: str, k: int = 10, thread_ids: Optional[Iterable[Optional[int]]] = None) -> List[Tuple[int, float]]:
+        """BM25 top-k (row id, score) pairs over every run and the tail. `thread_ids=None` searches all."""
+        runs, tail = self.view
+        with tail.rw.read():
+            return keyword_index.search([(holder.keyword, holder.tombstones) for holder in runs + (tail,)], query, k, thread_ids)
+
+    def keyword_matching(self, terms: Iterable[str], thread_ids: Optional[Iterable[Optional[int]]] = None) -> List[int]:
+        """Row ids of every live chunk containing any of `terms`."""
+        runs, tail = self.view
+        with tail.rw.read():
+            return keyword_index.matching([(holder.keyword, holder.tombstones) for holder in runs + (tail,)], terms, thread_ids)
+
 # Singleton instance
 vector_store = VectorStore()
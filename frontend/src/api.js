@@ -29,7 +29,18 @@ export const ingestFiles = async (files, threadId = null) => {
     formData.append("thread_id", threadId);
   }
   const response = await api.post("/ingest", formData);
-  return response.data;
+  return waitForIngestJob(response.data.job_id);
+};
+
+// Ingestion runs as a background job; poll until it finishes.
+export const waitForIngestJob = async (jobId, intervalMs = 1000) => {
+  for (;;) {
+    const response = await api.get(`/ingest/jobs/${jobId}`);
+    const job = response.data;
+    if (job.status === "completed") return job;
+    if (job.status === "failed") throw new Error(job.error || "Ingestion failed");
+    await new Promise((resolve) => setTimeout(resolve, intervalMs));
+  }
 };
 
 export const queryChat = async (question, history = []) => {
@@ -37,8 +48,16 @@ export const queryChat = async (question, history = []) => {
   return response.data;
 };
 
-export const extractDoorSchedule = async () => {
-  const response = await api.post("/extract/door-schedule");
+// Newest page of threads; the response also carries next_cursor for older ones.
+export const fetchThreads = async () => {
+  const response = await api.get("/threads");
+  return response.data.threads;
+};
+
+// Without a thread id only the shared documents are scanned.
+export const extractDoorSchedule = async (threadId = null) => {
+  const params = threadId ? { thread_id: threadId } : {};
+  const response = await api.post("/extract/door-schedule", null, { params });
   return response.data;
 };
 
@@ -4,6 +4,13 @@ import { ingestFiles } from '../api';
 import { useAuth } from '../context/AuthContext';
 import axios from 'axios';
 
+// Map DB messages to UI format
+const toUiMessage = (msg) => ({
+  role: msg.role,
+  content: msg.content,
+  sources: msg.sources
+});
+
 const Chat = () => {
   const [messages, setMessages] = useState([
     { role: 'assistant', content: 'Hello! I am Project Brain. Upload some construction documents or ask me a question about the project.' }
@@ -18,6 +25,7 @@ const Chat = () => {
   // Persistence & History
   const [threads, setThreads] = useState([]);
   const [currentThreadId, setCurrentThreadId] = useState(null);
+  const [olderCursor, setOlderCursor] = useState(null);
   const { token } = useAuth();
   const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000';
 
@@ -38,7 +46,7 @@ const Chat = () => {
       const res = await axios.get(`${API_URL}/threads`, {
         headers: { 'Authorization': `Bearer ${token}` }
       });
-      setThreads(res.data);
+      setThreads(res.data.threads);
     } catch (err) {
       console.error("Failed to fetch threads", err);
     }
@@ -50,13 +58,9 @@ const Chat = () => {
       const res = await axios.get(`${API_URL}/threads/${threadId}/messages`, {
         headers: { 'Authorization': `Bearer ${token}` }
       });
-      // Map DB messages to UI format
-      const uiMessages = res.data.map(msg => ({
-        role: msg.role,
-        content: msg.content,
-        sources: msg.sources
-      }));
-      setMessages(uiMessages);
+      // Latest page only; earlier messages load on demand
+      setMessages(res.data.messages.map(toUiMessage));
+      setOlderCursor(res.data.next_cursor);
       setCurrentThreadId(threadId);
     } catch (err) {
       console.error("Failed to load thread", err);
@@ -64,9 +68,24 @@ const Chat = () => {
     setIsLoading(false);
   };
 
+  const loadOlderMessages = async () => {
+    if (!currentThreadId || !olderCursor) return;
+    try {
+      const res = await axios.get(`${API_URL}/threads/${currentThreadId}/messages`, {
+        headers: { 'Authorization': `Bearer ${token}` },
+        params: { cursor: olderCursor }
+      });
+      setMessages(prev => [...res.data.messages.map(toUiMessage), ...prev]);
+      setOlderCursor(res.data.next_cursor);
+    } catch (err) {
+      console.error("Failed to load earlier messages", err);
+    }
+  };
+
   const createNewChat = () => {
     setMessages([{ role: 'assistant', content: 'Hello! I am Project Brain. Upload some construction documents or ask me a question about the project.' }]);
     setCurrentThreadId(null);
+    setOlderCursor(null);
   };
 
   const deleteThread = async (e, threadId) => {
@@ -250,6 +269,16 @@ const Chat = () => {
       {/* Chat Area */}
       <div className="flex-1 flex flex-col h-full relative min-h-0">
         <div className="flex-1 overflow-y-auto p-6 space-y-6 scrollbar-thin scrollbar-thumb-brand-secondary scrollbar-track-transparent min-h-0">
+          {olderCursor && (
+            <div className="flex justify-center">
+              <button
+                onClick={loadOlderMessages}
+                className="text-xs text-brand-muted hover:text-brand-accent transition-colors"
+              >
+                Load earlier messages
+              </button>
+            </div>
+          )}
           {messages.map((msg, idx) => (
             <div key={idx} className={`flex ${msg.role === 'user' ? 'justify-end' : 'justify-start'}`}>
               <div className={`max-w-[80%] rounded-2xl p-4 ${msg.role === 'user'
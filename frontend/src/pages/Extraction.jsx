@@ -1,17 +1,25 @@
-import React, { useState } from 'react';
-import { extractDoorSchedule } from '../api';
+import React, { useState, useEffect } from 'react';
+import { extractDoorSchedule, fetchThreads } from '../api';
 import { Loader2, Table as TableIcon, FileText } from 'lucide-react';
 
 const Extraction = () => {
   const [data, setData] = useState([]);
   const [isLoading, setIsLoading] = useState(false);
   const [error, setError] = useState(null);
+  const [threads, setThreads] = useState([]);
+  const [threadId, setThreadId] = useState('');
+
+  useEffect(() => {
+    fetchThreads()
+      .then(setThreads)
+      .catch((err) => console.error("Failed to fetch threads", err));
+  }, []);
 
   const handleExtract = async () => {
     setIsLoading(true);
     setError(null);
     try {
-      const result = await extractDoorSchedule();
+      const result = await extractDoorSchedule(threadId || null);
       setData(result.data || []);
     } catch (err) {
       console.error("Extraction error:", err);
@@ -30,14 +38,27 @@ const Extraction = () => {
             <p className="text-gray-400 text-lg">Automatically extract door specifications from project documents.</p>
           </div>
 
-          <button
-            onClick={handleExtract}
-            disabled={isLoading}
-            className="flex items-center gap-3 bg-brand-accent hover:bg-brand-accent/90 text-white px-8 py-4 rounded-2xl font-bold transition-all disabled:opacity-50 disabled:cursor-not-allowed shadow-lg shadow-brand-accent/20 hover:scale-105 active:scale-95"
-          >
-            {isLoading ? <Loader2 className="animate-spin" size={24} /> : <TableIcon size={24} />}
-            {isLoading ? 'Extracting...' : 'Generate Schedule'}
-          </button>
+          <div className="flex items-center gap-4">
+            <select
+              value={threadId}
+              onChange={(e) => setThreadId(e.target.value)}
+              disabled={isLoading}
+              className="bg-white/5 border border-white/10 text-gray-300 px-4 py-4 rounded-2xl"
+            >
+              <option value="">Shared documents</option>
+              {threads.map(thread => (
+                <option key={thread.id} value={thread.id}>{thread.title}</option>
+              ))}
+            </select>
+            <button
+              onClick={handleExtract}
+              disabled={isLoading}
+              className="flex items-center gap-3 bg-brand-accent hover:bg-brand-accent/90 text-white px-8 py-4 rounded-2xl font-bold transition-all disabled:opacity-50 disabled:cursor-not-allowed shadow-lg shadow-brand-accent/20 hover:scale-105 active:scale-95"
+            >
+              {isLoading ? <Loader2 className="animate-spin" size={24} /> : <TableIcon size={24} />}
+              {isLoading ? 'Extracting...' : 'Generate Schedule'}
+            </button>
+          </div>
         </div>
 
         {error && (
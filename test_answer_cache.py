@@ -0,0 +1,71 @@
+import os
+import sys
+
+# Runs offline against the backend modules; no server needed
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from services.answer_cache import AnswerCache
+
+# Near-duplicate questions get near-identical embeddings; use the very same one
+EMBEDDING = [0.1, 0.7, 0.2, 0.4]
+
+
+def store(cache, thread_id, question, answer="Door D-101 is 60 minutes."):
+    cache.put(thread_id, cache.version(thread_id), question, answer, "[]", EMBEDDING)
+
+
+def test_exact_repeat_hits():
+    cache = AnswerCache()
+    store(cache, 1, "What is the fire rating of D-101?")
+    # Case, punctuation and spacing do not make it a different question
+    entry = cache.get(1, "what is the fire rating of  D-101")
+    assert entry is not None and entry["answer"] == "Door D-101 is 60 minutes."
+    assert cache.get(2, "What is the fire rating of D-101?") is None  # other thread
+    print("SUCCESS: exact repeats are answered from the cache.")
+
+
+def test_different_identifier_misses():
+    # Default: exact repeats only, however close the embedding
+    cache = AnswerCache()
+    store(cache, 1, "What is the fire rating of D-101?")
+    assert cache.get(1, "What is the fire rating of D-102?") is None
+    assert cache.get_similar(1, "What's the fire rating of D-101?", EMBEDDING) is None
+
+    # With near-duplicate matching on, the same identifiers hit but any other mark or number misses
+    cache = AnswerCache(similarity=0.9)
+    store(cache, 1, "What is the fire rating of D-101?")
+    store(cache, 1, "How wide is door 12?")
+    assert cache.get_similar(1, "What's the fire rating of D-101?", EMBEDDING) is not None
+    assert cache.get_similar(1, "What is the fire rating of D-102?", EMBEDDING) is None
+    assert cache.get_similar(1, "What is the fire rating of D-101 and D-102?", EMBEDDING) is None
+    assert cache.get_similar(1, "What is the fire rating?", EMBEDDING) is None
+    assert cache.get_similar(1, "How wide is door 13?", EMBEDDING) is None
+    print("SUCCESS: questions naming another door mark or number never share an answer.")
+
+
+def test_corpus_change_invalidates():
+    cache = AnswerCache()
+    store(cache, 1, "What is the fire rating of D-101?")
+    store(cache, 2, "What is the fire rating of D-101?")
+
+    # An ingest or delete in thread 1 (what ingestion and the delete endpoints call)
+    cache.invalidate(1)
+    assert cache.get(1, "What is the fire rating of D-101?") is None
+    assert cache.get(2, "What is the fire rating of D-101?") is not None
+
+    # Global documents are visible to every thread
+    cache.invalidate(None)
+    assert cache.get(2, "What is the fire rating of D-101?") is None
+
+    # An answer retrieved before the corpus changed is not stored afterwards
+    version = cache.version(1)
+    cache.invalidate(1)
+    cache.put(1, version, "What is the fire rating of D-101?", "stale", "[]", EMBEDDING)
+    assert cache.get(1, "What is the fire rating of D-101?") is None
+    print("SUCCESS: ingests and deletes invalidate cached answers.")
+
+
+if __name__ == "__main__":
+    test_exact_repeat_hits()
+    test_different_identifier_misses()
+    test_corpus_change_invalidates()
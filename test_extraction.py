@@ -0,0 +1,62 @@
+import os
+import sys
+import tempfile
+
+# Runs offline against the backend modules; no server or API key needed
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+os.environ["EMBEDDING_PROVIDER"] = "hashing"
+
+# Importing the service builds the vector store singleton under ./data; keep that out of the checkout
+_cwd = os.getcwd()
+os.chdir(tempfile.mkdtemp())
+try:
+    from services.extraction_service import merge_rows
+finally:
+    os.chdir(_cwd)
+
+
+def door(mark, **fields):
+    return {"mark": mark, "source_references": [], **fields}
+
+
+def test_merge_rows_across_overlapping_batches():
+    reference = {"file": "schedule.pdf", "page": 2, "chunk": 4, "excerpt": "D-101 Corridor"}
+    batches = [
+        [
+            door("D-101", location="Corridor", width_mm=900, fire_rating="FD30", source_references=[reference]),
+            door("D-102", location="Office", material="Timber"),
+        ],
+        [
+            # Same doors again where the batches overlap, marks written differently
+            door(" d-101 ", location="Corridor", width_mm=926, material="Steel", source_references=[reference]),
+            door("D - 102", location="Office", material="Timber"),
+            {"mark": None, "location": "Plant room", "source_references": []},
+        ],
+        [
+            {"location": "Stair core", "width_mm": 1000},
+            door("D-103", height_mm=2100),
+        ],
+    ]
+    rows = merge_rows(batches)
+
+    # One row per mark (case and whitespace do not matter), in first-seen order, first spelling kept
+    marked = [row for row in rows if row.get("mark")]
+    assert [row["mark"] for row in marked] == ["D-101", "D-102", "D-103"]
+    d101, d102, d103 = marked
+    # Agreeing values stay as they are; differing ones are all kept, joined with " / "
+    assert d101["location"] == "Corridor"
+    assert d101["width_mm"] == "900 / 926"
+    assert d101["fire_rating"] == "FD30"
+    assert d101["material"] == "Steel"
+    assert d101["height_mm"] is None
+    assert d101["source_references"] == [reference]
+    assert d102["material"] == "Timber" and d102["location"] == "Office"
+    assert d103["height_mm"] == 2100
+
+    # Rows without a mark cannot be matched up, so they pass through untouched, last
+    assert rows[len(marked):] == [batches[1][2], batches[2][0]]
+    print("SUCCESS: merge_rows folds overlapping batches into one row per door mark.")
+
+
+if __name__ == "__main__":
+    test_merge_rows_across_overlapping_batches()
@@ -1,5 +1,6 @@
 import requests
 import os
+import time
 
 BASE_URL = "http://localhost:8000"
 EMAIL = "amit@abc"
@@ -29,11 +30,23 @@ def test_full_flow():
         # Note: requests handles multipart boundary automatically when 'files' is passed
         upload_response = requests.post(f"{BASE_URL}/ingest", headers=headers, files=files)
     
-    if upload_response.status_code != 200:
+    if upload_response.status_code not in (200, 202):
         print(f"Upload failed: {upload_response.text}")
         return
     
-    print(f"Upload successful: {upload_response.json()}")
+    # Ingestion runs in the background; wait for the job to finish
+    job_id = upload_response.json()["job_id"]
+    print(f"Upload accepted, ingest job {job_id}. Waiting...")
+    while True:
+        job = requests.get(f"{BASE_URL}/ingest/jobs/{job_id}", headers=headers).json()
+        if job["status"] in ("completed", "failed"):
+            break
+        time.sleep(1)
+    if job["status"] == "failed":
+        print(f"Ingest job failed: {job['error']}")
+        return
+    
+    print(f"Upload successful: {job['chunks_count']} chunks from {job['documents']}")
 
     # 3. Extract Door Schedule
     print("Extracting door schedule...")
@@ -0,0 +1,141 @@
+import asyncio
+import io
+import os
+import sys
+import tempfile
+
+from starlette.datastructures import UploadFile
+
+# Runs offline against the backend modules; no server or API key needed
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+os.environ["EMBEDDING_PROVIDER"] = "hashing"
+
+# The vector store module builds its singleton under ./data on import; keep that out of the checkout
+_cwd = os.getcwd()
+os.chdir(tempfile.mkdtemp())
+try:
+    import services.ingest_jobs as ingest_jobs_module
+    import services.vector_store as vector_store_module
+    from services.embedders import HashingEmbedder
+    from services.ingestion_service import shutdown_parse_pool
+    from services.vector_store import ThreadDeletedError, VectorStore
+finally:
+    os.chdir(_cwd)
+
+with open(os.path.join(ROOT, "test_door_schedule.pdf"), "rb") as f:
+    PDF = f.read()
+
+
+def upload(name):
+    return UploadFile(file=io.BytesIO(PDF), filename=name)
+
+
+def assert_thread_gone(store, thread_id):
+    runs, tail = store.view
+    for holder in runs + (tail,):
+        assert thread_id not in holder.partitions
+        assert thread_id not in holder.keyword.partitions
+    assert store.metadata.find_rows(thread_id) == []
+    assert all(item.get("thread_id") != thread_id for item in store.search("door schedule", k=50, filter_thread_id=thread_id))
+
+
+def run_jobs(test):
+    """Runs `test(queue, store)` against a job queue and a vector store of their own, in a temp dir."""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = VectorStore(data_dir=os.path.join(tmp, "index"), embedder=HashingEmbedder(32))
+        vector_store_module.vector_store = store  # what ingestion writes to
+        queue = ingest_jobs_module.IngestJobQueue(data_dir=tmp)
+
+        async def main():
+            await queue.start()
+            try:
+                await test(queue, store)
+            finally:
+                await queue.stop()
+
+        try:
+            asyncio.run(main())
+        finally:
+            shutdown_parse_pool()
+
+
+def test_deleting_a_thread_fails_its_jobs():
+    real_ingest_files = ingest_jobs_module.ingest_files
+    started, release = asyncio.Event(), asyncio.Event()
+
+    async def held_ingest_files(files, thread_id=None, on_progress=None):
+        # The first job waits here mid-run until the thread is deleted
+        if not started.is_set():
+            started.set()
+            await release.wait()
+        return await real_ingest_files(files, thread_id=thread_id, on_progress=on_progress)
+
+    async def test(queue, store):
+        running = await queue.submit([upload("a.pdf")], 9, user_id=1)
+        await started.wait()
+        queued = await queue.submit([upload("b.pdf")], 9, user_id=1)
+        other = await queue.submit([upload("c.pdf")], 10, user_id=1)
+
+        # What DELETE /threads/{id} does
+        await queue.fail_thread(9)
+        await asyncio.to_thread(store.delete_thread, 9)
+        release.set()
+        await queue.queue.join()
+
+        for job in (running, queued):
+            status = queue.get(job["id"], 1)
+            assert status["status"] == "failed" and status["error"] == "Thread 9 was deleted", status
+            assert not os.path.exists(os.path.join(queue.uploads_dir, job["id"]))
+        assert queue.get(other["id"], 1)["status"] == "completed"
+        assert_thread_gone(store, 9)
+        assert store.metadata.find_rows(10)
+
+    workers = ingest_jobs_module.INGEST_WORKERS
+    ingest_jobs_module.INGEST_WORKERS = 1  # the second job of the thread stays queued
+    ingest_jobs_module.ingest_files = held_ingest_files
+    try:
+        run_jobs(test)
+    finally:
+        ingest_jobs_module.ingest_files = real_ingest_files
+        ingest_jobs_module.INGEST_WORKERS = workers
+    print("SUCCESS: deleting a thread fails its running and queued ingest jobs.")
+
+
+def test_store_refuses_deleted_thread():
+    # A job the delete did not reach (already writing, or resumed after a restart)
+    async def test(queue, store):
+        store.add_chunks([{"doc_name": "old.pdf", "page_num": 1, "chunk_id": 0, "text": "door schedule"}], 9)
+        await asyncio.to_thread(store.delete_thread, 9)
+
+        job = await queue.submit([upload("a.pdf")], 9, user_id=1)
+        await queue.queue.join()
+        status = queue.get(job["id"], 1)
+        assert status["status"] == "failed" and status["error"] == "Thread 9 was deleted", status
+        assert_thread_gone(store, 9)
+
+        try:
+            store.add_references([0], 9, "old.pdf")
+        except ThreadDeletedError:
+            pass
+        else:
+            raise AssertionError("add_references accepted a deleted thread")
+
+        # Still refused after a restart, once the delete is only in the manifest
+        store.save_index()
+        reopened = VectorStore(data_dir=store.data_dir, embedder=HashingEmbedder(32))
+        try:
+            reopened.add_chunks([{"doc_name": "late.pdf", "page_num": 1, "chunk_id": 0, "text": "door"}], 9)
+        except ThreadDeletedError:
+            pass
+        else:
+            raise AssertionError("add_chunks accepted a deleted thread after a restart")
+        assert_thread_gone(reopened, 9)
+
+    run_jobs(test)
+    print("SUCCESS: the vector store refuses writes to a deleted thread.")
+
+
+if __name__ == "__main__":
+    test_deleting_a_thread_fails_its_jobs()
+    test_store_refuses_deleted_thread()
@@ -0,0 +1,93 @@
+import os
+import sys
+import tempfile
+
+from pdfminer.pdfpage import PDFPage
+
+# Runs offline against the backend modules; no server needed
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from services.dedup_registry import DedupRegistry
+from services.ingestion import page_hash, parse_page_range, process_pdf
+
+HELVETICA = b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"
+
+
+def remapped_font(glyphs):
+    """Helvetica with character codes 1, 2, 3 mapped to `glyphs` through /Differences."""
+    return b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding << /Type /Encoding /Differences [1 %s] >> >>" % glyphs
+
+
+def write_pdf(path, pages):
+    """Writes a minimal PDF; `pages` is a list of (content stream, font dict) bytes, the font used as /F1."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None]
+    kids = []
+    for content, font in pages:
+        page_obj = len(objects) + 1
+        kids.append(f"{page_obj} 0 R".encode())
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {page_obj + 1} 0 R "
+            f"/Resources << /Font << /F1 {page_obj + 2} 0 R >> >> >>".encode()
+        )
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content))
+        objects.append(font)
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(kids), len(kids))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def text_page(text):
+    return b"BT /F1 12 Tf 72 720 Td (%s) Tj ET" % text.encode(), HELVETICA
+
+
+def test_page_range_numbers():
+    # Parse workers get a page range each; pages must keep their number in the document
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "pages.pdf")
+        write_pdf(path, [text_page(f"Page {n} door") for n in range(1, 6)])
+
+        chunks = parse_page_range(path, "pages.pdf", 2, 4)
+        assert [c["page_num"] for c in chunks] == [3, 4]
+        assert [c["page_text"].strip() for c in chunks] == ["Page 3 door", "Page 4 door"]
+
+        chunks = list(process_pdf(path, "pages.pdf", page_numbers=[4]))
+        assert [c["page_num"] for c in chunks] == [5]
+        print("SUCCESS: page ranges keep document page numbers.")
+
+
+def test_page_hash_covers_font_encoding():
+    # Same content stream and font name; only the font's /Differences tells the pages apart
+    content = b"BT /F1 12 Tf 72 720 Td <010203> Tj ET"
+    with tempfile.TemporaryDirectory() as tmp:
+        first, second = os.path.join(tmp, "abc.pdf"), os.path.join(tmp, "xyz.pdf")
+        write_pdf(first, [(content, remapped_font(b"/A /B /C"))])
+        write_pdf(second, [(content, remapped_font(b"/X /Y /Z"))])
+
+        hashes = []
+        for path in (first, second):
+            with open(path, "rb") as f:
+                hashes.append(page_hash(next(PDFPage.get_pages(f))))
+        assert hashes[0] != hashes[1]
+
+        # The page text cache must not hand the first document's text to the second
+        registry = DedupRegistry(os.path.join(tmp, "dedup.sqlite"))
+        texts = [[c["page_text"].strip() for c in process_pdf(path, os.path.basename(path), registry=registry)]
+                 for path in (first, second)]
+        assert texts == [["ABC"], ["XYZ"]]
+        print("SUCCESS: pages differing only in font encoding get their own text.")
+
+
+if __name__ == "__main__":
+    test_page_range_numbers()
+    test_page_hash_covers_font_encoding()
@@ -53,9 +53,19 @@ def test_isolation():
         data = {"thread_id": thread_a}
         upload_response = requests.post(f"{BASE_URL}/ingest", headers=headers, files=files, data=data)
     
-    if upload_response.status_code != 200:
+    if upload_response.status_code not in (200, 202):
         print(f"Upload failed: {upload_response.text}")
         return
+    # Ingestion runs in the background; wait for the job to finish
+    job_id = upload_response.json()["job_id"]
+    while True:
+        job = requests.get(f"{BASE_URL}/ingest/jobs/{job_id}", headers=headers).json()
+        if job["status"] in ("completed", "failed"):
+            break
+        time.sleep(1)
+    if job["status"] == "failed":
+        print(f"Ingest job failed: {job['error']}")
+        return
     print("Upload successful.")
 
     # 4. Query Thread A (Should find info)
@@ -0,0 +1,86 @@
+import math
+import os
+import random
+import sys
+from collections import Counter
+
+# Runs offline against the backend modules; no server needed
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from services import keyword_index
+from services.keyword_index import KeywordIndex, tokenize
+
+THREADS = [1, 2, None]
+
+
+def build_runs(rng, n_runs=3, docs_per_run=80):
+    """Indexes over consecutive id ranges, like the runs of the vector store, plus the docs by id."""
+    # A few very common terms and a long tail, so MaxScore has lists worth skipping
+    vocabulary = [f"w{i}" for i in range(60)]
+    weights = [1 / (i + 1) for i in range(len(vocabulary))]
+    runs, docs = [], {}
+    doc_id = 0
+    for _ in range(n_runs):
+        index = KeywordIndex(base=doc_id)
+        for _ in range(docs_per_run):
+            text = " ".join(rng.choices(vocabulary, weights, k=rng.randint(3, 30)))
+            thread_id = rng.choice(THREADS)
+            index.add(doc_id, text, thread_id)
+            docs[doc_id] = (thread_id, Counter(tokenize(text)))
+            doc_id += 1
+        runs.append(index)
+    return runs, docs
+
+
+def exhaustive(docs, excluded, query, thread_ids, k1=1.5, b=0.75):
+    """BM25 of every doc; excluded docs count towards the statistics but are never returned."""
+    searched = {doc_id: tfs for doc_id, (thread_id, tfs) in docs.items() if thread_ids is None or thread_id in thread_ids}
+    n_docs = len(searched)
+    if not n_docs:
+        return Counter()
+    avg_length = sum(sum(tfs.values()) for tfs in searched.values()) / n_docs
+    scores = Counter()
+    for term in set(tokenize(query)):
+        df = sum(1 for tfs in searched.values() if term in tfs)
+        if not df:
+            continue
+        idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+        for doc_id, tfs in searched.items():
+            if term in tfs and doc_id not in excluded:
+                length = sum(tfs.values())
+                scores[doc_id] += idf * tfs[term] * (k1 + 1) / (tfs[term] + k1 * (1 - b + b * length / avg_length))
+    return scores
+
+
+def test_pruned_search_matches_exhaustive_bm25():
+    rng = random.Random(7)
+    for case in range(40):
+        runs, docs = build_runs(rng)
+        # Tombstoned ids per run and partition, as Run.tombstones hands them to search()
+        excluded = set(rng.sample(sorted(docs), 40))
+        indexes = []
+        for index in runs:
+            exclude = {}
+            for thread_id, partition in index.partitions.items():
+                dead = [doc_id for doc_id in partition.docs if doc_id in excluded]
+                if dead:
+                    exclude[thread_id] = dead
+            indexes.append((index, exclude))
+
+        for _ in range(5):
+            query = " ".join(f"w{rng.randint(0, 70)}" for _ in range(rng.randint(1, 6)))
+            thread_ids = rng.choice([None, [1, None], [2], [3]])
+            k = rng.choice([1, 3, 5, 10])
+            expected = exhaustive(docs, excluded, query, thread_ids)
+            found = keyword_index.search(indexes, query, k, thread_ids)
+
+            best = sorted(expected.values(), reverse=True)[:k]
+            assert [round(score, 9) for _, score in found] == [round(score, 9) for score in best], (case, query)
+            for doc_id, score in found:
+                assert doc_id not in excluded
+                assert math.isclose(score, expected[doc_id], rel_tol=1e-9)
+    print("SUCCESS: MaxScore top-k matches exhaustive BM25 across runs with exclusions.")
+
+
+if __name__ == "__main__":
+    test_pruned_search_matches_exhaustive_bm25()
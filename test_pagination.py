@@ -0,0 +1,91 @@
+import base64
+import os
+import random
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, Table, create_engine, select
+
+# Runs offline against the backend modules; no server needed
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from services.pagination import InvalidCursor, decode_cursor, encode_cursor, keyset_page, next_cursor
+
+
+def make_rows(engine):
+    metadata = MetaData()
+    rows = Table("rows", metadata, Column("id", Integer, primary_key=True), Column("created_at", DateTime))
+    metadata.create_all(engine)
+    # Many rows share a timestamp (bulk inserts, coarse clocks); ids are not in time order
+    start = datetime(2026, 1, 1, 12, 0, 0)
+    ids = list(range(1, 41))
+    random.Random(3).shuffle(ids)
+    values = [{"id": row_id, "created_at": start + timedelta(seconds=i // 6)} for i, row_id in enumerate(ids)]
+    with engine.begin() as conn:
+        conn.execute(rows.insert(), values)
+    expected = [v["id"] for v in sorted(values, key=lambda v: (v["created_at"], v["id"]), reverse=True)]
+    return rows, expected
+
+
+def test_pages_with_duplicate_timestamps():
+    engine = create_engine("sqlite://")
+    rows, expected = make_rows(engine)
+    with engine.connect() as conn:
+        for limit in range(1, 9):
+            seen, cursor, pages = [], None, 0
+            while True:
+                query = keyset_page(select(rows.c.id, rows.c.created_at), rows.c.created_at, rows.c.id, cursor, limit)
+                page = list(conn.execute(query).all())
+                cursor = next_cursor(page, limit)
+                assert len(page) <= limit
+                seen.extend(row.id for row in page)
+                pages += 1
+                if cursor is None:
+                    break
+            # Newest first, ties broken by id: every row exactly once
+            assert seen == expected, limit
+            assert pages == max(1, -(-len(expected) // limit))
+    print("SUCCESS: keyset pages cover rows with equal timestamps without gaps or repeats.")
+
+
+def test_invalid_cursor():
+    created_at = datetime(2026, 1, 1, 12, 0, 0, 250000)
+    assert decode_cursor(encode_cursor(created_at, 42)) == (created_at, 42)
+    tampered = [b"2026-01-01T12:00:00", b"yesterday|42", b"2026-01-01T12:00:00|forty-two", b"\xff\xfe|1"]
+    for cursor in ["garbage", "!!!!"] + [base64.urlsafe_b64encode(raw).decode("ascii") for raw in tampered]:
+        try:
+            decode_cursor(cursor)
+        except InvalidCursor:
+            continue
+        raise AssertionError(f"{cursor!r} was accepted")
+    print("SUCCESS: malformed cursors raise InvalidCursor.")
+
+
+def test_invalid_cursor_is_a_400():
+    # The whole app against a throwaway SQLite database; nothing leaves the temp dir
+    cwd, environ = os.getcwd(), dict(os.environ)
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        os.environ["DATABASE_URL"] = f"sqlite:///{tmp}/app.db"
+        os.environ["EMBEDDING_PROVIDER"] = "hashing"
+        try:
+            from fastapi.testclient import TestClient
+            import main
+
+            with TestClient(main.app) as client:
+                token = client.post("/auth/register", json={"email": "pages@example.com", "password": "pw"}).json()["access_token"]
+                headers = {"Authorization": f"Bearer {token}"}
+                assert client.get("/threads", params={"cursor": "garbage"}, headers=headers).status_code == 400
+                assert client.get("/threads", headers=headers).status_code == 200
+        finally:
+            os.chdir(cwd)
+            os.environ.clear()
+            os.environ.update(environ)
+    print("SUCCESS: an invalid cursor is answered with 400.")
+
+
+if __name__ == "__main__":
+    test_pages_with_duplicate_timestamps()
+    test_invalid_cursor()
+    test_invalid_cursor_is_a_400()
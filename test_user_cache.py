@@ -0,0 +1,85 @@
+import os
+import sys
+
+# Runs offline against the backend modules; no server needed
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+import services.user_cache as user_cache_module
+from services.user_cache import Principal, UserCache
+
+
+class Clock:
+    """Stands in for the time module so expiry does not depend on sleeping."""
+
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+def with_clock(test):
+    def run():
+        real_time = user_cache_module.time
+        user_cache_module.time = Clock()
+        try:
+            test(user_cache_module.time)
+        finally:
+            user_cache_module.time = real_time
+    run.__name__ = test.__name__
+    return run
+
+
+ALICE = Principal(id=1, email="alice@example.com")
+
+
+@with_clock
+def test_entry_expires_after_ttl(clock):
+    cache = UserCache(ttl=60)
+    cache.put("token-a", ALICE, token_exp=None, generation=cache.generation(ALICE.email))
+    clock.now += 59
+    assert cache.get("token-a") == ALICE
+    clock.now += 1
+    assert cache.get("token-a") is None
+    assert not cache.entries and not cache.keys_by_email
+
+    # Never trusted past the token's own expiry, even inside the TTL
+    cache.put("token-b", ALICE, token_exp=clock.now + 10, generation=cache.generation(ALICE.email))
+    clock.now += 10
+    assert cache.get("token-b") is None
+    print("SUCCESS: cached principals expire after the TTL and the token's exp.")
+
+
+@with_clock
+def test_entry_is_bound_to_its_token(clock):
+    cache = UserCache(ttl=60)
+    cache.put("token-a", ALICE, token_exp=None, generation=cache.generation(ALICE.email))
+    assert cache.get("token-a") == ALICE
+    assert cache.get("token-b") is None
+    assert cache.get("token-a ") is None
+    # Only hashes are kept
+    assert "token-a" not in cache.entries
+    print("SUCCESS: a cached principal is only served for the token it was stored under.")
+
+
+@with_clock
+def test_invalidate_user(clock):
+    cache = UserCache(ttl=60)
+    bob = Principal(id=2, email="bob@example.com")
+    cache.put("token-a", ALICE, token_exp=None, generation=cache.generation(ALICE.email))
+    cache.put("token-c", bob, token_exp=None, generation=cache.generation(bob.email))
+
+    # A lookup that started before the user changed must not be cached afterwards
+    stale_generation = cache.generation(ALICE.email)
+    cache.invalidate_user(ALICE.email)
+    assert cache.get("token-a") is None
+    assert cache.get("token-c") == bob
+    cache.put("token-d", ALICE, token_exp=None, generation=stale_generation)
+    assert cache.get("token-d") is None
+    print("SUCCESS: invalidating a user drops their cached tokens.")
+
+
+if __name__ == "__main__":
+    test_entry_expires_after_ttl()
+    test_entry_is_bound_to_its_token()
+    test_invalidate_user()
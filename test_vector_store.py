@@ -0,0 +1,97 @@
+import os
+import sys
+import tempfile
+
+# Runs offline against the backend modules; no server or API key needed
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+os.environ["EMBEDDING_PROVIDER"] = "hashing"
+
+# The module builds its singleton under ./data on import; keep that out of the checkout
+_cwd = os.getcwd()
+os.chdir(tempfile.mkdtemp())
+try:
+    import services.vector_store as vector_store_module
+    from services.embedders import HashingEmbedder
+    from services.vector_store import VectorStore
+finally:
+    os.chdir(_cwd)
+
+
+def chunks(word, n=10):
+    """Chunks of document <word>.pdf; `word` appears in no other document."""
+    return [{"doc_name": f"{word}.pdf", "page_num": 1, "chunk_id": i, "text": f"{word} door frame hardware {i}"} for i in range(n)]
+
+
+def open_store(data_dir):
+    return VectorStore(data_dir=data_dir, embedder=HashingEmbedder(32))
+
+
+def finish_maintenance(store):
+    store._maybe_maintain()
+    while store.maintenance_thread and store.maintenance_thread.is_alive():
+        store.maintenance_thread.join()
+        store._maybe_maintain()
+
+
+def live_docs(store):
+    return sorted({store.metadata[i]["doc_name"] for i in range(len(store.metadata)) if not store.metadata.is_deleted(i)})
+
+
+def assert_hidden(store, words):
+    """None of the documents named by `words` comes back from vector or keyword search, in any thread."""
+    for word in words:
+        for thread_id in (1, 2, None):
+            results = store.search(f"{word} door frame hardware 1", k=len(store.metadata), filter_thread_id=thread_id)
+            assert all(item["doc_name"] != f"{word}.pdf" for item in results), (word, thread_id)
+        assert store.keyword_search(word, k=len(store.metadata)) == []
+        assert store.keyword_matching([word]) == []
+
+
+def test_delete_seal_compact_reload():
+    # Seals and merges only when asked, so every step below is deterministic
+    vector_store_module.SEGMENT_MERGE_THRESHOLD = 1000
+    with tempfile.TemporaryDirectory() as data_dir:
+        store = open_store(data_dir)
+        store.add_chunks(chunks("alpha"), 1)
+        store.add_chunks(chunks("bravo"), 1)
+        store.add_chunks(chunks("charlie"), 2)
+        store.add_chunks(chunks("delta"), None)
+        store.save_index()
+        store.add_chunks(chunks("echo"), 1)  # still in the tail
+        assert store.ntotal == 50
+
+        store.delete_document("alpha.pdf", 1)  # tombstoned in a run
+        store.delete_document("echo.pdf", 1)  # tombstoned in the tail
+        store.delete_thread(2)  # partitions dropped
+        assert_hidden(store, ["alpha", "echo", "charlie"])
+        assert [item["doc_name"] for item in store.search("bravo door frame hardware 1", k=1, filter_thread_id=1)] == ["bravo.pdf"]
+        assert store.keyword_search("delta", k=5, thread_ids=[1, None])
+
+        # Sealing writes the tail out; compaction rebuilds the run without its dead rows
+        store.save_index()
+        finish_maintenance(store)
+        runs, _ = store.view
+        assert all(not run.tombstones and not run.dropped for run in runs)
+        assert store.ntotal == 20
+        assert_hidden(store, ["alpha", "echo", "charlie"])
+
+        # Deletes reach the next process through the manifest...
+        store = open_store(data_dir)
+        assert store.ntotal == 20
+        assert live_docs(store) == ["bravo.pdf", "delta.pdf"]
+        assert_hidden(store, ["alpha", "echo", "charlie"])
+
+        # ...and through segment replay when they happened after the last save
+        store.add_chunks(chunks("foxtrot"), 1)
+        store.delete_document("foxtrot.pdf", 1)
+        store.delete_document("bravo.pdf", 1)
+        finish_maintenance(store)
+        store = open_store(data_dir)
+        assert live_docs(store) == ["delta.pdf"]
+        assert_hidden(store, ["alpha", "bravo", "charlie", "echo", "foxtrot"])
+        finish_maintenance(store)
+    print("SUCCESS: deleted chunks stay out of search through seal, compaction and restart.")
+
+
+if __name__ == "__main__":
+    test_delete_seal_compact_reload()